@@ -2,26 +2,37 @@ from django.contrib import admin
 from django import forms
 from django.utils.html import format_html
 from django.urls import reverse, path
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.http import JsonResponse
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 
 from import_export.admin import ImportExportModelAdmin
 from django.contrib.admin import TabularInline
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.contrib.auth.hashers import make_password
 
 from .models import (
     Plant, ProductionLine, Worker, Party, UserProfile,
-    Product, ProductPlant, BOMHeader, BOMItem
+    Product, ProductPlant, BOMHeader, BOMItem, ImportJob
 )
 from .resources import (
     ProductResource, PartyResource, ProductPlantResource,
     PlantResource, ProductionLineResource, WorkerResource,
     UserResource, UserProfileResource
 )
+from .jobs import IMPORT_RESOURCES, job_progress
+from .validation import VALIDATION_SPECS, validate_file
+from .exporting import CONTENT_TYPES, XLSX_MAX_ROWS, streaming_export_response, xlsx_allowed, xlsx_available
+from .services import duplicate_boms
+from .signals import create_user_for_profile
+from .search import component_choices
+from .pagination import DEFAULT_SHOW_ALL_MAX, EstimatedCountPaginator, KeysetChangeList
 
 admin.site.site_header = "RFCLabs Admin"     # shown at top of admin pages
 admin.site.site_title = "RFCLabs Home"  # shown in browser tab title
@@ -34,37 +45,200 @@ User = get_user_model()
 # ---------------------
 class PaginationMixin:
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    # ordering keys for keyset pagination (see pagination.py); None keeps OFFSET pages
+    keyset_ordering = None
+    keyset_show_all_max = DEFAULT_SHOW_ALL_MAX
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+# ---------------------
+# Streaming export (constant memory; see exporting.py)
+# ---------------------
+class StreamingExportMixin:
+    import_export_change_list_template = "admin/masters/change_list_export_stream.html"
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        view = self.admin_site.admin_view(self.export_stream_view)
+        custom = [
+            path('export-stream/', view, name='%s_%s_export_stream' % info),
+            path('export-stream/<str:file_format>/', view, name='%s_%s_export_stream_format' % info),
+        ]
+        return custom + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context["export_stream_xlsx"] = xlsx_available()
+        extra_context["export_xlsx_max_rows"] = XLSX_MAX_ROWS
+        return super().changelist_view(request, extra_context)
+
+    def export_stream_view(self, request, file_format="csv"):
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        if file_format not in CONTENT_TYPES or (file_format == "xlsx" and not xlsx_available()):
+            messages.error(request, f"Export format '{file_format}' is not available.")
+            opts = self.model._meta
+            return redirect("admin:%s_%s_changelist" % (opts.app_label, opts.model_name))
+        resource = self.resource_class(**self.get_export_resource_kwargs(request))
+        # same search / filters as the changelist, without its COUNT query
+        queryset = self.get_export_queryset(request)
+        if file_format == "xlsx" and not xlsx_allowed(queryset):
+            # an XLSX file is only sent once complete; large exports stream as CSV instead
+            messages.warning(
+                request,
+                f"XLSX export is limited to {XLSX_MAX_ROWS:,} rows. Filter the list further or use Stream CSV.",
+            )
+            opts = self.model._meta
+            url = reverse("admin:%s_%s_changelist" % (opts.app_label, opts.model_name))
+            return redirect(f"{url}?{request.GET.urlencode()}" if request.GET else url)
+        return streaming_export_response(resource, queryset, file_format)
+
+
+# ---------------------
+# Fast pre-validation of admin imports (see validation.py)
+# ---------------------
+class ValidatedImportMixin:
+    """
+    Check an uploaded CSV/XLSX import file with the set-based validator in
+    place of the row-by-row dry run. A file it rejects comes back on the
+    import form with the first errors listed; a file it accepts goes straight
+    to the confirm step, without a per-row preview. Other formats, and files
+    the validator cannot read, get the usual dry-run preview.
+    """
+    import_preview_errors = 20
+    validated_formats = ("csv", "xlsx")
+
+    def _validation_key(self):
+        for key, resource_class in IMPORT_RESOURCES.items():
+            if resource_class is self.resource_class and key in VALIDATION_SPECS:
+                return key
+        return None
+
+    def create_import_form(self, request):
+        # import_action() below and the one it falls back to both ask for the form; validate once
+        form = getattr(request, "_validated_import_form", None)
+        if form is None:
+            form = request._validated_import_form = self._validate_import_form(super().create_import_form(request))
+        return form
+
+    def _validate_import_form(self, form):
+        form.validation_report = None
+        key = self._validation_key()
+        if key is None or not form.is_bound or not form.is_valid():
+            return form
+        title = self.get_import_formats()[int(form.cleaned_data["format"])]().get_title()
+        if title not in self.validated_formats:
+            return form
+        import_file = form.cleaned_data["import_file"]
+        import_file.seek(0)
+        try:
+            report = validate_file(
+                key, import_file.file, import_file.name, max_errors=self.import_preview_errors, xlsx=title == "xlsx",
+            )
+        except Exception:
+            # unreadable here; leave it to the import's own reader and its error message
+            return form
+        finally:
+            import_file.seek(0)
+        if report.missing_columns:
+            form.add_error("import_file", f"Missing column(s): {', '.join(report.missing_columns)}.")
+        elif not report.is_valid:
+            form.add_error("import_file", f"{report.error_rows} of {report.total_rows} row(s) have errors; nothing was imported.")
+            for entry in report.errors:
+                form.add_error("import_file", f"Row {entry['row']}: {'; '.join(entry['errors'])}")
+            if report.truncated:
+                form.add_error("import_file", f"... and {report.truncated} more row(s) with errors.")
+        else:
+            form.validation_report = report
+        return form
+
+    def import_action(self, request, **kwargs):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        form = self.create_import_form(request)
+        report = getattr(form, "validation_report", None)
+        if report is None or self.is_skip_import_confirm_enabled():
+            return super().import_action(request, **kwargs)
+
+        # the validator has checked every row: skip the dry run and ask for confirmation
+        input_format = self.get_import_formats()[int(form.cleaned_data["format"])]()
+        if not input_format.is_binary():
+            input_format.encoding = self.from_encoding
+        import_file = form.cleaned_data["import_file"]
+        import_file.tmp_storage_name = self.write_to_tmp_storage(import_file, input_format).name
+        messages.info(request, f"{report.total_rows} row(s) passed validation. Confirm the import to write them.")
+
+        context = self.get_import_context_data()
+        context.update(self.admin_site.each_context(request))
+        context.update({
+            "title": "Import",
+            "form": form,
+            "opts": self.model._meta,
+            "media": self.media + form.media,
+            "confirm_form": self.create_confirm_form(request, import_form=form),
+        })
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, [self.import_template_name], context)
+
+    def get_import_data_kwargs(self, **kwargs):
+        kwargs = super().get_import_data_kwargs(**kwargs)
+        # without a preview, a row failing at confirm must not leave a partial import behind
+        kwargs.setdefault("rollback_on_validation_errors", True)
+        return kwargs
+
+    def process_result(self, result, request):
+        if not (result.has_errors() or result.has_validation_errors()):
+            return super().process_result(result, request)
+        # the file passed validation but the import failed; it was rolled back
+        problems = [f"Row {number}: {error.error}" for number, errors in result.row_errors() for error in errors]
+        problems += [f"Row {row.number}: {'; '.join(row.error.messages)}" for row in result.invalid_rows]
+        problems = [str(error.error) for error in result.base_errors] + problems
+        more = len(problems) - self.import_preview_errors
+        messages.error(
+            request,
+            "Nothing was imported. " + " ".join(problems[:self.import_preview_errors])
+            + (f" ... and {more} more error(s)." if more > 0 else ""),
+        )
+        opts = self.model._meta
+        return redirect(reverse("admin:%s_%s_import" % (opts.app_label, opts.model_name)))
 
 
 # Plant admin (import/export)
 @admin.register(Plant)
-class PlantAdmin(PaginationMixin, ImportExportModelAdmin):
+class PlantAdmin(PaginationMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = PlantResource
     list_display = ("code", "name", "active")
+    keyset_ordering = ("code",)
     search_fields = ("code", "name")
     list_filter = ("active",)
 
 
 @admin.register(ProductionLine)
-class ProductionLineAdmin(PaginationMixin, ImportExportModelAdmin):
+class ProductionLineAdmin(PaginationMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = ProductionLineResource
     list_display = ("code", "name", "plant", "active")
+    keyset_ordering = ("plant_id", "code")  # the (plant, code) unique index
     list_filter = ("plant", "active")
     search_fields = ("code", "name")
 
 
 @admin.register(Worker)
-class WorkerAdmin(PaginationMixin, ImportExportModelAdmin):
+class WorkerAdmin(PaginationMixin, StreamingExportMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = WorkerResource
     list_display = ("code", "name", "plant", "production_line", "active")
+    keyset_ordering = ("plant_id", "code")  # the (plant, code) unique index
     list_filter = ("plant", "production_line", "active")
     search_fields = ("code", "name")
 
 
 @admin.register(Party)
-class PartyAdmin(PaginationMixin, ImportExportModelAdmin):
+class PartyAdmin(PaginationMixin, StreamingExportMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = PartyResource
     list_display = ("party_code", "name", "roles_display", "active")
+    keyset_ordering = ("party_code",)
     search_fields = ("party_code", "name", "tax_id")
     list_filter = ("is_vendor", "is_customer", "active")
 
@@ -115,10 +289,11 @@ class UserProfileForm(forms.ModelForm):
                 self.fields["is_active"].initial = u.is_active
 
 @admin.register(UserProfile)
-class UserProfileAdmin(PaginationMixin, ImportExportModelAdmin):
+class UserProfileAdmin(PaginationMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = UserProfileResource
     form = UserProfileForm
     list_display = ("username_display", "full_name", "plant_admin_display", "active_display", "plant")
+    keyset_ordering = ("user_id",)  # the unique user index
     search_fields = ("user__username", "user__first_name", "user__last_name", "plant__code")
     list_filter = ("is_plant_admin", "user__is_active", "plant")
     ordering = ("user__username",)
@@ -163,7 +338,8 @@ class UserProfileAdmin(PaginationMixin, ImportExportModelAdmin):
         setattr(obj, "_is_active", bool(cd.get("is_active")))
         pwd = cd.get("password")
         if pwd:
-            setattr(obj, "_password_plain", pwd)
+            # hashed once here; the profile sync copies the hash to the user
+            setattr(obj, "_password_hash", make_password(pwd))
 
         setattr(obj, "_update_origin", "profile_admin")
         setattr(obj, "_updated_at", timezone.now())
@@ -173,43 +349,47 @@ class UserProfileAdmin(PaginationMixin, ImportExportModelAdmin):
             raise ValidationError("Username is required to create UserProfile.")
 
         with transaction.atomic():
-            user = User.objects.filter(username__iexact=username).first()
-            if not user:
-                user = User(username=username)
-            user.email = cd.get("email") or ""
-            user.first_name = cd.get("first_name") or ""
-            user.last_name = cd.get("last_name") or ""
-            user.is_staff = bool(cd.get("is_staff"))
-            user.is_superuser = bool(cd.get("is_superuser"))
-            user.is_active = bool(cd.get("is_active", True))
-            if pwd:
-                user.set_password(pwd)
-            elif not user.pk:
-                user.set_unusable_password()
-            user.save()
-
+            # an existing user is updated after commit by the profile sync (signals.userprofile_post_save)
+            user = User.objects.filter(username__iexact=username).first() or create_user_for_profile(obj, username)
             obj.user = user
             super().save_model(request, obj, form, change)
 
 @admin.register(Product)
-class ProductAdmin(PaginationMixin, ImportExportModelAdmin):
+class ProductAdmin(PaginationMixin, StreamingExportMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = ProductResource
     list_display = ("code", "name", "product_group", "uom", "active", "standard_cost")
+    keyset_ordering = ("code",)
     search_fields = ("code", "name", "product_group")
     list_filter = ("active", "product_group")
     ordering = ("code",)
 
 
 @admin.register(ProductPlant)
-class ProductPlantAdmin(PaginationMixin, ImportExportModelAdmin):
+class ProductPlantAdmin(PaginationMixin, StreamingExportMixin, ValidatedImportMixin, ImportExportModelAdmin):
     resource_class = ProductPlantResource
     list_display = ("product", "plant", "code", "standard_cost", "active")
+    keyset_ordering = ("product_id", "plant_id")  # the (product, plant) unique index
     search_fields = ("product__code", "product__name", "plant__code", "code")
     list_filter = ("plant", "active")
     autocomplete_fields = ("product", "plant")
 
 
 # BOM admin
+class ComponentAutocompleteSelect(AutocompleteSelect):
+    """
+    BOMItem.component picker backed by BOMHeaderAdmin.component_autocomplete_view.
+    component_autocomplete.js sends the BOM's currently selected product_plant
+    with every request, so the choices follow that field on the add page too.
+    """
+
+    def get_url(self):
+        return reverse("%s:masters_bomheader_component_autocomplete" % self.admin_site.name)
+
+    @property
+    def media(self):
+        return super().media + forms.Media(js=["js/component_autocomplete.js"])
+
+
 class BOMItemInline(TabularInline):
     model = BOMItem
     extra = 1
@@ -217,6 +397,12 @@ class BOMItemInline(TabularInline):
     readonly_fields = ("uom_display",)
     autocomplete_fields = ("component",)
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "component":
+            kwargs["widget"] = ComponentAutocompleteSelect(db_field, self.admin_site, using=kwargs.get("using"))
+            kwargs["queryset"] = ProductPlant.objects.select_related("product", "plant")
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     def uom_display(self, obj):
         return obj.component.product.uom if obj and obj.component else ""
     uom_display.short_description = "UOM"
@@ -224,7 +410,8 @@ class BOMItemInline(TabularInline):
 
 @admin.register(BOMHeader)
 class BOMHeaderAdmin(admin.ModelAdmin):
-    list_display = ("product_plant", "version", "is_active", "effective_from", "effective_to", "created_by", "created_at", "duplicate_action")
+    list_display = ("product_plant", "version", "is_active", "effective_from", "effective_to", "cached_cost", "created_by", "created_at", "duplicate_action")
+    list_select_related = ("product_plant__product", "product_plant__plant", "created_by", "cost_snapshot")
     search_fields = ("product_plant__product__code", "product_plant__product__name", "product_plant__plant__code")
     list_filter = ("product_plant__plant", "is_active")
     inlines = (BOMItemInline,)
@@ -246,61 +433,128 @@ class BOMHeaderAdmin(admin.ModelAdmin):
 
     def get_urls(self):
         urls = super().get_urls()
+        info = self.model._meta.app_label, self.model._meta.model_name
         custom = [
             path('<int:pk>/duplicate/', self.admin_site.admin_view(self.duplicate_view), name='garment_app_bomheader_duplicate'),
+            path('component-autocomplete/', self.admin_site.admin_view(self.component_autocomplete_view), name='%s_%s_component_autocomplete' % info),
         ]
         return custom + urls
 
+    def component_autocomplete_view(self, request):
+        """Select2 results for BOMItemInline.component; see search.component_choices()."""
+        if not (self.has_add_permission(request) or self.has_change_permission(request)):
+            raise PermissionDenied
+        # components must come from the plant of the BOM's product_plant; none until one is selected
+        try:
+            product_plant_id = int(request.GET.get("product_plant") or 0)
+        except ValueError:
+            product_plant_id = 0
+        plant_id = ProductPlant.objects.filter(pk=product_plant_id).values_list("plant_id", flat=True).first()
+        choices = component_choices(plant_id, request.GET.get("term", "")) if plant_id else []
+        return JsonResponse({
+            "results": [{"id": str(pk), "text": label} for pk, label in choices],
+            "pagination": {"more": False},
+        })
+
     def duplicate_view(self, request, pk):
         original = BOMHeader.objects.get(pk=pk)
-        if not request.user.has_perm('garment_app.add_bomheader'):
+        if not self.has_add_permission(request):
             messages.error(request, "Permission denied.")
             return redirect('..')
 
-        with transaction.atomic():
-            new = BOMHeader.objects.create(
-                product_plant=original.product_plant,
-                is_active=False,
-                effective_from=original.effective_from,
-                effective_to=original.effective_to,
-                scrap_percent=original.scrap_percent,
-                overhead_cost=original.overhead_cost,
-                notes=f"Duplicated from v{original.version}: {original.notes or ''}",
-                created_by=request.user,
-            )
-            for it in original.items.all():
-                new.items.create(component=it.component, quantity=it.quantity)
+        summary = duplicate_boms([original], user=request.user)
+        new = BOMHeader.objects.get(pk=summary.mapping[original.pk])
         messages.success(request, f"Duplicated BOM created: {new}")
         return redirect(f"../{new.pk}/change/")
 
+    def cached_cost(self, obj):
+        # precomputed by costing.refresh_costs(); no per-row costing queries
+        snap = getattr(obj, "cost_snapshot", None)
+        if snap is None:
+            return "—"
+        return f"{snap.cost:.4f}" + (" (stale)" if snap.is_dirty else "")
+    cached_cost.short_description = "Cost"
+    cached_cost.admin_order_field = "cost_snapshot__cost"
+
     def duplicate_action(self, obj):
         url = reverse('admin:garment_app_bomheader_duplicate', args=[obj.pk])
         return format_html('<a class="button" href="{}">Duplicate</a>', url)
     duplicate_action.short_description = "Duplicate"
 
     def action_duplicate_selected_boms(self, request, queryset):
-        created = 0
-        for bom in queryset:
-            if not request.user.has_perm('garment_app.add_bomheader'):
-                continue
-            with transaction.atomic():
-                new = BOMHeader.objects.create(
-                    product_plant=bom.product_plant,
-                    is_active=False,
-                    effective_from=bom.effective_from,
-                    effective_to=bom.effective_to,
-                    scrap_percent=bom.scrap_percent,
-                    overhead_cost=bom.overhead_cost,
-                    notes=f"Duplicated from v{bom.version}: {bom.notes or ''}",
-                    created_by=request.user,
-                )
-                for it in bom.items.all():
-                    new.items.create(component=it.component, quantity=it.quantity)
-                created += 1
-        self.message_user(request, f"Created {created} duplicate BOM(s) (inactive).", level=messages.INFO)
+        if not self.has_add_permission(request):
+            self.message_user(request, "Permission denied.", level=messages.ERROR)
+            return
+        summary = duplicate_boms(queryset, user=request.user)
+        self.message_user(request, f"Created {summary.created} duplicate BOM(s) (inactive) with {summary.items} item(s).", level=messages.INFO)
     action_duplicate_selected_boms.short_description = "Duplicate selected BOM(s) as new version (inactive)"
 
 
+# Background import jobs (processed by `manage.py run_import_jobs`)
+class ImportJobForm(forms.ModelForm):
+    resource = forms.ChoiceField(choices=[(key, cls._meta.model._meta.verbose_name) for key, cls in IMPORT_RESOURCES.items()])
+
+    class Meta:
+        model = ImportJob
+        fields = ("resource", "mode", "file", "chunk_size")
+
+    def clean_file(self):
+        f = self.cleaned_data["file"]
+        if f and not f.name.lower().endswith((".csv", ".xlsx", ".xlsm")):
+            raise ValidationError("Upload a .csv or .xlsx file.")
+        return f
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(PaginationMixin, admin.ModelAdmin):
+    form = ImportJobForm
+    list_display = ("id", "resource", "mode", "status", "progress_display", "new_rows", "updated_rows", "error_rows", "created_by", "created_at")
+    keyset_ordering = ("-created_at",)
+    list_filter = ("status", "mode", "resource")
+    list_select_related = ("created_by",)
+    readonly_fields = (
+        "status", "progress_display", "total_rows", "last_committed_row", "new_rows", "updated_rows",
+        "skipped_rows", "error_rows", "errors", "message", "worker", "created_by", "created_at",
+        "started_at", "heartbeat_at", "finished_at",
+    )
+    change_form_template = "admin/masters/importjob/change_form.html"
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return ()
+        # the file and its resource are fixed once a job is queued
+        return ("resource", "mode", "file", "chunk_size") + self.readonly_fields
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return ("resource", "mode", "file", "chunk_size")
+        return self.get_readonly_fields(request, obj)
+
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        info = self.model._meta.app_label, self.model._meta.model_name
+        custom = [
+            path('<int:pk>/progress/', self.admin_site.admin_view(self.progress_view), name='%s_%s_progress' % info),
+        ]
+        return custom + urls
+
+    def progress_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return JsonResponse(job_progress(get_object_or_404(ImportJob, pk=pk)))
+
+    def progress_display(self, obj):
+        if obj.total_rows is None:
+            return "—"
+        return f"{obj.last_committed_row}/{obj.total_rows} ({obj.percent}%)"
+    progress_display.short_description = "Progress"
+
+
 # Safe User admin override
 try:
     admin.site.unregister(User)
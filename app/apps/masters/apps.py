@@ -4,3 +4,6 @@ class MastersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.masters'         # the actual Python package name
     verbose_name = 'Masters'    # 👈 this text will appear in the admin sidebar
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registers receivers)
@@ -0,0 +1,118 @@
+# apps/masters/changelog.py
+"""
+Commit-ordered change feed behind the delta export (delta.py).
+
+Every write to a tracked master row also writes a DeltaChange entry in the
+same transaction. The post_save / post_delete receivers cover per-row saves.
+The bulk import paths (BulkImportMixin.bulk_create / bulk_update) and
+services.provision_product_plants call record_changes() themselves, because
+bulk writes send no signals. Each object keeps one entry, its latest change:
+the entry is upserted (unique on model + object_id), so the feed holds one
+entry per row plus one per deleted row, even when two transactions write the
+same row at once.
+
+Why not updated_at: it is stamped when a row is saved, not when its
+transaction commits. An import chunk that commits late has rows older than
+ones a consumer has already read, and a timestamp cursor skips them for
+good. Feed positions here are (txid, id):
+
+- PostgreSQL: txid is the writer's transaction id. A reader serves only
+  entries with txid below the xmin of its snapshot, i.e. from transactions
+  that have all finished. A transaction still running at read time has
+  txid >= xmin, so its entries land after any cursor handed out so far.
+- SQLite: writers are serialized, so txid is a per-model counter
+  (MAX(txid) + 1) read while this transaction holds the write lock, which
+  puts later commits after earlier ones.
+
+Other databases use the counter too, without a commit-order guarantee.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import connections, router
+from django.db.models import Max
+
+from .models import DeltaChange, Party, Plant, Product, ProductPlant
+
+# key -> (model, natural key as (name, attribute path)) recorded for deleted rows
+TRACKED_MODELS: Dict[str, Tuple[type, Tuple[Tuple[str, str], ...]]] = {
+    "plant": (Plant, (("code", "code"),)),
+    "party": (Party, (("party_code", "party_code"),)),
+    "product": (Product, (("code", "code"),)),
+    "productplant": (ProductPlant, (("product_code", "product.code"), ("plant_code", "plant.code"))),
+}
+
+RECORD_BATCH_SIZE = 1000
+
+
+def model_key(model) -> Optional[str]:
+    for key, (tracked, _natural_key) in TRACKED_MODELS.items():
+        if issubclass(model, tracked):
+            return key
+    return None
+
+
+def current_txid(key: str, using: str) -> int:
+    """Feed position for entries written now by the current transaction (see the module docstring)."""
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT txid_current()")
+            return cursor.fetchone()[0]
+    # an upserted entry keeps its id, so the counter is what moves it past existing cursors
+    last = DeltaChange.objects.using(using).filter(model=key).aggregate(m=Max("txid"))["m"]
+    return (last or 0) + 1
+
+
+def visible_horizon(using: str) -> Optional[int]:
+    """Entries with txid below this come from finished transactions (None: no limit needed)."""
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+
+def _upsert(entries, using: str):
+    DeltaChange.objects.using(using).bulk_create(
+        entries, update_conflicts=True, unique_fields=["model", "object_id"],
+        update_fields=["deleted", "object_key", "txid", "changed_at"],
+    )
+
+
+def record_changes(model, pks: Iterable[int], using: Optional[str] = None) -> None:
+    """Record that rows `pks` of `model` were created or updated in the current transaction."""
+    key = model_key(model)
+    pks = sorted({pk for pk in pks if pk is not None})
+    if key is None or not pks:
+        return
+    using = using or router.db_for_write(DeltaChange)
+    txid = current_txid(key, using)
+    for i in range(0, len(pks), RECORD_BATCH_SIZE):
+        chunk = pks[i:i + RECORD_BATCH_SIZE]
+        _upsert([DeltaChange(model=key, object_id=pk, txid=txid) for pk in chunk], using)
+
+
+def _natural_key(instance, paths) -> dict:
+    values = {}
+    for name, path in paths:
+        value = instance
+        for attr in path.split("."):
+            value = getattr(value, attr, None) if value is not None else None
+        values[name] = "" if value is None else str(value)
+    return values
+
+
+def record_delete(instance, using: Optional[str] = None) -> None:
+    """Record the deletion of a tracked instance, keeping its natural key for consumers."""
+    key = model_key(type(instance))
+    if key is None:
+        return
+    using = using or router.db_for_write(DeltaChange)
+    entry = DeltaChange(
+        model=key, object_id=instance.pk, deleted=True, txid=current_txid(key, using),
+        object_key=_natural_key(instance, TRACKED_MODELS[key][1]),
+    )
+    _upsert([entry], using)
@@ -0,0 +1,172 @@
+# apps/masters/closure.py
+"""
+Maintained where-used index over the active BOM structure.
+
+BOMClosure holds one row per (ancestor, descendant, depth) reachable through
+active BOMHeader/BOMItem rows, so "which products use X at any depth" is a
+single indexed query instead of one query per level.
+
+Signals call schedule_rebuild() for the product plants whose BOM changed; after
+commit only those plants and their ancestors are recomputed. The
+rebuild_bom_closure command rebuilds everything.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from .models import BOMClosure, BOMHeader, BOMItem, ProductGroup, lock_product_plants
+from .utils import defer_on_commit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _load_edges(parent_ids: Iterable[int]) -> Dict[int, List[Tuple[int, Decimal]]]:
+    """{parent product_plant_id: [(component_id, quantity)]} for the parents' active BOMs."""
+    edges: Dict[int, List[Tuple[int, Decimal]]] = defaultdict(list)
+    rows = (
+        BOMItem.objects.filter(bom__is_active=True, bom__product_plant_id__in=list(parent_ids))
+        .order_by()
+        .values_list("bom__product_plant_id", "component_id", "quantity")
+    )
+    for parent_id, component_id, qty in rows:
+        edges[parent_id].append((component_id, Decimal(qty)))
+    return edges
+
+
+def _back_edges(edges: Dict[int, List[Tuple[int, Decimal]]], roots: Iterable[int]) -> Set[Tuple[int, int]]:
+    """
+    BOM lines (parent, component) that close a cycle in a depth-first walk
+    from `roots` (in pk order). Without them the structure is acyclic.
+    """
+    state: Dict[int, bool] = {}  # node -> True while on the current path, False once done
+    back: Set[Tuple[int, int]] = set()
+    for root in sorted(roots):
+        if root in state:
+            continue
+        state[root] = True
+        stack = [(root, iter(edges[root]))]
+        while stack:
+            node, children = stack[-1]
+            for component_id, _qty in children:
+                if state.get(component_id) is True:
+                    back.add((node, component_id))
+                elif component_id not in state:
+                    state[component_id] = True
+                    stack.append((component_id, iter(edges[component_id])))
+                    break
+            else:
+                state[node] = False
+                stack.pop()
+    return back
+
+
+def compute_closure(roots: Iterable[int]) -> Tuple[Dict[Tuple[int, int, int], Decimal], List[Tuple[int, int]]]:
+    """
+    Return ({(ancestor, descendant, depth): cumulative quantity}, cycle_edges)
+    for the given root product plants. Edges are loaded one query per level
+    for all roots at once. A BOM line that closes a cycle is left out and
+    reported in cycle_edges as (parent, component); the rest of the structure
+    below the root is kept.
+    """
+    roots = set(roots)
+    edges: Dict[int, List[Tuple[int, Decimal]]] = {}
+    pending = set(roots)
+    while pending:
+        loaded = _load_edges(pending)
+        for node in pending:
+            edges[node] = loaded.get(node, [])
+        pending = {component_id for node in pending for component_id, _qty in edges[node]} - edges.keys()
+    cycle_edges = _back_edges(edges, roots)
+
+    result: Dict[Tuple[int, int, int], Decimal] = {}
+    # (root, node) -> quantity of node per unit of root, at the current depth
+    frontier: Dict[Tuple[int, int], Decimal] = {(root, root): Decimal("1") for root in roots}
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier: Dict[Tuple[int, int], Decimal] = defaultdict(Decimal)
+        for (root, node), qty in frontier.items():
+            for component_id, line_qty in edges[node]:
+                if (node, component_id) not in cycle_edges:
+                    next_frontier[(root, component_id)] += qty * line_qty
+        frontier = next_frontier
+        for (root, node), qty in frontier.items():
+            result[(root, node, depth)] = qty
+    return result, sorted(cycle_edges)
+
+
+def ancestors_of(product_plant_ids: Iterable[int]) -> Set[int]:
+    return set(
+        BOMClosure.objects.filter(descendant_id__in=list(product_plant_ids))
+        .values_list("ancestor_id", flat=True)
+        .distinct()
+    )
+
+
+@dataclass
+class ClosureRebuild:
+    written: int = 0
+    # BOM lines (parent product plant, component) left out of the closure because they close a cycle
+    cycle_edges: List[Tuple[int, int]] = field(default_factory=list)
+
+
+def rebuild_closure(product_plant_ids: Optional[Iterable[int]] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> ClosureRebuild:
+    """
+    Recompute closure rows for the given product plants and everything above
+    them, or the whole table when `product_plant_ids` is None.
+
+    The roots are row-locked first (models.lock_product_plants), so two
+    rebuilds sharing an ancestor run one after the other instead of both
+    inserting its rows.
+    """
+    with transaction.atomic():
+        if product_plant_ids is None:
+            roots = set(BOMHeader.objects.filter(is_active=True).values_list("product_plant_id", flat=True))
+            lock_product_plants(roots)
+            BOMClosure.objects.all().delete()
+        else:
+            roots = set(product_plant_ids)
+            roots |= ancestors_of(roots)
+            lock_product_plants(roots)
+            BOMClosure.objects.filter(ancestor_id__in=roots).delete()
+        closure, cycle_edges = compute_closure(roots)
+        rows = [BOMClosure(ancestor_id=a, descendant_id=d, depth=depth, quantity=qty) for (a, d, depth), qty in closure.items()]
+        BOMClosure.objects.bulk_create(rows, batch_size=batch_size)
+    return ClosureRebuild(written=len(rows), cycle_edges=cycle_edges)
+
+
+def schedule_rebuild(boms: Iterable[int] = (), product_plants: Iterable[int] = ()):
+    """Queue an incremental rebuild for changed BOMs / product plants; runs after commit."""
+    keys = [("bom", pk) for pk in boms] + [("pp", pk) for pk in product_plants]
+    if keys:
+        defer_on_commit("bom_closure", keys, _rebuild_for_keys)
+
+
+def _rebuild_for_keys(keys):
+    pp_ids = {pk for kind, pk in keys if kind == "pp"}
+    bom_ids = {pk for kind, pk in keys if kind == "bom"}
+    if bom_ids:
+        pp_ids |= set(BOMHeader.objects.filter(pk__in=bom_ids).values_list("product_plant_id", flat=True))
+    rebuilt = rebuild_closure(pp_ids)
+    if rebuilt.cycle_edges:
+        # runs after commit, so there is no caller left to tell
+        logger.warning("BOM cycle(s) left out of the BOM closure, as (parent, component) product plants: %s", rebuilt.cycle_edges)
+
+
+def where_used(product_plant_id: int, finished_goods_only: bool = False):
+    """
+    Closure rows for every product plant that uses `product_plant_id` at any
+    depth (one indexed query). Use finished_goods_only for "which FGs use X".
+    """
+    qs = BOMClosure.objects.filter(descendant_id=product_plant_id).select_related("ancestor__product", "ancestor__plant")
+    if finished_goods_only:
+        qs = qs.filter(ancestor__product__product_group=ProductGroup.FINISHED_GOOD)
+    return qs.order_by("depth", "ancestor__product__code")
@@ -0,0 +1,282 @@
+# apps/masters/costing.py
+"""
+Bulk BOM costing.
+
+compute_total_cost() on a single BOMHeader walks its items one query at a time;
+the helpers here cost many BOMs with one aggregate query per batch.
+
+BOMExplosion/rollup_costs() go further and expand sub-assemblies (components
+with their own active BOM) level by level, one query per level.
+
+Rolled-up costs are persisted in BOMCostSnapshot. Model signals call
+schedule_invalidation(); after commit the affected BOMs are found with a
+where-used lookup on the BOMClosure index, marked dirty and recomputed in one batch.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .models import BOMClosure, BOMCostSnapshot, BOMHeader, BOMItem, effective_standard_cost
+from .services import RESOLUTION_ORDER
+from .utils import defer_on_commit
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _chunked(ids, size):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def compute_costs(bom_ids: Iterable[int], batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[int, Decimal]:
+    """
+    Return {bom_id: total_cost} for the given BOMs.
+    Values match BOMHeader.compute_total_cost(); unknown ids are omitted.
+    """
+    costs: Dict[int, Decimal] = {}
+    for chunk in _chunked(dict.fromkeys(bom_ids), batch_size):
+        rows = (
+            BOMHeader.objects.filter(pk__in=chunk)
+            .order_by()
+            .with_total_cost()
+            .values_list("pk", "total_cost")
+        )
+        costs.update(rows)
+    return costs
+
+
+class BOMCycleError(ValidationError):
+    """Raised when a BOM (indirectly) consumes its own product."""
+
+
+def bom_subquery(product_plant_ref: str, as_of: Optional[datetime.date] = None):
+    """
+    Subquery for the BOM of the product plant at `product_plant_ref`: the
+    active BOM, or the one valid on `as_of` (see services.resolve_boms).
+    """
+    if as_of is None:
+        qs = BOMHeader.objects.filter(is_active=True).order_by("-version")
+    else:
+        qs = BOMHeader.objects.effective_on(as_of).order_by(*RESOLUTION_ORDER)
+    return Subquery(qs.filter(product_plant=OuterRef(product_plant_ref)).values("pk")[:1])
+
+
+class BOMExplosion:
+    """
+    Multi-level BOM graph for a set of root BOMs.
+
+    The graph is loaded breadth-first: each level (all BOMs discovered so far
+    that are not loaded yet) is fetched with a single query that also resolves
+    every component's own active BOM, so a tree of depth D costs D queries
+    regardless of its width. Sub-assembly costs are memoized for the lifetime
+    of the instance, so shared sub-assemblies are costed once.
+
+    With `as_of`, sub-assemblies are expanded through the BOM valid on that
+    date instead of the currently active one.
+    """
+
+    def __init__(self, bom_ids: Iterable[int], as_of: Optional[datetime.date] = None):
+        self.as_of = as_of
+        # bom_id -> [(component_id, quantity, flat_cost, sub_bom_id or None)]
+        self.items: Dict[int, List[Tuple[int, Decimal, Decimal, Optional[int]]]] = {}
+        self.overhead: Dict[int, Decimal] = {}
+        self.product_plant: Dict[int, int] = {}
+        self._costs: Dict[int, Decimal] = {}
+        self._fingerprints: Dict[int, str] = {}
+        self.load(bom_ids)
+
+    def load(self, bom_ids: Iterable[int]):
+        frontier = {pk for pk in bom_ids if pk not in self.overhead}
+        while frontier:
+            rows = (
+                BOMHeader.objects.filter(pk__in=frontier)
+                .order_by()
+                .values_list("pk", "product_plant_id", "overhead_cost", "items__component_id", "items__quantity")
+                .annotate(
+                    flat_cost=effective_standard_cost("items__component__"),
+                    sub_bom=bom_subquery("items__component_id", self.as_of),
+                )
+            )
+            for bom_id, pp_id, overhead, component_id, qty, flat_cost, sub_bom in rows:
+                self.overhead[bom_id] = Decimal(overhead or Decimal("0.0"))
+                self.product_plant[bom_id] = pp_id
+                lines = self.items.setdefault(bom_id, [])
+                if component_id is not None:
+                    lines.append((component_id, Decimal(qty or 0), Decimal(flat_cost or Decimal("0.0")), sub_bom))
+            frontier = {
+                line[3] for bom_id in frontier for line in self.items.get(bom_id, ()) if line[3] is not None
+            } - self.overhead.keys()
+
+    def _order(self, root: int) -> List[int]:
+        """
+        Post-order (children first) of the sub-assemblies reachable from root.
+        Raises BOMCycleError when a BOM is reached again through its own subtree.
+        """
+        order: List[int] = []
+        on_path = set()
+        done = set(self._costs)
+        stack = [(root, False)]
+        while stack:
+            bom_id, expanded = stack.pop()
+            if expanded:
+                on_path.discard(bom_id)
+                done.add(bom_id)
+                order.append(bom_id)
+                continue
+            if bom_id in done:
+                continue
+            on_path.add(bom_id)
+            stack.append((bom_id, True))
+            for component_id, qty, flat_cost, sub in self.items.get(bom_id, ()):
+                if sub is None or sub in done:
+                    continue
+                if sub in on_path:
+                    raise BOMCycleError(
+                        _("BOM cycle detected: BOM %(bom)s consumes itself through its components."),
+                        params={"bom": sub},
+                    )
+                stack.append((sub, False))
+        return order
+
+    def cost(self, bom_id: int) -> Decimal:
+        """
+        Rolled-up cost of one BOM. Components with their own active BOM are
+        costed through it; everything else uses its effective standard cost.
+        """
+        if bom_id not in self.overhead:
+            self.load([bom_id])
+        for pk in self._order(bom_id):
+            total = Decimal("0.0")
+            digest = hashlib.sha256(str(self.overhead.get(pk, Decimal("0.0")).normalize()).encode())
+            for component_id, qty, flat_cost, sub in self.items.get(pk, ()):
+                total += qty * (self._costs[sub] if sub is not None else flat_cost)
+                source = self._fingerprints[sub] if sub is not None else flat_cost.normalize()
+                digest.update(f"|{component_id}:{qty.normalize()}:{source}".encode())
+            self._costs[pk] = total + self.overhead.get(pk, Decimal("0.0"))
+            self._fingerprints[pk] = digest.hexdigest()
+        return self._costs[bom_id]
+
+    def fingerprint(self, bom_id: int) -> str:
+        """Stable hash of every input that cost(bom_id) depends on."""
+        self.cost(bom_id)
+        return self._fingerprints[bom_id]
+
+    def explode(self, bom_id: int, quantity: Decimal = Decimal("1")) -> Iterator[Tuple[int, int, Decimal, bool]]:
+        """
+        Yield (level, component_id, extended_quantity, is_leaf) for every line
+        of the multi-level structure. Level 1 is the BOM's own items.
+        """
+        self._order(bom_id)  # validates the structure is acyclic
+        stack = [(bom_id, 1, Decimal(quantity))]
+        while stack:
+            pk, level, qty = stack.pop()
+            for component_id, line_qty, flat_cost, sub in self.items.get(pk, ()):
+                extended = qty * line_qty
+                yield level, component_id, extended, sub is None
+                if sub is not None:
+                    stack.append((sub, level + 1, extended))
+
+
+def rollup_costs(bom_ids: Iterable[int], as_of: Optional[datetime.date] = None) -> Dict[int, Decimal]:
+    """
+    Return {bom_id: rolled-up cost} with sub-assemblies expanded through their
+    active BOMs (or the ones valid on `as_of`). Unknown ids are omitted.
+    """
+    bom_ids = list(dict.fromkeys(bom_ids))
+    explosion = BOMExplosion(bom_ids, as_of=as_of)
+    return {pk: explosion.cost(pk) for pk in bom_ids if pk in explosion.overhead}
+
+
+def where_used_boms(product_plant_ids: Iterable[int]) -> set:
+    """
+    Ids of every BOM whose rolled-up cost depends on the given ProductPlants:
+    BOMs that consume them, or consume any sub-assembly that (through the
+    BOMClosure index) contains them. One query.
+    """
+    pp_ids = list(product_plant_ids)
+    ancestors = BOMClosure.objects.filter(descendant_id__in=pp_ids).values("ancestor_id")
+    return set(
+        BOMItem.objects.filter(Q(component_id__in=pp_ids) | Q(component_id__in=ancestors))
+        .order_by()
+        .values_list("bom_id", flat=True)
+        .distinct()
+    )
+
+
+def schedule_invalidation(boms: Iterable[int] = (), product_plants: Iterable[int] = ()):
+    """
+    Queue cost invalidation for changed BOMs / ProductPlants; the where-used
+    lookup and recompute run once, after the surrounding transaction commits.
+    """
+    keys = [("bom", pk) for pk in boms] + [("pp", pk) for pk in product_plants]
+    if keys:
+        defer_on_commit("bom_costs", keys, _invalidate_and_refresh)
+
+
+def _invalidate_and_refresh(keys):
+    bom_ids = {pk for kind, pk in keys if kind == "bom"}
+    pp_ids = {pk for kind, pk in keys if kind == "pp"}
+    # a changed BOM also changes every BOM that uses its product as a sub-assembly
+    pp_ids |= set(
+        BOMHeader.objects.filter(pk__in=bom_ids, is_active=True).values_list("product_plant_id", flat=True)
+    )
+    bom_ids |= where_used_boms(pp_ids)
+    mark_dirty(bom_ids)
+    refresh_costs(bom_ids)
+
+
+def mark_dirty(bom_ids: Iterable[int]) -> int:
+    return BOMCostSnapshot.objects.filter(bom_id__in=list(bom_ids), is_dirty=False).update(is_dirty=True)
+
+
+def refresh_costs(bom_ids: Optional[Iterable[int]] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Recompute snapshots for `bom_ids`, or for every dirty / missing snapshot
+    when omitted. Unchanged costs (same fingerprint) are not rewritten.
+    Returns the number of snapshots written.
+    """
+    if bom_ids is None:
+        bom_ids = set(BOMCostSnapshot.objects.filter(is_dirty=True).values_list("bom_id", flat=True))
+        bom_ids |= set(BOMHeader.objects.filter(cost_snapshot__isnull=True).values_list("pk", flat=True))
+    written = 0
+    explosion = None
+    for chunk in _chunked(sorted(bom_ids), batch_size):
+        if explosion is None:
+            explosion = BOMExplosion(chunk)
+        else:
+            explosion.load(chunk)
+        chunk = [pk for pk in chunk if pk in explosion.overhead]
+        existing = BOMCostSnapshot.objects.in_bulk(chunk)
+        now = timezone.now()
+        to_create, to_update, clean = [], [], []
+        for pk in chunk:
+            try:
+                cost, fingerprint = explosion.cost(pk), explosion.fingerprint(pk)
+            except BOMCycleError:
+                continue  # leave dirty; the BOM cannot be costed until the cycle is fixed
+            snap = existing.get(pk)
+            if snap is None:
+                to_create.append(BOMCostSnapshot(bom_id=pk, cost=cost, computed_at=now, fingerprint=fingerprint, is_dirty=False))
+            elif snap.fingerprint == fingerprint and snap.cost == cost:
+                if snap.is_dirty:
+                    clean.append(pk)
+            else:
+                snap.cost, snap.computed_at, snap.fingerprint, snap.is_dirty = cost, now, fingerprint, False
+                to_update.append(snap)
+        with transaction.atomic():
+            BOMCostSnapshot.objects.bulk_create(to_create, ignore_conflicts=True)
+            BOMCostSnapshot.objects.bulk_update(to_update, ["cost", "computed_at", "fingerprint", "is_dirty"])
+            if clean:
+                BOMCostSnapshot.objects.filter(bom_id__in=clean).update(is_dirty=False)
+        written += len(to_create) + len(to_update)
+    return written
@@ -0,0 +1,141 @@
+# apps/masters/delta.py
+"""
+Incremental (delta) export of master data.
+
+Consumers pass back the opaque cursor of their previous page and receive
+the rows changed since then, plus the deletes. Deletes come with the row's
+natural key. An empty cursor starts a full sync from the beginning of the
+feed.
+
+The feed is the DeltaChange table (see changelog.py). It is written in the
+same transaction as the change and read in commit-safe (txid, id) order, so
+a slow transaction, such as a 1000-row import chunk, can never commit
+changes behind a cursor that was already handed out.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import force_str
+
+from .changelog import TRACKED_MODELS, visible_horizon
+from .exporting import export_related
+from .models import DeltaChange
+from .resources import PartyResource, PlantResource, ProductPlantResource, ProductResource
+
+# key (see changelog.TRACKED_MODELS) -> (model, resource used for the row payload)
+DELTA_MODELS = {
+    "plant": (TRACKED_MODELS["plant"][0], PlantResource),
+    "party": (TRACKED_MODELS["party"][0], PartyResource),
+    "product": (TRACKED_MODELS["product"][0], ProductResource),
+    "productplant": (TRACKED_MODELS["productplant"][0], ProductPlantResource),
+}
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# (txid, id) of the last feed entry delivered
+Position = Optional[Tuple[int, int]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class DeltaPage:
+    changes: List[dict] = field(default_factory=list)
+    deletes: List[dict] = field(default_factory=list)
+    cursor: str = ""
+    has_more: bool = False
+
+    def as_dict(self) -> dict:
+        return {"changes": self.changes, "deletes": self.deletes, "cursor": self.cursor, "has_more": self.has_more}
+
+
+def encode_cursor(key: str, position: Position) -> str:
+    payload = {"m": key, "p": None if position is None else list(position)}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(key: str, cursor: Optional[str]) -> Position:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload.get("m") != key:
+            raise InvalidCursor(f"Cursor belongs to '{payload.get('m')}', not '{key}'.")
+        if "p" not in payload:
+            raise InvalidCursor("Cursor from the old timestamp-based feed; start a full sync.")
+        position = payload["p"]
+        return None if position is None else (int(position[0]), int(position[1]))
+    except InvalidCursor:
+        raise
+    except (binascii.Error, ValueError, TypeError, IndexError, AttributeError, KeyError) as exc:
+        raise InvalidCursor("Malformed cursor.") from exc
+
+
+def _after(position: Position) -> Q:
+    if position is None:
+        return Q()
+    txid, pk = position
+    return Q(txid__gt=txid) | Q(txid=txid, id__gt=pk)
+
+
+def delta(key: str, cursor: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> DeltaPage:
+    """
+    Up to `limit` feed entries (changed or deleted rows) after `cursor`.
+    Keep calling with the returned cursor while has_more is true.
+    """
+    if key not in DELTA_MODELS:
+        raise KeyError(key)
+    model, resource_class = DELTA_MODELS[key]
+    limit = max(1, min(limit, MAX_LIMIT))
+    position = decode_cursor(key, cursor)
+
+    entries = DeltaChange.objects.filter(model=key).filter(_after(position))
+    horizon = visible_horizon(entries.db)
+    if horizon is not None:
+        entries = entries.filter(txid__lt=horizon)
+    entries = list(entries.order_by("txid", "id")[:limit + 1])
+    page = DeltaPage(has_more=len(entries) > limit)
+    entries = entries[:limit]
+
+    resource = resource_class()
+    headers = [force_str(h) for h in resource.get_export_headers()]
+    queryset = model.objects.filter(pk__in=[e.object_id for e in entries if not e.deleted])
+    related = export_related(resource, model)
+    if related:
+        queryset = queryset.select_related(*related)
+    rows = {obj.pk: obj for obj in queryset}
+
+    for entry in entries:
+        if entry.deleted:
+            page.deletes.append({"id": entry.object_id, **entry.object_key, "deleted_at": entry.changed_at.isoformat()})
+            continue
+        obj = rows.get(entry.object_id)
+        if obj is None:
+            continue  # deleted since; its delete entry follows in the feed
+        page.changes.append({
+            "id": obj.pk,
+            "updated_at": obj.updated_at.isoformat(),
+            "data": dict(zip(headers, resource.export_resource(obj))),
+        })
+    if entries:
+        position = (entries[-1].txid, entries[-1].pk)
+    page.cursor = encode_cursor(key, position)
+    return page
+
+
+def purge_tombstones(older_than: datetime.timedelta) -> int:
+    """Delete feed entries of rows deleted more than `older_than` ago; consumers must sync more often than that."""
+    deleted, _counts = DeltaChange.objects.filter(deleted=True, changed_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -0,0 +1,143 @@
+# apps/masters/exporting.py
+"""
+Streaming export of master data.
+
+ImportExportModelAdmin builds the whole tablib Dataset before responding;
+the helpers here walk the queryset with .iterator() and write each row as
+it is produced, so memory stays flat regardless of table size. Columns and
+values come from the resource (get_export_headers / export_resource), so
+the output matches the regular export.
+
+CSV streams from the first row. XLSX cannot: the zip container is only
+written once the last row is in, so nothing reaches the client until the
+whole workbook is built. XLSX is therefore offered only up to
+XLSX_MAX_ROWS rows; larger exports go to CSV.
+"""
+from __future__ import annotations
+
+import csv
+import tempfile
+from typing import Iterable, Iterator, List
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.encoding import force_str
+
+EXPORT_CHUNK_SIZE = getattr(settings, "MASTERS_EXPORT_CHUNK_SIZE", 2000)
+# XLSX files are assembled on disk once they outgrow this many bytes in memory
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024
+XLSX_READ_SIZE = 64 * 1024
+XLSX_MAX_ROWS = getattr(settings, "MASTERS_EXPORT_XLSX_MAX_ROWS", 50000)
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def export_related(resource, model) -> List[str]:
+    """
+    select_related() paths for the FK attributes of the resource's export
+    fields (e.g. "product" for product_code), so rows need no extra queries.
+    """
+    paths = []
+    for field in resource.get_export_fields():
+        parts = (field.attribute or "").split("__")
+        current, path = model, []
+        for part in parts:
+            try:
+                f = current._meta.get_field(part)
+            except FieldDoesNotExist:
+                break
+            if not (f.many_to_one or f.one_to_one) or f.related_model is None:
+                break
+            path.append(part)
+            current = f.related_model
+        if path:
+            paths.append("__".join(path))
+    return sorted(set(paths))
+
+
+def export_rows(resource, queryset, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List]:
+    """Yield the header row, then one list of exported values per instance."""
+    yield [force_str(h) for h in resource.get_export_headers()]
+    related = export_related(resource, queryset.model)
+    if related:
+        queryset = queryset.select_related(*related)
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield resource.export_resource(obj)
+
+
+class _Echo:
+    """File-like object whose write() returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: Iterable[List]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield "\ufeff"  # BOM, so Excel picks UTF-8
+    for row in rows:
+        yield writer.writerow(["" if v is None else v for v in row])
+
+
+def iter_xlsx(rows: Iterable[List], title: str = "Export") -> Iterator[bytes]:
+    """
+    Write rows with an openpyxl write-only workbook (rows go straight to a
+    temporary worksheet file) and stream the finished file in chunks. The
+    first byte goes out only after the last row is written; callers keep
+    `rows` under XLSX_MAX_ROWS (see xlsx_allowed).
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError as exc:
+        raise ImproperlyConfigured("XLSX export requires openpyxl.") from exc
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    for row in rows:
+        sheet.append(["" if v is None else v for v in row])
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE) as out:
+        workbook.save(out)
+        out.seek(0)
+        while True:
+            data = out.read(XLSX_READ_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def xlsx_allowed(queryset, max_rows: int = XLSX_MAX_ROWS) -> bool:
+    """True if the queryset has at most `max_rows` rows (counts no further than that)."""
+    return queryset.order_by()[:max_rows + 1].count() <= max_rows
+
+
+def streaming_export_response(resource, queryset, file_format: str = "csv", chunk_size: int = EXPORT_CHUNK_SIZE):
+    """StreamingHttpResponse with the queryset exported through `resource`."""
+    if file_format not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    model = queryset.model
+    rows = export_rows(resource, queryset, chunk_size=chunk_size)
+    if file_format == "xlsx":
+        if not xlsx_available():
+            raise ImproperlyConfigured("XLSX export requires openpyxl.")
+        content = iter_xlsx(rows, title=force_str(model._meta.verbose_name_plural))
+    else:
+        content = iter_csv(rows)
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    filename = f"{model.__name__}-{timezone.now():%Y-%m-%d}.{file_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    # keep proxies (Caddy) from buffering the whole body
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,237 @@
+# apps/masters/jobs.py
+"""
+Background master-data imports.
+
+The admin stores the uploaded file in an ImportJob row; `manage.py
+run_import_jobs` claims pending jobs (SELECT ... FOR UPDATE SKIP LOCKED, so
+several workers can run side by side) and feeds the file to the resource in
+chunks streamed from disk (readers.py). Each chunk is imported and recorded
+on the job in one transaction, so `last_committed_row` always matches what
+is in the database and a job whose worker died is picked up again from
+there once its heartbeat is stale.
+
+A worker that stalls past STALE_AFTER (GC pause, slow chunk) may find its
+job claimed by another. Every chunk therefore commits only if the job row
+still names this worker and the chunk's start row. Otherwise the chunk is
+rolled back and the worker drops the job (JobLost), so two workers never
+import the same rows.
+
+A chunk with row errors or validation errors is rolled back as a whole and
+the job stops as failed, mirroring the admin import, which imports nothing
+when the preview has errors. Queue a validate-only job first to get the full
+error report without touching the data.
+"""
+from __future__ import annotations
+
+import datetime
+import os
+import socket
+from typing import Optional
+
+import tablib
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ImportJob, ImportJobMode, ImportJobStatus
+from .readers import batches, count_rows, open_rows
+from .validation import validate_file
+from .resources import (
+    PartyResource, PlantResource, ProductionLineResource, ProductPlantResource,
+    ProductResource, UserProfileResource, UserResource, WorkerResource,
+)
+
+# resource key (stored on ImportJob.resource) -> resource class
+IMPORT_RESOURCES = {
+    "plant": PlantResource,
+    "productionline": ProductionLineResource,
+    "worker": WorkerResource,
+    "party": PartyResource,
+    "product": ProductResource,
+    "productplant": ProductPlantResource,
+    "user": UserResource,
+    "userprofile": UserProfileResource,
+}
+
+# a RUNNING job whose heartbeat is older than this is considered abandoned
+STALE_AFTER = datetime.timedelta(seconds=getattr(settings, "MASTERS_IMPORT_JOB_STALE_SECONDS", 300))
+# errors kept on the job row; the counters stay exact
+MAX_JOB_ERRORS = 100
+
+
+class JobLost(Exception):
+    """The job was claimed by another worker while this one was running it."""
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+def claim_job() -> Optional[ImportJob]:
+    """
+    Lock and return the oldest pending job (or a running one whose worker
+    stopped sending heartbeats), marked RUNNING for this process.
+    """
+    stale = timezone.now() - STALE_AFTER
+    with transaction.atomic():
+        job = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=ImportJobStatus.PENDING) | Q(status=ImportJobStatus.RUNNING, heartbeat_at__lt=stale))
+            .order_by("created_at", "pk")
+            .first()
+        )
+        if job is None:
+            return None
+        now = timezone.now()
+        job.status = ImportJobStatus.RUNNING
+        job.started_at = job.started_at or now
+        job.heartbeat_at = now
+        job.worker = worker_name()
+        job.save(update_fields=["status", "started_at", "heartbeat_at", "worker"])
+    return job
+
+
+def _chunk_errors(result, offset):
+    """(error count, [{"row", "errors"}]) for one chunk; row numbers are 1-based data rows of the file."""
+    errors = [{"row": None, "errors": [str(e.error) for e in result.base_errors]}] if result.base_errors else []
+    for number, row_errors in result.row_errors():
+        errors.append({"row": offset + number, "errors": [str(e.error) for e in row_errors]})
+    for invalid in result.invalid_rows:
+        errors.append({
+            "row": offset + invalid.number,
+            "errors": [f"{field}: {msg}" for field, msgs in invalid.error_dict.items() for msg in msgs],
+        })
+    return len(result.row_errors()) + len(result.invalid_rows) + len(result.base_errors), errors
+
+
+def import_chunk(job: ImportJob, resource, dataset: tablib.Dataset, offset: int) -> bool:
+    """
+    Import one chunk (data rows starting after `offset`) and record it on the
+    job in the same transaction. Returns False when the chunk had errors; it
+    is rolled back then and the job is marked failed.
+    """
+    # only the current owner, resuming where the job stands, may commit
+    owned = ImportJob.objects.filter(
+        pk=job.pk, worker=worker_name(), status=ImportJobStatus.RUNNING, last_committed_row=offset,
+    )
+    with transaction.atomic():
+        result = resource.import_data(
+            dataset, dry_run=False, raise_errors=False,
+            use_transactions=True, rollback_on_validation_errors=True,
+        )
+        failed, errors = _chunk_errors(result, offset)
+        now = timezone.now()
+        if failed:
+            claimed = owned.update(
+                status=ImportJobStatus.FAILED, error_rows=F("error_rows") + failed,
+                errors=(job.errors + errors)[:MAX_JOB_ERRORS],
+                message=f"Rows {offset + 1}-{offset + len(dataset)} were not imported because of errors.",
+                heartbeat_at=now, finished_at=now,
+            )
+            if not claimed:
+                raise JobLost(job.pk)
+            return False
+        totals = result.totals
+        claimed = owned.update(
+            last_committed_row=offset + len(dataset),
+            new_rows=F("new_rows") + totals.get("new", 0),
+            updated_rows=F("updated_rows") + totals.get("update", 0),
+            skipped_rows=F("skipped_rows") + totals.get("skip", 0),
+            heartbeat_at=now,
+        )
+        if not claimed:
+            raise JobLost(job.pk)  # rolls the chunk back
+    return True
+
+
+def run_job(job: ImportJob, stdout=None) -> ImportJob:
+    """
+    Process a claimed job from its last committed row to the end of the file.
+    The file is streamed (see readers.py), one chunk_size batch at a time.
+    """
+    resource_class = IMPORT_RESOURCES.get(job.resource)
+    try:
+        if resource_class is None:
+            raise ValueError(f"Unknown import resource '{job.resource}'.")
+        if job.mode == ImportJobMode.VALIDATE:
+            return validate_job(job)
+        if job.total_rows is None:
+            with job.file.open("rb") as fh:
+                job.total_rows = count_rows(fh, job.file.name)
+            ImportJob.objects.filter(pk=job.pk).update(total_rows=job.total_rows)
+    except Exception as exc:
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJobStatus.FAILED, message=str(exc), finished_at=timezone.now(),
+        )
+        job.refresh_from_db()
+        return job
+
+    resource = resource_class()
+    try:
+        with open_rows(job.file) as (headers, rows):
+            completed = True
+            if headers is not None:
+                for offset, chunk in batches(headers, rows, job.chunk_size, start=job.last_committed_row):
+                    if not import_chunk(job, resource, chunk, offset):
+                        completed = False
+                        break
+                    if stdout is not None:
+                        stdout.write(f"  job #{job.pk}: {offset + len(chunk)}/{job.total_rows} rows")
+        if completed:
+            ImportJob.objects.filter(pk=job.pk, worker=worker_name()).update(
+                status=ImportJobStatus.DONE, finished_at=timezone.now(), message="",
+            )
+    except JobLost:
+        if stdout is not None:
+            stdout.write(f"  job #{job.pk}: claimed by another worker, chunk rolled back")
+    except Exception as exc:
+        # the failing chunk was rolled back; earlier chunks stay committed
+        ImportJob.objects.filter(pk=job.pk, worker=worker_name()).update(
+            status=ImportJobStatus.FAILED, message=f"{type(exc).__name__}: {exc}", finished_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
+
+
+def validate_job(job: ImportJob) -> ImportJob:
+    """Run the set-based checks (validation.py) over the job's file; nothing is written."""
+    with job.file.open("rb") as fh:
+        report = validate_file(job.resource, fh, job.file.name, max_errors=MAX_JOB_ERRORS)
+    if report.missing_columns:
+        message = f"Missing column(s): {', '.join(report.missing_columns)}."
+    elif report.error_rows:
+        message = f"{report.error_rows} of {report.total_rows} row(s) have errors."
+        if report.truncated:
+            message += f" The first {len(report.errors)} are listed."
+    else:
+        message = f"All {report.total_rows} row(s) are valid."
+    now = timezone.now()
+    ImportJob.objects.filter(pk=job.pk).update(
+        status=ImportJobStatus.DONE if report.is_valid else ImportJobStatus.FAILED,
+        total_rows=report.total_rows, last_committed_row=report.total_rows,
+        error_rows=report.error_rows, errors=report.errors, message=message,
+        heartbeat_at=now, finished_at=now,
+    )
+    job.refresh_from_db()
+    return job
+
+
+def job_progress(job: ImportJob) -> dict:
+    """Payload of the admin progress endpoint."""
+    return {
+        "id": job.pk,
+        "mode": job.mode,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "total_rows": job.total_rows,
+        "last_committed_row": job.last_committed_row,
+        "percent": job.percent,
+        "new": job.new_rows,
+        "updated": job.updated_rows,
+        "skipped": job.skipped_rows,
+        "errors": job.error_rows,
+        "error_details": job.errors[:20],
+        "message": job.message,
+        "finished": job.status in (ImportJobStatus.DONE, ImportJobStatus.FAILED),
+    }
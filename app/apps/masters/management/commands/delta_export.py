@@ -0,0 +1,39 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.masters import delta
+
+
+class Command(BaseCommand):
+    help = "Print master rows changed/deleted since a cursor as JSON (an empty cursor starts a full sync)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(delta.DELTA_MODELS))
+        parser.add_argument("--cursor", default="", help="Cursor returned by the previous run.")
+        parser.add_argument("--limit", type=int, default=delta.DEFAULT_LIMIT, help="Rows per page.")
+        parser.add_argument("--all", action="store_true", help="Follow has_more and print every page (one JSON object per line).")
+        parser.add_argument("--output", help="Write to this file instead of stdout.")
+        parser.add_argument("--purge-tombstones", type=int, metavar="DAYS", help="First purge the delete entries (tombstones) older than DAYS.")
+
+    def handle(self, *args, **options):
+        if options["purge_tombstones"] is not None:
+            purged = delta.purge_tombstones(datetime.timedelta(days=options["purge_tombstones"]))
+            self.stderr.write(f"Purged {purged} tombstone(s).")
+
+        out = open(options["output"], "w", encoding="utf-8") if options["output"] else self.stdout
+        cursor = options["cursor"]
+        try:
+            while True:
+                try:
+                    page = delta.delta(options["model"], cursor, limit=options["limit"])
+                except delta.InvalidCursor as exc:
+                    raise CommandError(str(exc))
+                out.write(json.dumps(page.as_dict()) + "\n")
+                cursor = page.cursor
+                if not (options["all"] and page.has_more):
+                    break
+        finally:
+            if out is not self.stdout:
+                out.close()
@@ -0,0 +1,67 @@
+import csv
+import sys
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Upper
+from django.utils.dateparse import parse_date
+
+from apps.masters.models import Plant, ProductPlant
+from apps.masters.mrp import BOMMatrix
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute gross material requirements for a production plan CSV "
+        "(columns: plant_code, product_code, quantity)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("plan", help="Path to the plan CSV.")
+        parser.add_argument("--output", "-o", help="Write requirements CSV here instead of stdout.")
+        parser.add_argument("--all-levels", action="store_true", help="Include intermediate (WIP) requirements.")
+        parser.add_argument("--as-of", type=parse_date, help="Use the BOMs valid on this date (YYYY-MM-DD) instead of the active ones.")
+
+    def handle(self, *args, **options):
+        plan_by_code = defaultdict(Decimal)
+        with open(options["plan"], newline="", encoding="utf-8-sig") as fh:
+            reader = csv.DictReader(fh)
+            missing = {"plant_code", "product_code", "quantity"} - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f"Plan CSV is missing column(s): {', '.join(sorted(missing))}")
+            for line_no, row in enumerate(reader, 2):
+                key = (row["plant_code"].strip().upper(), row["product_code"].strip().upper())
+                try:
+                    plan_by_code[key] += Decimal(row["quantity"].strip())
+                except InvalidOperation:
+                    raise CommandError(f"Line {line_no}: invalid quantity {row['quantity']!r}")
+
+        plant_codes = {plant for plant, _ in plan_by_code}
+        plant_ids = list(Plant.objects.annotate(code_upper=Upper("code")).filter(code_upper__in=plant_codes).values_list("pk", flat=True))
+        pp_rows = ProductPlant.objects.filter(plant_id__in=plant_ids).values_list(
+            "pk", "plant__code", "product__code", "product__name", "product__uom"
+        )
+        by_code, info = {}, {}
+        for pk, plant_code, product_code, name, uom in pp_rows.iterator():
+            by_code[(plant_code.upper(), product_code.upper())] = pk
+            info[pk] = (plant_code, product_code, name, uom)
+
+        plan = {}
+        for key, qty in plan_by_code.items():
+            if key not in by_code:
+                raise CommandError(f"No ProductPlant for plant '{key[0]}' / product '{key[1]}'.")
+            plan[by_code[key]] = qty
+
+        requirements = BOMMatrix(plant_ids, as_of=options["as_of"]).explode(plan, leaves_only=not options["all_levels"])
+
+        out = open(options["output"], "w", newline="", encoding="utf-8") if options["output"] else sys.stdout
+        try:
+            writer = csv.writer(out)
+            writer.writerow(["plant_code", "product_code", "product_name", "uom", "quantity"])
+            for pk, qty in sorted(requirements.items(), key=lambda kv: info[kv[0]][:2]):
+                writer.writerow([*info[pk], qty])
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(f"{len(plan)} plan line(s) -> {len(requirements)} requirement line(s)."))
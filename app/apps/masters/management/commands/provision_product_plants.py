@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.masters.models import Plant, ProductGroup
+from apps.masters.services import provision_product_plants
+
+
+class Command(BaseCommand):
+    help = "Create missing ProductPlant rows for a plant, inheriting code/name/active from Product."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--plant", required=True, help="Plant code.")
+        parser.add_argument("--group", default="", help="Comma-separated product groups to provision, e.g. RM,WIP (default: all).")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            plant = Plant.objects.get(code__iexact=options["plant"])
+        except Plant.DoesNotExist:
+            raise CommandError(f"Plant not found for code '{options['plant']}'")
+
+        groups = [g.strip().upper() for g in options["group"].split(",") if g.strip()]
+        unknown = set(groups) - set(ProductGroup.values)
+        if unknown:
+            raise CommandError(f"Unknown product group(s): {', '.join(sorted(unknown))}")
+
+        def report(summary):
+            self.stdout.write(f"  {summary.scanned} scanned, {summary.created} created ({summary.rate:,.0f} rows/s)")
+
+        summary = provision_product_plants(plant, groups or None, batch_size=options["batch_size"], progress=report)
+        self.stdout.write(self.style.SUCCESS(
+            f"Provisioned {summary.created} ProductPlant row(s) for {plant.code} in {summary.elapsed:.1f}s."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.masters import closure
+
+
+class Command(BaseCommand):
+    help = "Rebuild the BOM where-used closure table from active BOMs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=closure.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        rebuilt = closure.rebuild_closure(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rebuilt.written} BOM closure row(s)."))
+        if rebuilt.cycle_edges:
+            lines = ", ".join(f"{parent} -> {component}" for parent, component in rebuilt.cycle_edges)
+            raise CommandError(f"BOM cycle(s) found; these BOM lines (product plant ids) were left out of the closure: {lines}")
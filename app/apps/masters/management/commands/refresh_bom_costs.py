@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.masters import costing
+from apps.masters.models import BOMCostSnapshot
+
+
+class Command(BaseCommand):
+    help = "Recompute BOM cost snapshots (dirty/missing ones by default, or all with --all)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Mark every snapshot dirty and recompute all BOMs.")
+        parser.add_argument("--batch-size", type=int, default=costing.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            BOMCostSnapshot.objects.update(is_dirty=True)
+        written = costing.refresh_costs(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} changed BOM cost snapshot(s)."))
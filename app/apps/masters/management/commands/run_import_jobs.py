@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.masters import jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued master-data ImportJobs (a local worker; run one or more alongside the web server)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty instead of polling.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls when idle.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                job = jobs.claim_job()
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+                    continue
+                self.stdout.write(f"Running {job} from row {job.last_committed_row + 1}")
+                job = jobs.run_job(job, stdout=self.stdout)
+                style = self.style.SUCCESS if job.status == "done" else self.style.ERROR
+                self.stdout.write(style(
+                    f"{job}: {job.new_rows} new, {job.updated_rows} updated, {job.skipped_rows} skipped, "
+                    f"{job.error_rows} error(s). {job.message}".rstrip()
+                ))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped; an interrupted job resumes from its last committed row.")
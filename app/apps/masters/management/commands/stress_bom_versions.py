@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.masters.models import BOMHeader, ProductPlant
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency check for BOM version allocation: several threads create BOMs "
+        "for the same product plant, then versions are checked for duplicates/gaps. "
+        "Run against a non-production database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_plant", type=int, help="ProductPlant id (FG or WIP) to create BOMs for.")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--per-thread", type=int, default=20)
+        parser.add_argument("--bulk", action="store_true", help="Use bulk_create_versions() (5 BOMs per call) instead of save().")
+        parser.add_argument("--keep", action="store_true", help="Keep the created BOMs instead of deleting them.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            raise CommandError("SQLite does not allow concurrent writers; run this against PostgreSQL.")
+        try:
+            pp = ProductPlant.objects.get(pk=options["product_plant"])
+        except ProductPlant.DoesNotExist:
+            raise CommandError("ProductPlant not found.")
+
+        start_version = BOMHeader.objects.filter(product_plant=pp).order_by("-version").values_list("version", flat=True).first() or 0
+        errors = []
+        barrier = threading.Barrier(options["threads"])
+
+        def worker(n):
+            try:
+                barrier.wait()
+                if options["bulk"]:
+                    for _ in range(0, options["per_thread"], 5):
+                        BOMHeader.objects.bulk_create_versions(
+                            BOMHeader(product_plant=pp, notes=f"stress t{n}") for _ in range(5)
+                        )
+                else:
+                    for _ in range(options["per_thread"]):
+                        BOMHeader(product_plant=pp, notes=f"stress t{n}").save()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options["threads"])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        created = BOMHeader.objects.filter(product_plant=pp, version__gt=start_version)
+        versions = sorted(created.values_list("version", flat=True))
+        expected = list(range(start_version + 1, start_version + 1 + len(versions)))
+        active = BOMHeader.objects.filter(product_plant=pp, is_active=True).count()
+        self.stdout.write(f"{len(versions)} BOM(s) created in {elapsed:.2f}s, {len(errors)} error(s), {active} active.")
+        for exc in errors[:5]:
+            self.stdout.write(f"  {type(exc).__name__}: {exc}")
+
+        ok = not errors and versions == expected and len(set(versions)) == len(versions) and active == 1
+        if not options["keep"]:
+            created.delete()
+        if not ok:
+            raise CommandError("Version allocation check FAILED (duplicates, gaps, errors or active count != 1).")
+        self.stdout.write(self.style.SUCCESS("Version allocation check passed."))
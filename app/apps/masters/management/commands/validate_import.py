@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.masters.validation import DEFAULT_MAX_ERRORS, VALIDATION_SPECS, validate_file
+
+
+class Command(BaseCommand):
+    help = "Check a master-data import file (CSV/XLSX) without importing it: columns, keys, FK codes and values."
+
+    def add_arguments(self, parser):
+        parser.add_argument("resource", choices=sorted(VALIDATION_SPECS), help="Import resource key.")
+        parser.add_argument("file", help="Path to the .csv or .xlsx file.")
+        parser.add_argument("--max-errors", type=int, default=DEFAULT_MAX_ERRORS, help="Rows with errors to list.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["file"], "rb") as fh:
+                report = validate_file(options["resource"], fh, options["file"], max_errors=options["max_errors"])
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        if report.missing_columns:
+            raise CommandError(f"Missing column(s): {', '.join(report.missing_columns)}")
+        for entry in report.errors:
+            self.stdout.write(f"Row {entry['row']}: {'; '.join(entry['errors'])}")
+        if report.error_rows:
+            raise CommandError(f"{report.error_rows} of {report.total_rows} row(s) have errors.")
+        self.stdout.write(self.style.SUCCESS(f"All {report.total_rows} row(s) are valid."))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:41
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BOMCostSnapshot',
+            fields=[
+                ('bom', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cost_snapshot', serialize=False, to='masters.bomheader')),
+                ('cost', models.DecimalField(decimal_places=8, default=Decimal('0.0'), max_digits=24)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('fingerprint', models.CharField(blank=True, default='', help_text='Hash of the inputs the cost was computed from', max_length=64)),
+                ('is_dirty', models.BooleanField(db_index=True, default=True)),
+            ],
+            options={
+                'verbose_name': 'BOM Cost Snapshot',
+                'verbose_name_plural': 'BOM Cost Snapshots',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0002_bomcostsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BOMClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('quantity', models.DecimalField(decimal_places=16, max_digits=32)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_descendants', to='masters.productplant')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_ancestors', to='masters.productplant')),
+            ],
+            options={
+                'verbose_name': 'BOM Closure',
+                'verbose_name_plural': 'BOM Closure',
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='masters_bomclosure_desc_idx')],
+                'unique_together': {('ancestor', 'descendant', 'depth')},
+            },
+        ),
+    ]
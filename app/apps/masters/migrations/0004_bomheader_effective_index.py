@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0003_bomclosure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bomheader',
+            index=models.Index(fields=['product_plant', 'effective_from', 'effective_to', 'version'], name='masters_bom_effective_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:58
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 2000
+FEED_MODELS = ("plant", "party", "product", "productplant")
+
+
+def backfill(apps, schema_editor):
+    """Seed the feed with one entry per existing row, so an empty cursor still means a full sync."""
+    alias = schema_editor.connection.alias
+    DeltaChange = apps.get_model("masters", "DeltaChange")
+    for key in FEED_MODELS:
+        model = apps.get_model("masters", key)
+        ids = model.objects.using(alias).order_by("pk").values_list("pk", flat=True)
+        batch = []
+        for pk in ids.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+            batch.append(DeltaChange(model=key, object_id=pk))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                DeltaChange.objects.using(alias).bulk_create(batch)
+                batch = []
+        DeltaChange.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0006_importjob_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeltaChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Key in changelog.TRACKED_MODELS', max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('object_key', models.JSONField(blank=True, default=dict)),
+                ('txid', models.BigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Delta change',
+                'verbose_name_plural': 'Delta changes',
+                'indexes': [models.Index(fields=['model', 'txid', 'id'], name='masters_deltachange_feed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('model', 'object_id'), name='masters_deltachange_obj_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:59
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0007_delta_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='party',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('party_code'), name='masters_party_code_ci_uniq', violation_error_message='Duplicate party code not allowed.'),
+        ),
+        migrations.AddConstraint(
+            model_name='plant',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('code'), name='masters_plant_code_ci_uniq', violation_error_message='A plant with this code already exists (codes are case-insensitive).'),
+        ),
+        migrations.AddConstraint(
+            model_name='productionline',
+            constraint=models.UniqueConstraint(models.F('plant'), django.db.models.functions.text.Upper('code'), name='masters_productionline_code_ci_uniq', violation_error_message='This plant already has a production line with this code (codes are case-insensitive).'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Trigram indexes for the live search endpoint (apps/masters/search.py).
+#
+# PostgreSQL: pg_trgm GIN indexes on UPPER(column), which serve the
+# UPPER(col::text) LIKE UPPER(...) that istartswith/icontains compile to.
+# SQLite: external-content FTS5 tables with the trigram tokenizer, kept in
+# sync by triggers. Other databases get no index; search still works there.
+
+from django.db import migrations
+
+# table -> indexed columns
+SEARCH_COLUMNS = {
+    "masters_plant": ("code", "name"),
+    "masters_product": ("code", "name"),
+    "masters_productplant": ("code",),
+    "masters_party": ("party_code", "name", "tax_id"),
+    "masters_worker": ("code", "name"),
+}
+
+
+def _postgres_forwards(schema_editor):
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" ON "{table}" '
+                f'USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+            )
+
+
+def _postgres_backwards(schema_editor):
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            schema_editor.execute(f'DROP INDEX IF EXISTS "{table}_{column}_trgm"')
+
+
+def _sqlite_forwards(schema_editor):
+    for table, columns in SEARCH_COLUMNS.items():
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{c}" for c in columns)
+        old = ", ".join(f"old.{c}" for c in columns)
+        _sqlite_drop(schema_editor, table)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+        )
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _sqlite_drop(schema_editor, table):
+    fts = f"{table}_fts"
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def _sqlite_has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == "ENABLE_FTS5" for row in cursor.fetchall())
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _postgres_forwards(schema_editor)
+    elif vendor == "sqlite" and _sqlite_has_fts5(schema_editor):
+        _sqlite_forwards(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _postgres_backwards(schema_editor)
+    elif vendor == "sqlite":
+        for table in SEARCH_COLUMNS:
+            _sqlite_drop(schema_editor, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0008_case_insensitive_codes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
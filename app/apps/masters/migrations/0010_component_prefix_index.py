@@ -0,0 +1,37 @@
+# Prefix index on the product code for the BOM component autocomplete
+# (search.component_choices), which filters with product__code__istartswith.
+#
+# PostgreSQL compiles that to UPPER(code::text) LIKE UPPER('X%'), served by a
+# text_pattern_ops index on the same expression. SQLite's LIKE is
+# case-insensitive and uses an index only when it has NOCASE collation.
+
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "masters_product_code_prefix" '
+            'ON "masters_product" (UPPER("code"::text) text_pattern_ops)'
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "masters_product_code_prefix" ON "masters_product" ("code" COLLATE NOCASE)'
+        )
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute('DROP INDEX IF EXISTS "masters_product_code_prefix"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masters', '0009_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -7,12 +7,43 @@ from typing import Optional
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Max
+from django.db.models import Case, DecimalField, F, Max, Sum, Value, When
+from django.db.models.functions import Coalesce, Upper
 from django.utils.translation import gettext_lazy as _
 
 User = settings.AUTH_USER_MODEL
 
 
+class TracksLoadedValues:
+    """
+    Keeps the values of `tracked_fields` (attnames) as loaded from the
+    database, so post_save receivers can tell what a save changed without
+    querying the old row again.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        # a deferred field is absent from __dict__ and counts as changed below
+        self._loaded_values = {name: self.__dict__.get(name) for name in self.tracked_fields}
+
+    def tracked_changes(self, update_fields=None) -> dict:
+        """{attname: loaded value} of the tracked fields a save with `update_fields` wrote with a new value."""
+        loaded = getattr(self, "_loaded_values", {})
+        changes = {}
+        for name in self.tracked_fields:
+            if update_fields is not None and name not in update_fields and name.removesuffix("_id") not in update_fields:
+                continue
+            if name not in loaded or loaded[name] != getattr(self, name):
+                changes[name] = loaded.get(name)
+        return changes
+
+
 class ProductGroup(models.TextChoices):
     FINISHED_GOOD = "FG", "Finished Good"
     RAW_MATERIAL = "RM", "Raw Material"
@@ -29,6 +60,12 @@ class Plant(models.Model):
 
     class Meta:
         ordering = ("code",)
+        constraints = [
+            models.UniqueConstraint(
+                Upper("code"), name="masters_plant_code_ci_uniq",
+                violation_error_message=_("A plant with this code already exists (codes are case-insensitive)."),
+            ),
+        ]
         verbose_name = "Plant"
         verbose_name_plural = "Plants"
 
@@ -46,6 +83,12 @@ class ProductionLine(models.Model):
     class Meta:
         unique_together = ("plant", "code")
         ordering = ("plant__code", "code")
+        constraints = [
+            models.UniqueConstraint(
+                "plant", Upper("code"), name="masters_productionline_code_ci_uniq",
+                violation_error_message=_("This plant already has a production line with this code (codes are case-insensitive)."),
+            ),
+        ]
         verbose_name = "Production Line"
         verbose_name_plural = "Production Lines"
 
@@ -85,14 +128,19 @@ class Party(models.Model):
 
     class Meta:
         ordering = ("party_code",)
+        constraints = [
+            models.UniqueConstraint(
+                Upper("party_code"), name="masters_party_code_ci_uniq",
+                violation_error_message=_("Duplicate party code not allowed."),
+            ),
+        ]
         verbose_name = "Party"
         verbose_name_plural = "Parties"
 
     def clean(self):
         if not (self.is_vendor or self.is_customer):
             raise ValidationError(_("Party must be at least vendor or customer."))
-        if Party.objects.exclude(pk=self.pk).filter(party_code__iexact=self.party_code).exists():
-            raise ValidationError({"party_code": _("Duplicate party code not allowed.")})
+        # case-insensitive uniqueness of party_code: masters_party_code_ci_uniq (checked by full_clean)
 
     def __str__(self):
         roles = []
@@ -123,7 +171,9 @@ class UserProfile(models.Model):
         return f"profile: {self.user} ({self.plant.code if self.plant else 'no-plant'})"
 
 
-class Product(models.Model):
+class Product(TracksLoadedValues, models.Model):
+    tracked_fields = ("standard_cost",)
+
     code = models.CharField(max_length=30, unique=True)
     name = models.CharField(max_length=150)
     product_group = models.CharField(
@@ -148,7 +198,9 @@ class Product(models.Model):
         return f"{self.code} - {self.name}"
 
 
-class ProductPlant(models.Model):
+class ProductPlant(TracksLoadedValues, models.Model):
+    tracked_fields = ("standard_cost",)
+
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="product_plants")
     plant = models.ForeignKey(Plant, on_delete=models.CASCADE, related_name="product_plants")
     code = models.CharField(max_length=64, blank=True, null=True)
@@ -193,11 +245,112 @@ class ProductPlant(models.Model):
         return self.product.standard_cost
 
 
-class BOMHeader(models.Model):
+def lock_product_plants(product_plant_ids) -> None:
+    """
+    Row-lock ProductPlants (SELECT ... FOR UPDATE, in pk order to avoid
+    deadlocks) for the rest of the current transaction. BOM version
+    allocation locks the parent product plant so concurrent saves serialize.
+    """
+    list(
+        ProductPlant.objects.select_for_update()
+        .filter(pk__in=list(product_plant_ids))
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+# Wide enough to hold sum(quantity * cost) without rounding (4dp x 4dp -> 8dp).
+COST_OUTPUT_FIELD = DecimalField(max_digits=32, decimal_places=8)
+
+
+def effective_standard_cost(prefix: str = ""):
+    """
+    SQL counterpart of ProductPlant.get_effective_standard_cost().
+    `prefix` is the lookup path to the ProductPlant, e.g. "items__component__".
+    """
+    return Case(
+        When(**{f"{prefix}standard_cost__gt": 0}, then=F(f"{prefix}standard_cost")),
+        default=F(f"{prefix}product__standard_cost"),
+        output_field=COST_OUTPUT_FIELD,
+    )
+
+
+class BOMHeaderQuerySet(models.QuerySet):
+    def effective_on(self, as_of):
+        """
+        BOMs whose effective_from/effective_to window contains `as_of`
+        (open ends count as unbounded).
+        """
+        return self.filter(
+            models.Q(effective_from__isnull=True) | models.Q(effective_from__lte=as_of),
+            models.Q(effective_to__isnull=True) | models.Q(effective_to__gte=as_of),
+        )
+
+    def with_total_cost(self):
+        """
+        Annotate `total_cost` computed in SQL; same result as compute_total_cost().
+        """
+        items_cost = Sum(
+            F("items__quantity") * effective_standard_cost("items__component__"),
+            output_field=COST_OUTPUT_FIELD,
+        )
+        return self.annotate(
+            total_cost=Coalesce(items_cost, Value(Decimal("0.0")), output_field=COST_OUTPUT_FIELD)
+            + F("overhead_cost")
+        )
+
+    def bulk_create_versions(self, boms, batch_size=None):
+        """
+        Create many BOMHeaders at once with the same versioning rules as save():
+        versions continue per product_plant (one aggregate for all of them) and
+        only one BOM per product_plant stays active (one UPDATE). Within the
+        batch the last active BOM of a product_plant wins.
+        """
+        boms = list(boms)
+        if not boms:
+            return boms
+        pp_ids = {bom.product_plant_id for bom in boms}
+        with transaction.atomic(using=self.db):
+            lock_product_plants(pp_ids)
+            last = dict(
+                self.model._default_manager.filter(product_plant_id__in=pp_ids)
+                .order_by()
+                .values("product_plant_id")
+                .annotate(m=Max("version"))
+                .values_list("product_plant_id", "m")
+            )
+            winners = {}
+            for bom in boms:
+                bom.version = last.get(bom.product_plant_id, 0) + 1
+                last[bom.product_plant_id] = bom.version
+                if bom.is_active:
+                    previous = winners.get(bom.product_plant_id)
+                    if previous is not None:
+                        previous.is_active = False
+                    winners[bom.product_plant_id] = bom
+            self.bulk_create(boms, batch_size=batch_size)
+            if winners:
+                (
+                    self.model._default_manager.filter(product_plant_id__in=list(winners), is_active=True)
+                    .exclude(pk__in=[bom.pk for bom in winners.values()])
+                    .update(is_active=False)
+                )
+        # bulk_create skips post_save; queue what the signals would have
+        from . import closure, costing
+        closure.schedule_rebuild(product_plants=pp_ids)
+        costing.schedule_invalidation(boms=[bom.pk for bom in boms], product_plants=pp_ids)
+        return boms
+
+
+class BOMHeader(TracksLoadedValues, models.Model):
     """
     BOM tied to a ProductPlant (Finished Good at a specific Plant).
+    WIP sub-assemblies may have their own BOM; see costing.BOMExplosion.
     Version auto-increments per product_plant; only one active BOM allowed per product_plant.
     """
+    # the fields its cost snapshot and where-used closure depend on (signals.bomheader_saved)
+    tracked_fields = ("product_plant_id", "is_active", "overhead_cost")
+
     product_plant = models.ForeignKey(
         ProductPlant,
         on_delete=models.CASCADE,
@@ -214,16 +367,22 @@ class BOMHeader(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BOMHeaderQuerySet.as_manager()
+
     class Meta:
         ordering = ("product_plant__product__code", "product_plant__plant__code", "-version")
         unique_together = (("product_plant", "version"),)
+        indexes = [
+            # as-of-date resolution (services.resolve_boms)
+            models.Index(fields=["product_plant", "effective_from", "effective_to", "version"], name="masters_bom_effective_idx"),
+        ]
         verbose_name = "BOM"
         verbose_name_plural = "BOMs"
 
     def clean(self):
-        # product_plant.product must be FG
-        if self.product_plant and self.product_plant.product.product_group != ProductGroup.FINISHED_GOOD:
-            raise ValidationError({"product_plant": _("Selected product must be a Finished Good (FG).")})
+        # product_plant.product must be FG, or WIP for sub-assembly BOMs
+        if self.product_plant and self.product_plant.product.product_group not in (ProductGroup.FINISHED_GOOD, ProductGroup.WIP):
+            raise ValidationError({"product_plant": _("Selected product must be a Finished Good (FG) or Work in Progress (WIP).")})
         if self.effective_from and self.effective_to and self.effective_from > self.effective_to:
             raise ValidationError({"effective_to": _("Effective to must be after Effective from.")})
 
@@ -231,6 +390,8 @@ class BOMHeader(models.Model):
         is_create = self._state.adding
         with transaction.atomic():
             if is_create:
+                # serialize concurrent creates for the same product_plant
+                lock_product_plants([self.product_plant_id])
                 last = BOMHeader.objects.filter(product_plant=self.product_plant).aggregate(m=Max("version"))["m"]
                 self.version = 1 if not last else (last + 1)
             super().save(*args, **kwargs)
@@ -242,6 +403,8 @@ class BOMHeader(models.Model):
         """
         Compute BOM cost using ProductPlant.get_effective_standard_cost() for components.
         Total = sum(component_qty * component_cost) + overhead_cost
+
+        Issues a query per item; use costing.compute_costs() for many BOMs.
         """
         total = Decimal("0.0")
         for item in self.items.all():
@@ -288,5 +451,138 @@ class BOMItem(models.Model):
         if self.component.product.product_group == ProductGroup.FINISHED_GOOD:
             raise ValidationError({"component": _("Component cannot be a Finished Good (FG).")})
 
+        # a sub-assembly cannot consume itself
+        if self.bom and self.component_id == self.bom.product_plant_id:
+            raise ValidationError({"component": _("Component cannot be the BOM's own product.")})
+
     def __str__(self):
         return f"{self.component.product.code}@{self.component.plant.code} x {self.quantity}"
+
+
+class BOMCostSnapshot(models.Model):
+    """
+    Persisted rolled-up cost of a BOM (see costing.refresh_costs).
+    Rows are marked dirty when any input changes and recomputed after commit.
+    """
+    bom = models.OneToOneField(BOMHeader, on_delete=models.CASCADE, primary_key=True, related_name="cost_snapshot")
+    cost = models.DecimalField(max_digits=24, decimal_places=8, default=Decimal("0.0"))
+    computed_at = models.DateTimeField(blank=True, null=True)
+    fingerprint = models.CharField(max_length=64, blank=True, default="", help_text="Hash of the inputs the cost was computed from")
+    is_dirty = models.BooleanField(default=True, db_index=True)
+
+    class Meta:
+        verbose_name = "BOM Cost Snapshot"
+        verbose_name_plural = "BOM Cost Snapshots"
+
+    def __str__(self):
+        return f"{self.bom_id}: {self.cost}{' (stale)' if self.is_dirty else ''}"
+
+
+class BOMClosure(models.Model):
+    """
+    Transitive closure of the active BOM structure (see closure.rebuild_closure).
+    One row per (ancestor, descendant, depth); `quantity` is the cumulative
+    quantity of descendant per unit of ancestor, summed over all paths of that depth.
+    """
+    ancestor = models.ForeignKey(ProductPlant, on_delete=models.CASCADE, related_name="closure_descendants")
+    descendant = models.ForeignKey(ProductPlant, on_delete=models.CASCADE, related_name="closure_ancestors")
+    depth = models.PositiveSmallIntegerField()
+    quantity = models.DecimalField(max_digits=32, decimal_places=16)
+
+    class Meta:
+        unique_together = ("ancestor", "descendant", "depth")
+        indexes = [models.Index(fields=["descendant", "ancestor"], name="masters_bomclosure_desc_idx")]
+        verbose_name = "BOM Closure"
+        verbose_name_plural = "BOM Closure"
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} (depth {self.depth}, qty {self.quantity})"
+
+
+class ImportJobStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+class ImportJobMode(models.TextChoices):
+    IMPORT = "import", "Import"
+    VALIDATE = "validate", "Validate only"
+
+
+class ImportJob(models.Model):
+    """
+    A queued master-data import, processed outside the request by the
+    run_import_jobs command (see jobs.py). Rows are imported in chunks, each
+    committed together with `last_committed_row`, so a job interrupted by a
+    crash resumes after the last committed chunk. Validate-only jobs run the
+    set-based checks in validation.py and write nothing.
+    """
+    resource = models.CharField(max_length=32, help_text="Key in jobs.IMPORT_RESOURCES")
+    file = models.FileField(upload_to="imports/%Y/%m/")
+    chunk_size = models.PositiveIntegerField(default=1000)
+    mode = models.CharField(max_length=10, choices=ImportJobMode.choices, default=ImportJobMode.IMPORT)
+    status = models.CharField(max_length=10, choices=ImportJobStatus.choices, default=ImportJobStatus.PENDING, db_index=True)
+
+    total_rows = models.PositiveIntegerField(blank=True, null=True)
+    last_committed_row = models.PositiveIntegerField(default=0, help_text="Data rows committed so far")
+    new_rows = models.PositiveIntegerField(default=0)
+    updated_rows = models.PositiveIntegerField(default=0)
+    skipped_rows = models.PositiveIntegerField(default=0)
+    error_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True, default="")
+
+    worker = models.CharField(max_length=100, blank=True, default="", help_text="host:pid of the process running the job")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = "Import Job"
+        verbose_name_plural = "Import Jobs"
+
+    @property
+    def percent(self) -> Optional[int]:
+        if not self.total_rows:
+            return 100 if self.status == ImportJobStatus.DONE else None
+        return min(100, int(self.last_committed_row * 100 / self.total_rows))
+
+    def __str__(self):
+        return f"{self.resource} import #{self.pk} ({self.get_status_display()})"
+
+
+class DeltaChange(models.Model):
+    """
+    Change feed entry for delta consumers (see changelog.py / delta.py): the
+    latest change of one master row, written in the transaction that made it.
+    `txid` is the writing PostgreSQL transaction (a per-model counter
+    elsewhere); readers only serve entries of transactions older than every
+    one still running, so the feed position only moves past committed work. Deleted rows keep their
+    natural key in `object_key` (e.g. product_code + plant_code).
+    """
+    model = models.CharField(max_length=32, help_text="Key in changelog.TRACKED_MODELS")
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    object_key = models.JSONField(default=dict, blank=True)
+    txid = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["model", "txid", "id"], name="masters_deltachange_feed_idx"),
+        ]
+        constraints = [
+            # one entry per row; changelog upserts it
+            models.UniqueConstraint(fields=["model", "object_id"], name="masters_deltachange_obj_uniq"),
+        ]
+        verbose_name = "Delta change"
+        verbose_name_plural = "Delta changes"
+
+    def __str__(self):
+        action = "deleted" if self.deleted else "changed"
+        return f"{self.model} #{self.object_id} {action} {self.changed_at:%Y-%m-%d %H:%M}"
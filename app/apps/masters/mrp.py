@@ -0,0 +1,174 @@
+# apps/masters/mrp.py
+"""
+Gross material requirements for a production plan.
+
+The active BOM structure is loaded once (a single query) into a CSR-style
+sparse matrix keyed by ProductPlant id: row = parent, columns = components,
+value = quantity * (1 + scrap_percent / 100) of the parent's BOM. A plan is
+then exploded one topological layer at a time, each layer being one sparse
+matrix-vector product over all plan lines at once.
+
+Quantities are exact: matrix values are integers scaled by 10**8 (4dp quantity
+x 4dp scrap factor) and the demand of a node at layer k is kept at scale
+10**(base + 8k), so products never need rounding.
+"""
+from __future__ import annotations
+
+import datetime
+from array import array
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from django.utils.translation import gettext_lazy as _
+
+from .costing import BOMCycleError, bom_subquery
+from .models import BOMItem
+
+EDGE_SCALE = 8  # decimal digits of one matrix value
+MIN_RESULT_DIGITS = 4
+
+
+# Decimal arithmetic (scaleb included) rounds to the context's 28 digits; the
+# conversions below work on the digit tuples instead, so they are exact at any size.
+def _scaled(value: Decimal, digits: int) -> int:
+    sign, coefficient, exponent = Decimal(value).as_tuple()
+    magnitude = int("".join(map(str, coefficient)) or "0")
+    shift = exponent + digits
+    magnitude = magnitude * 10 ** shift if shift >= 0 else magnitude // 10 ** -shift  # truncates, like int()
+    return -magnitude if sign else magnitude
+
+
+def _unscaled(value: int, digits: int) -> Decimal:
+    # drop trailing zeros but keep the usual 4dp of quantities
+    while digits > MIN_RESULT_DIGITS and value % 10 == 0:
+        value //= 10
+        digits -= 1
+    return Decimal((1 if value < 0 else 0, tuple(int(d) for d in str(abs(value))), -digits))
+
+
+class BOMMatrix:
+    """
+    Active BOM structure as a CSR sparse matrix plus a topological layering.
+    Build once and reuse it for as many plans as needed. With `as_of`, each
+    product uses the BOM valid on that date instead of its active one.
+    """
+
+    def __init__(self, plant_ids: Optional[Iterable[int]] = None, as_of: Optional[datetime.date] = None):
+        if as_of is None:
+            qs = BOMItem.objects.filter(bom__is_active=True)
+        else:
+            # explode historical plans against the BOM that was valid at the time
+            qs = BOMItem.objects.filter(bom_id=bom_subquery("bom__product_plant_id", as_of))
+        qs = qs.order_by()
+        if plant_ids is not None:
+            qs = qs.filter(bom__product_plant__plant_id__in=list(plant_ids))
+        rows = qs.values_list("bom__product_plant_id", "component_id", "quantity", "bom__scrap_percent")
+
+        self.index: Dict[int, int] = {}  # product_plant_id -> row/column
+        self.ids: List[int] = []
+        adjacency: Dict[int, Dict[int, int]] = defaultdict(dict)
+        for parent_id, component_id, qty, scrap in rows:
+            parent, component = self._node(parent_id), self._node(component_id)
+            # quantity (4dp) * (1 + scrap/100) (4dp) as an integer at scale 10**8
+            factor = _scaled(Decimal(100) + Decimal(scrap or 0), 2)
+            weight = _scaled(qty, 4) * factor
+            adjacency[parent][component] = adjacency[parent].get(component, 0) + weight
+
+        n = len(self.ids)
+        self.indptr = array("q", [0] * (n + 1))
+        self.indices = array("q")
+        self.data: List[int] = []  # python ints: no overflow for large quantities
+        for row in range(n):
+            for col, weight in adjacency.get(row, {}).items():
+                self.indices.append(col)
+                self.data.append(weight)
+            self.indptr[row + 1] = len(self.indices)
+        self.layer = self._layers()
+        self.depth = max(self.layer, default=0)
+
+    def _node(self, product_plant_id: int) -> int:
+        idx = self.index.get(product_plant_id)
+        if idx is None:
+            idx = self.index[product_plant_id] = len(self.ids)
+            self.ids.append(product_plant_id)
+        return idx
+
+    def _layers(self) -> array:
+        """Longest-path layer of every node (Kahn's algorithm); raises on cycles."""
+        n = len(self.ids)
+        indegree = array("q", [0] * n)
+        for col in self.indices:
+            indegree[col] += 1
+        layer = array("q", [0] * n)
+        queue = [row for row in range(n) if indegree[row] == 0]
+        visited = 0
+        while queue:
+            row = queue.pop()
+            visited += 1
+            for k in range(self.indptr[row], self.indptr[row + 1]):
+                col = self.indices[k]
+                layer[col] = max(layer[col], layer[row] + 1)
+                indegree[col] -= 1
+                if indegree[col] == 0:
+                    queue.append(col)
+        if visited != n:
+            raise BOMCycleError(_("BOM cycle detected in the active BOM structure; cannot compute requirements."))
+        return layer
+
+    def is_leaf(self, product_plant_id: int) -> bool:
+        idx = self.index.get(product_plant_id)
+        return idx is None or self.indptr[idx] == self.indptr[idx + 1]
+
+    def explode(self, plan: Mapping[int, Decimal], leaves_only: bool = True) -> Dict[int, Decimal]:
+        """
+        Gross requirements {product_plant_id: quantity} for a plan
+        {product_plant_id: quantity to produce}. Planned quantities themselves
+        are not counted as requirements. With leaves_only=False, intermediate
+        (WIP) requirements are returned too.
+        """
+        base = max((max(-Decimal(q).as_tuple().exponent, 0) for q in plan.values()), default=0)
+        demand: Dict[int, int] = defaultdict(int)  # node -> demand at scale base + 8*layer
+        derived: Dict[int, int] = defaultdict(int)
+        by_layer: Dict[int, List[int]] = defaultdict(list)
+        for pp_id, qty in plan.items():
+            idx = self.index.get(pp_id)
+            if idx is None:
+                continue  # no BOM and not a component: nothing to explode
+            demand[idx] += _scaled(qty, base + EDGE_SCALE * self.layer[idx])
+            by_layer[self.layer[idx]].append(idx)
+
+        for k in range(self.depth + 1):
+            rows = set(by_layer.get(k, ()))
+            # one sparse mat-vec per layer: demand[layer > k] += demand[layer k] @ M
+            for row in rows:
+                x = demand[row]
+                if not x:
+                    continue
+                for p in range(self.indptr[row], self.indptr[row + 1]):
+                    col = self.indices[p]
+                    shift = self.layer[col] - k - 1
+                    contribution = x * self.data[p] * (10 ** (EDGE_SCALE * shift) if shift else 1)
+                    if not demand[col]:
+                        by_layer[self.layer[col]].append(col)
+                    demand[col] += contribution
+                    derived[col] += contribution
+
+        result = {}
+        for idx, value in derived.items():
+            pp_id = self.ids[idx]
+            if value and (not leaves_only or self.is_leaf(pp_id)):
+                result[pp_id] = _unscaled(value, base + EDGE_SCALE * self.layer[idx])
+        return result
+
+
+def compute_requirements(plan: Mapping[int, Decimal], leaves_only: bool = True,
+                         matrix: Optional[BOMMatrix] = None, as_of: Optional[datetime.date] = None) -> Dict[int, Decimal]:
+    """
+    Raw-material (or, with leaves_only=False, all component) requirements for
+    a production plan {product_plant_id: quantity}. Pass a prebuilt `matrix`
+    to explode several plans against the same BOM snapshot.
+    """
+    if matrix is None:
+        matrix = BOMMatrix(as_of=as_of)
+    return matrix.explode(plan, leaves_only=leaves_only)
@@ -0,0 +1,334 @@
+# apps/masters/pagination.py
+"""
+Keyset (seek) pagination for the masters changelists.
+
+The stock ChangeList pages with OFFSET, so the database reads and throws away
+every row before the requested page. Page N costs O(N) on big tables like
+ProductPlant and Worker. In keyset mode a page instead continues from a
+cursor holding the ordering values of the last (or first) row shown:
+
+    WHERE (k1, k2, pk) > (:v1, :v2, :pk) ORDER BY k1, k2, pk LIMIT per_page + 1
+
+Every page costs the same, and a cursor still points at the same place when
+rows are added or removed elsewhere in the table.
+
+An admin opts in with `keyset_ordering`. The keys must be non-null columns of
+the model itself (e.g. "plant_id", not "plant__code"), so one index on them
+serves the seek; a key on a joined table makes the database sort the whole
+join for every page. The pk is always appended to break ties. Keyset mode
+applies while the list uses its default order. Sorting by a column header
+switches back to the usual numbered pages. A "show all" in keyset mode
+fetches the following pages incrementally (admin-pagination-sync.js) and
+stops at `keyset_show_all_max` rows. It never renders the whole table in one
+response.
+
+Counts: the stock changelist runs an exact COUNT(*) on every render, and
+a second one for the unfiltered total when filters are active.
+EstimatedCountPaginator counts an unfiltered list from the planner's
+estimate (pg_class.reltuples) on PostgreSQL. Other databases use an exact
+count cached for MASTERS_COUNT_CACHE_SECONDS. Both only kick in at
+MASTERS_ESTIMATED_COUNT_THRESHOLD rows and are shown as "~N". Filtered and
+searched lists are always counted exactly, and the unfiltered total next to
+them is estimated the same way. An estimate is for display only: numbered
+pages past it stay reachable (a "Next" link is shown while rows follow), and
+"show all" is decided by a bounded exact count.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import datetime
+import json
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, InvalidPage, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+
+AFTER_VAR = "after"
+BEFORE_VAR = "before"
+KEYSET_PARAMS = (AFTER_VAR, BEFORE_VAR)
+
+DEFAULT_SHOW_ALL_MAX = 2000
+
+ESTIMATE_THRESHOLD = getattr(settings, "MASTERS_ESTIMATED_COUNT_THRESHOLD", 10000)
+COUNT_CACHE_SECONDS = getattr(settings, "MASTERS_COUNT_CACHE_SECONDS", 300)
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds times to milliseconds; a cursor needs the exact value
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps(list(values), cls=_CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fields: Sequence[models.Field]) -> List:
+    """Cursor values converted with the key fields' to_python(); anything else is IncorrectLookupParameters."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as exc:
+        raise IncorrectLookupParameters("Malformed page cursor.") from exc
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise IncorrectLookupParameters("Malformed page cursor.")
+    converted = []
+    for field, value in zip(fields, values):
+        # keys are non-null scalars; to_python() would stringify a list or dict for a text field
+        if value is None or isinstance(value, (list, dict)):
+            raise IncorrectLookupParameters("Malformed page cursor.")
+        try:
+            converted.append(field.to_python(value))
+        except (ValidationError, TypeError, ValueError) as exc:
+            raise IncorrectLookupParameters("Malformed page cursor.") from exc
+    return converted
+
+
+def key_field(model, path: str) -> models.Field:
+    """The model field at the end of an ordering path such as "code", "plant_id" or "plant__code"."""
+    if path == "pk":
+        return model._meta.pk
+    *relations, name = path.split(LOOKUP_SEP)
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def seek_filter(keys: Sequence[Tuple[str, bool]], values: Sequence, forward: bool) -> Q:
+    """
+    Rows strictly after (forward) or before the position `values` in the
+    order given by `keys`, a sequence of (annotation name, descending).
+    """
+    condition = Q()
+    for i, (name, descending) in enumerate(keys):
+        lookup = "lt" if descending == forward else "gt"
+        term = Q(**{f"{name}__{lookup}": values[i]})
+        for j in range(i):
+            term &= Q(**{keys[j][0]: values[j]})
+        condition |= term
+    return condition
+
+
+def is_unfiltered(queryset) -> bool:
+    return not queryset.query.where and not queryset.query.distinct
+
+
+def _planner_estimate(queryset) -> Optional[int]:
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0 on older servers) until the table is first analyzed
+    return int(row[0]) if row and row[0] > 0 else None
+
+
+def estimate_count(queryset) -> Tuple[int, bool]:
+    """
+    (count, approximate) for an unfiltered queryset. Tables below
+    ESTIMATE_THRESHOLD rows are always counted exactly.
+    """
+    estimate = _planner_estimate(queryset)
+    if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+        return estimate, True
+    key = f"masters:count:{queryset.db}:{queryset.model._meta.label_lower}"
+    if estimate is None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+    count = queryset.count()
+    if estimate is None and count >= ESTIMATE_THRESHOLD:
+        cache.set(key, count, COUNT_CACHE_SECONDS)
+    return count, False
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count is estimated for large unfiltered querysets (see estimate_count)."""
+
+    approximate = False
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, "query") and is_unfiltered(self.object_list):
+            count, self.approximate = estimate_count(self.object_list)
+            return count
+        return super().count
+
+    def validate_number(self, number):
+        self.count  # sets approximate
+        if not self.approximate:
+            return super().validate_number(number)
+        # the estimate may be low, so it cannot bound the page number; page() checks for rows instead
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        page = self._get_page(rows[:self.per_page], number, self)
+        page.has_more_rows = len(rows) > self.per_page
+        return page
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that seeks on model_admin.keyset_ordering instead of using OFFSET."""
+
+    def __init__(self, request, *args, **kwargs):
+        self.keyset_after = request.GET.get(AFTER_VAR) or None
+        self.keyset_before = request.GET.get(BEFORE_VAR) or None
+        self.keyset_next = None
+        self.keyset_prev = None
+        self.approximate_next_url = ""
+        super().__init__(request, *args, **kwargs)
+
+    @property
+    def keyset_active(self) -> bool:
+        return bool(
+            getattr(self.model_admin, "keyset_ordering", None)
+            and ORDER_VAR not in self.params
+            and not self.list_editable
+        )
+
+    @property
+    def keyset_show_all_max(self) -> int:
+        return getattr(self.model_admin, "keyset_show_all_max", DEFAULT_SHOW_ALL_MAX)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in KEYSET_PARAMS:
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def _keys(self) -> List[Tuple[str, str, bool]]:
+        """(annotation name, field path, descending) for every ordering key plus the pk."""
+        keys = []
+        for i, name in enumerate(self.model_admin.keyset_ordering):
+            keys.append((f"_keyset_{i}", name.lstrip("-"), name.startswith("-")))
+        keys.append(("_keyset_pk", "pk", keys[-1][2]))
+        return keys
+
+    def get_ordering(self, request, queryset):
+        if not self.keyset_active:
+            return super().get_ordering(request, queryset)
+        return [f"-{path}" if desc else path for _name, path, desc in self._keys()]
+
+    def get_results(self, request):
+        # Adapted from django.contrib.admin.views.main.ChangeList.get_results (Django 5.2);
+        # re-check against it when upgrading Django.
+        if self.keyset_after and self.keyset_before:
+            raise IncorrectLookupParameters("Use either 'after' or 'before', not both.")
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        # ChangeList.get_results(), minus the second exact COUNT for the unfiltered total
+        result_count = paginator.count
+        self.result_count_approximate = getattr(paginator, "approximate", False)
+        self.full_result_count_approximate = False
+        if not self.model_admin.show_full_result_count:
+            full_result_count = None
+        elif is_unfiltered(self.queryset):
+            full_result_count = result_count
+            self.full_result_count_approximate = self.result_count_approximate
+        else:
+            full_result_count, self.full_result_count_approximate = estimate_count(self.root_queryset)
+        if self.result_count_approximate:
+            # the estimate is display-only; bounded exact counts decide these
+            can_show_all = not self._has_more_than(self.list_max_show_all)
+            multi_page = self._has_more_than(self.list_per_page)
+        else:
+            can_show_all = result_count <= self.list_max_show_all
+            multi_page = result_count > self.list_per_page
+
+        if self.keyset_active:
+            result_list = self._seek()
+            can_show_all = False
+            multi_page = bool(self.keyset_next or self.keyset_prev)
+        elif (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        else:
+            try:
+                page = paginator.page(self.page_num)
+            except InvalidPage:
+                raise IncorrectLookupParameters
+            result_list = page.object_list
+            if getattr(page, "has_more_rows", False):
+                self.approximate_next_url = self.get_query_string({PAGE_VAR: self.page_num + 1})
+
+        self.result_count = result_count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = not self.show_full_result_count or bool(full_result_count)
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+    def _has_more_than(self, limit: int) -> bool:
+        return self.queryset.order_by()[:limit + 1].count() > limit
+
+    def _seek(self) -> List:
+        """One page of rows from the cursor in the request; sets keyset_next / keyset_prev."""
+        keys = self._keys()
+        order = [(name, desc) for name, _path, desc in keys]
+        queryset = self.queryset.annotate(**{name: F(path) for name, path, _desc in keys})
+        cursor = self.keyset_after or self.keyset_before
+        forward = self.keyset_before is None
+        if cursor:
+            fields = [key_field(self.model, path) for _name, path, _desc in keys]
+            queryset = queryset.filter(seek_filter(order, decode_cursor(cursor, fields), forward))
+        ordering = [f"-{name}" if desc == forward else name for name, desc in order]
+        rows = list(queryset.order_by(*ordering)[:self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if not forward:
+            rows.reverse()
+
+        has_next = more if forward else True
+        has_prev = bool(cursor) if forward else more
+        if rows:
+            self.keyset_next = encode_cursor(self._position(rows[-1], keys)) if has_next else None
+            self.keyset_prev = encode_cursor(self._position(rows[0], keys)) if has_prev else None
+        return rows
+
+    @staticmethod
+    def _position(obj, keys) -> List:
+        return [getattr(obj, name) for name, _path, _desc in keys]
+
+    def keyset_url(self, cursor: Optional[str], forward: bool) -> str:
+        if cursor is None:
+            return ""
+        new = {AFTER_VAR: cursor} if forward else {BEFORE_VAR: cursor}
+        return self.get_query_string(new, remove=[BEFORE_VAR if forward else AFTER_VAR])
+
+    @property
+    def keyset_next_url(self) -> str:
+        return self.keyset_url(self.keyset_next, True)
+
+    @property
+    def keyset_prev_url(self) -> str:
+        return self.keyset_url(self.keyset_prev, False)
+
+    @property
+    def keyset_first_url(self) -> str:
+        return self.get_query_string(remove=[AFTER_VAR, BEFORE_VAR])
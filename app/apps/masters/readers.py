@@ -0,0 +1,115 @@
+# apps/masters/readers.py
+"""
+Streaming readers for import files.
+
+tablib parses the whole file into a Dataset before the first row can be
+imported, which costs several times the file size in memory. These readers
+yield rows lazily (csv.reader over a text wrapper, openpyxl in read-only
+mode for XLSX) and batches() packs them into fixed-size Datasets for the
+resources, so peak memory depends on the batch size, not the file size.
+"""
+from __future__ import annotations
+
+import csv
+import io
+from contextlib import contextmanager
+from itertools import islice
+from typing import IO, Iterator, List, Optional, Sequence, Tuple
+
+import tablib
+from django.core.exceptions import ImproperlyConfigured
+
+XLSX_EXTENSIONS = (".xlsx", ".xlsm")
+
+
+def is_xlsx(name: str) -> bool:
+    return name.lower().endswith(XLSX_EXTENSIONS)
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+def _fit(row: Sequence, width: int) -> List:
+    """Pad short rows / drop surplus cells so every row matches the header."""
+    row = list(row[:width])
+    if len(row) < width:
+        row.extend([""] * (width - len(row)))
+    return row
+
+
+def _blank(row: Sequence) -> bool:
+    return all(v is None or (isinstance(v, str) and not v.strip()) for v in row)
+
+
+def _csv_rows(fh: IO[bytes]) -> Iterator[Sequence]:
+    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    finally:
+        if not fh.closed:
+            text.detach()  # leave the underlying file open for the caller
+
+
+def _xlsx_rows(fh: IO[bytes]) -> Iterator[Sequence]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError as exc:
+        raise ImproperlyConfigured("XLSX import requires openpyxl.") from exc
+    workbook = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell(v) for v in row]
+    finally:
+        workbook.close()
+
+
+def iter_rows(fh: IO[bytes], name: str, xlsx: Optional[bool] = None) -> Tuple[Optional[List[str]], Iterator[List]]:
+    """
+    (headers, rows) for a binary file object; `name` picks the format by
+    extension unless `xlsx` says which one it is. Rows are produced lazily, blank lines are skipped and every
+    row has exactly len(headers) cells. headers is None for an empty file.
+    """
+    if xlsx is None:
+        xlsx = is_xlsx(name)
+    source = _xlsx_rows(fh) if xlsx else _csv_rows(fh)
+    headers = None
+    for row in source:
+        if not _blank(row):
+            headers = [str(h).strip() for h in row]
+            break
+    if headers is None:
+        return None, iter(())
+    width = len(headers)
+    return headers, (_fit(row, width) for row in source if not _blank(row))
+
+
+def batches(headers: List[str], rows: Iterator[List], size: int, start: int = 0) -> Iterator[Tuple[int, tablib.Dataset]]:
+    """
+    Yield (offset, Dataset) with up to `size` rows each, skipping the first
+    `start` data rows (used to resume a job). `offset` is the number of data
+    rows before the batch.
+    """
+    size = max(1, size)
+    offset = start
+    if start:
+        rows = islice(rows, start, None)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield offset, tablib.Dataset(*chunk, headers=headers)
+        offset += len(chunk)
+
+
+def count_rows(fh: IO[bytes], name: str) -> int:
+    """Number of non-blank data rows, in one streaming pass."""
+    headers, rows = iter_rows(fh, name)
+    return sum(1 for _row in rows) if headers else 0
+
+
+@contextmanager
+def open_rows(field_file):
+    """iter_rows() over a stored FileField; the file is closed on exit."""
+    with field_file.open("rb") as fh:
+        yield iter_rows(fh, field_file.name)
@@ -1,15 +1,28 @@
 # garment_app/resources.py
+import hashlib
+from functools import reduce
+from operator import and_
+
+import tablib
 from import_export import resources, fields
 from import_export.widgets import ForeignKeyWidget
 from import_export.results import RowResult
 from import_export.formats.base_formats import CSV
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 from django.utils.dateparse import parse_date
 from decimal import Decimal
 
+from . import changelog, costing, search
+from .signals import create_user_for_profile, suspend_profile_sync
+from .utils import hash_passwords, is_password_hash, set_user_password
 from .models import (
     Plant, Product, ProductPlant, ProductionLine, Worker,
     Party, UserProfile
@@ -17,35 +30,300 @@ from .models import (
 
 User = get_user_model()
 
+IMPORT_BATCH_SIZE = getattr(settings, "MASTERS_IMPORT_BATCH_SIZE", 1000)
+
+
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """
+    ForeignKeyWidget resolving values from a dict the resource preloads once
+    per import (`lookup`), instead of one query per row. `key` maps
+    (value, row) to the dict key (default: the stripped value, matched exactly
+    like ForeignKeyWidget); falls back to a query when nothing is preloaded.
+    """
+
+    def __init__(self, model, field="pk", key=None, **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.lookup = None
+        self.key = key or (lambda value, row: str(value).strip())
+
+    def clean(self, value, row=None, **kwargs):
+        if self.lookup is None:
+            return super().clean(value, row=row, **kwargs)
+        if value in (None, ""):
+            return None
+        try:
+            return self.lookup[self.key(value, row or {})]
+        except KeyError:
+            raise ValueError(f"{self.model._meta.verbose_name} '{value}' not found.")
+
+
+def _is_dry_run(args, kwargs):
+    """
+    dry_run flag of an import-export hook call: a keyword argument in
+    import-export 4, the positional argument after using_transactions in 3.x.
+    """
+    if "dry_run" in kwargs:
+        return bool(kwargs["dry_run"])
+    return bool(args[1]) if len(args) > 1 else False
+
+
+def _column(dataset, *names):
+    """Index of the first header matching one of `names` (case-insensitive), or None."""
+    lowered = [str(h).strip().lower() for h in (dataset.headers or [])]
+    for name in names:
+        if name in lowered:
+            return lowered.index(name)
+    return None
+
+
+def _clean_code(value):
+    return str(value).strip() if value not in (None, "") else ""
+
+
+def _chunked(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _fingerprint_part(value):
+    if isinstance(value, models.Model):
+        return str(value.pk)
+    if isinstance(value, Decimal):
+        return str(value.normalize())
+    if value in (None, ""):
+        return ""
+    return repr(value)
+
+
+def _key_part(value):
+    if isinstance(value, models.Model):
+        return value.pk
+    return None if value in (None, "") else str(value).strip()
+
+
+class BulkImportMixin:
+    """
+    Bulk import mode for large master files.
+
+    - CachedForeignKeyWidget lookups are preloaded for the codes in the file.
+    - Existing rows are fetched in batches keyed on import_id_fields, so
+      get_instance() is a dict lookup instead of one SELECT per row.
+    - Writes go through import-export's use_bulk path (bulk_create /
+      bulk_update in chunks of MASTERS_IMPORT_BATCH_SIZE).
+
+    - With Meta.skip_unchanged, each prefetched row is fingerprinted (hash of
+      the imported columns' current values); rows whose fingerprint is the
+      same after applying the file are skipped without a write, so re-imports
+      of a full extract do not bump updated_at.
+
+    - With case_insensitive_keys, string key parts are matched upper-cased,
+      for models whose natural key has a case-insensitive unique constraint
+      (a case variant of an existing code updates that row instead of failing
+      the bulk insert).
+
+    The per-row new/update/skip/error result is unchanged. Bulk writes do not
+    send model signals.
+    """
+
+    case_insensitive_keys = False
+
+    def before_import(self, dataset, *args, **kwargs):
+        super().before_import(dataset, *args, **kwargs)
+        self._preload_fk_lookups(dataset)
+        self._fingerprint_fields = [
+            f for f in self.get_import_fields() if f.attribute and f.column_name in (dataset.headers or [])
+        ]
+        self._existing = self._prefetch_existing(dataset)
+        self._fingerprints = {obj.pk: self._fingerprint(obj) for obj in self._existing.values()}
+        self._seen_keys = {}
+
+    def _fingerprint(self, obj):
+        digest = hashlib.sha1()
+        for field in self._fingerprint_fields:
+            digest.update(f"{field.column_name}={_fingerprint_part(field.get_value(obj))}\x1f".encode())
+        return digest.hexdigest()
+
+    def skip_row(self, instance, original, row, import_validation_errors=None):
+        if not self._meta.skip_unchanged or import_validation_errors or instance.pk is None:
+            return False
+        fingerprints = getattr(self, "_fingerprints", None)
+        if fingerprints is None:
+            return super().skip_row(instance, original, row, import_validation_errors)
+        return fingerprints.get(instance.pk) == self._fingerprint(instance)
+
+    def _preload_fk_lookups(self, dataset):
+        for field in self.fields.values():
+            widget = field.widget
+            if not isinstance(widget, CachedForeignKeyWidget) or field.column_name not in (dataset.headers or []):
+                continue
+            values = {_key_part(v) for v in dataset[field.column_name]} - {None}
+            lookup = {}
+            for chunk in _chunked(values, IMPORT_BATCH_SIZE):
+                for obj in widget.get_queryset(None, None).filter(**{f"{widget.field}__in": chunk}):
+                    lookup[str(getattr(obj, widget.field))] = obj
+            widget.lookup = lookup
+
+    def _fold(self, part):
+        return part.upper() if self.case_insensitive_keys and isinstance(part, str) else part
+
+    def _import_key(self, row):
+        return tuple(self._fold(_key_part(self.fields[name].clean(row))) for name in self.get_import_id_fields())
+
+    def _instance_key(self, obj):
+        return tuple(
+            self._fold(_key_part(getattr(obj, self.fields[name].attribute))) for name in self.get_import_id_fields()
+        )
+
+    def _key_condition(self, field, part):
+        if self.case_insensitive_keys and isinstance(part, str):
+            return Q(**{f"{field.attribute}__iexact": part})
+        return Q(**{field.attribute: part})
+
+    def _prefetch_existing(self, dataset):
+        id_fields = [self.fields[name] for name in self.get_import_id_fields()]
+        if any(f.column_name not in (dataset.headers or []) for f in id_fields):
+            return {}
+        keys = set()
+        for data_row in dataset:
+            try:
+                key = self._import_key(dict(zip(dataset.headers, data_row)))
+            except (ValueError, ValidationError):
+                continue  # reported on the row itself during import
+            if None not in key:
+                keys.add(key)
+
+        existing = {}
+        queryset = self.get_queryset()
+        if len(id_fields) == 1 and self.case_insensitive_keys:
+            # UPPER(field) IN (...) can use the case-insensitive unique index
+            queryset = queryset.alias(_import_key=Upper(id_fields[0].attribute))
+        for chunk in _chunked(keys, IMPORT_BATCH_SIZE):
+            if len(id_fields) == 1:
+                lookup = "_import_key__in" if self.case_insensitive_keys else f"{id_fields[0].attribute}__in"
+                condition = Q(**{lookup: [key[0] for key in chunk]})
+            else:
+                condition = Q()
+                for key in chunk:
+                    condition |= reduce(and_, (self._key_condition(f, part) for f, part in zip(id_fields, key)))
+            for obj in queryset.filter(condition):
+                existing[self._instance_key(obj)] = obj
+        return existing
+
+    def get_bulk_update_fields(self):
+        fields = super().get_bulk_update_fields()
+        # bulk_update() bypasses auto_now; save_instance() stamps updated_at (exported with delta rows)
+        if self._has_updated_at() and "updated_at" not in fields:
+            fields = list(fields) + ["updated_at"]
+        return fields
+
+    def _has_updated_at(self):
+        return any(f.name == "updated_at" for f in self._meta.model._meta.concrete_fields)
+
+    def save_instance(self, instance, is_create, *args, **kwargs):
+        if not is_create and self._has_updated_at():
+            instance.updated_at = timezone.now()
+        return super().save_instance(instance, is_create, *args, **kwargs)
+
+    def bulk_create(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        instances = list(self.create_instances)
+        super().bulk_create(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+        if using_transactions or not dry_run:
+            # bulk_create sends no post_save; feed the delta change log directly
+            changelog.record_changes(self._meta.model, [obj.pk for obj in instances])
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        instances = list(self.update_instances)
+        super().bulk_update(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+        if using_transactions or not dry_run:
+            changelog.record_changes(self._meta.model, [obj.pk for obj in instances])
+
+    def after_import(self, dataset, result, *args, **kwargs):
+        super().after_import(dataset, result, *args, **kwargs)
+        if not _is_dry_run(args, kwargs):
+            updated = [
+                row.object_id for row in result.rows
+                if row.import_type == RowResult.IMPORT_TYPE_UPDATE and row.object_id is not None
+            ]
+            if updated:
+                self.after_bulk_update(updated)
+            if updated or result.totals.get(RowResult.IMPORT_TYPE_NEW):
+                self.after_bulk_write()
+
+    def after_bulk_update(self, pks):
+        """Hook for the work post_save receivers would have done for updated rows."""
+
+    def after_bulk_write(self):
+        """Hook for the work post_save receivers would have done for any new or updated row."""
+
+    def before_import_row(self, row, **kwargs):
+        self._row_number = kwargs.get("row_number")
+        super().before_import_row(row, **kwargs)
+
+    def get_instance(self, instance_loader, row):
+        if getattr(self, "_existing", None) is None:
+            return super().get_instance(instance_loader, row)
+        key = self._import_key(row)
+        # bulk writes are deferred, so a key repeated in the file cannot be matched to its first row
+        if key in self._seen_keys:
+            raise ValidationError(f"Duplicate key {', '.join(map(str, key))} (already in row {self._seen_keys[key]}).")
+        self._seen_keys[key] = self._row_number
+        return self._existing.get(key)
+
+
 
 class PlantResource(resources.ModelResource):
     class Meta:
         model = Plant
+        skip_unchanged = True
+        report_skipped = True
         import_id_fields = ("code",)
         fields = ("code", "name", "address", "active")
         export_order = ("code", "name", "address", "active")
 
 
-class ProductResource(resources.ModelResource):
+class ProductResource(BulkImportMixin, resources.ModelResource):
     class Meta:
         model = Product
+        skip_unchanged = True
+        report_skipped = True
+        use_bulk = True
+        batch_size = IMPORT_BATCH_SIZE
         import_id_fields = ("code",)
         fields = ("code", "name", "product_group", "shade", "size", "uom", "active", "standard_cost")
         export_order = ("code", "name", "product_group", "shade", "size", "uom", "active", "standard_cost")
 
+    def after_bulk_update(self, pks):
+        # same as signals.product_cost_changed: plants falling back to the product cost
+        pp_ids = ProductPlant.objects.filter(product_id__in=pks, standard_cost__lte=0).values_list("pk", flat=True)
+        costing.schedule_invalidation(product_plants=list(pp_ids))
+
+    def after_bulk_write(self):
+        search.invalidate_components()
 
-class ProductPlantResource(resources.ModelResource):
+
+class ProductPlantResource(BulkImportMixin, resources.ModelResource):
     product = fields.Field(attribute="product", column_name="product_code",
-                           widget=ForeignKeyWidget(Product, "code"))
+                           widget=CachedForeignKeyWidget(Product, "code"))
     plant = fields.Field(attribute="plant", column_name="plant_code",
-                         widget=ForeignKeyWidget(Plant, "code"))
+                         widget=CachedForeignKeyWidget(Plant, "code"))
 
     class Meta:
         model = ProductPlant
+        skip_unchanged = True
+        report_skipped = True
+        use_bulk = True
+        batch_size = IMPORT_BATCH_SIZE
         import_id_fields = ("product", "plant")
         fields = ("product", "plant", "code", "name", "standard_cost", "active")
         export_order = ("product", "plant", "code", "name", "standard_cost", "active")
 
+    def after_bulk_update(self, pks):
+        costing.schedule_invalidation(product_plants=pks)
+
+    def after_bulk_write(self):
+        search.invalidate_components()
+
 
 class ProductionLineResource(resources.ModelResource):
     plant = fields.Field(attribute="plant", column_name="plant_code",
@@ -53,6 +331,8 @@ class ProductionLineResource(resources.ModelResource):
 
     class Meta:
         model = ProductionLine
+        skip_unchanged = True
+        report_skipped = True
         import_id_fields = ("plant", "code")
         fields = ("plant", "code", "name", "active", "notes")
         export_order = ("plant", "code", "name", "active", "notes")
@@ -67,51 +347,127 @@ class WorkerResource(resources.ModelResource):
     plant_code = fields.Field(column_name="plant_code")
     production_line_code = fields.Field(column_name="production_line_code")
 
-    # Actual FK fields to be resolved/populated by before_import_row:
-    plant = fields.Field(attribute="plant", column_name="plant", widget=ForeignKeyWidget(Plant, "code"))
-    production_line = fields.Field(attribute="production_line", column_name="production_line", widget=ForeignKeyWidget(ProductionLine, "code"))
+    # Actual FK fields to be resolved/populated by before_import_row (from the caches built in before_import):
+    plant = fields.Field(
+        attribute="plant", column_name="plant",
+        widget=CachedForeignKeyWidget(Plant, "code", key=lambda value, row: str(value).strip().upper()),
+    )
+    production_line = fields.Field(
+        attribute="production_line", column_name="production_line",
+        widget=CachedForeignKeyWidget(
+            ProductionLine, "code",
+            key=lambda value, row: (str(row.get("plant") or "").upper(), str(value).strip().upper()),
+        ),
+    )
 
     class Meta:
         model = Worker
+        skip_unchanged = True
+        report_skipped = True
         import_id_fields = ("plant", "code")
         # include the CSV helper columns in fields so import_export doesn't warn
         fields = ("plant", "production_line", "code", "name", "active", "plant_code", "production_line_code")
         export_order = ("plant", "production_line", "code", "name", "active")
 
+    def before_import(self, dataset, *args, **kwargs):
+        """
+        Preload plant and production line lookups for the whole file (one query
+        each) and create every missing production line with one bulk insert, so
+        per-row resolution below is dictionary lookups only.
+        """
+        # before_import_row fills these from plant_code / production_line_code
+        for name in ("plant", "production_line"):
+            if _column(dataset, name) is None:
+                dataset.append_col([""] * len(dataset), header=name)
+
+        plant_col = _column(dataset, "plant_code", "plant")
+        line_col = _column(dataset, "production_line_code", "production_line")
+        pairs = set()
+        for data_row in dataset:
+            plant_code = _clean_code(data_row[plant_col]).upper() if plant_col is not None else ""
+            line_code = _clean_code(data_row[line_col]) if line_col is not None else ""
+            pairs.add((plant_code, line_code))
+
+        plant_codes = {p for p, _ in pairs if p}
+        self._plants = {
+            p.code.upper(): p
+            for p in Plant.objects.annotate(code_upper=Upper("code")).filter(code_upper__in=plant_codes)
+        }
+        self._lines = self._load_lines()
+        missing = {}
+        for plant_code, line_code in pairs:
+            plant = self._plants.get(plant_code)
+            if plant and line_code and (plant_code, line_code.upper()) not in self._lines:
+                # create automatically in clean rebuild scenarios
+                missing.setdefault((plant_code, line_code.upper()), ProductionLine(plant=plant, code=line_code, name=line_code))
+        if missing:
+            ProductionLine.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            self._lines = self._load_lines()
+
+        self.fields["plant"].widget.lookup = self._plants
+        self.fields["production_line"].widget.lookup = self._lines
+
+    def _load_lines(self):
+        return {
+            (line.plant.code.upper(), line.code.upper()): line
+            for line in ProductionLine.objects.filter(plant__in=list(self._plants.values())).select_related("plant")
+        }
+
     def before_import_row(self, row, row_number=None, **kwargs):
         data = {k.lower(): v for k, v in row.items()}
-        plant_code = (data.get("plant_code") or data.get("plant") or "").strip()
-        pl_code = (data.get("production_line_code") or data.get("production_line") or "").strip()
+        plant_code = _clean_code(data.get("plant_code") or data.get("plant"))
+        pl_code = _clean_code(data.get("production_line_code") or data.get("production_line"))
 
         if not plant_code:
             raise ValidationError(f"Worker import row {row_number or 'unknown'} missing plant_code")
 
-        try:
-            plant = Plant.objects.get(code__iexact=plant_code)
-        except Plant.DoesNotExist:
+        plant = self._plants.get(plant_code.upper())
+        if plant is None:
             raise ValidationError(f"Worker import: Plant not found for code '{plant_code}'")
 
         # attach plant to row so widget mapping works
         row["plant"] = plant.code
 
         if pl_code:
-            pl_qs = ProductionLine.objects.filter(plant=plant, code__iexact=pl_code)
-            if not pl_qs.exists():
-                # create automatically in clean rebuild scenarios
-                ProductionLine.objects.create(plant=plant, code=pl_code, name=pl_code)
-            row["production_line"] = pl_code
+            line = self._lines.get((plant.code.upper(), pl_code.upper()))
+            row["production_line"] = line.code if line else pl_code
         else:
             row["production_line"] = ""
 
 
-class PartyResource(resources.ModelResource):
+class PartyResource(BulkImportMixin, resources.ModelResource):
+    # party_code is unique case-insensitively (masters_party_code_ci_uniq)
+    case_insensitive_keys = True
+
     class Meta:
         model = Party
+        skip_unchanged = True
+        report_skipped = True
+        use_bulk = True
+        batch_size = IMPORT_BATCH_SIZE
         import_id_fields = ("party_code",)
         fields = ("party_code", "name", "contact_person", "contact_number", "email", "tax_id", "is_vendor", "is_customer", "active")
         export_order = ("party_code", "name", "contact_person", "contact_number", "email", "tax_id", "is_vendor", "is_customer", "active")
 
 
+def _prehash_password_column(dataset, strip=False):
+    """
+    The dataset with its `password` values hashed in a process pool (values
+    that already are hashes are kept), so per-row saves no longer hash
+    serially. Returns a copy; the caller's dataset is left as it was.
+    """
+    if "password" not in (dataset.headers or []) or not len(dataset):
+        return dataset
+    values = [_clean_code(v) if strip else v for v in dataset["password"]]
+    col = dataset.headers.index("password")
+    hashed = tablib.Dataset(headers=dataset.headers, title=dataset.title)
+    for data_row, value in zip(dataset, hash_passwords(values)):
+        data_row = list(data_row)
+        data_row[col] = value
+        hashed.append(data_row)
+    return hashed
+
+
 class UserResource(resources.ModelResource):
     class Meta:
         model = User
@@ -119,10 +475,25 @@ class UserResource(resources.ModelResource):
         fields = ("username", "email", "first_name", "last_name", "is_staff", "is_superuser", "is_active", "password")
         export_order = ("username", "email", "first_name", "last_name", "is_staff", "is_superuser", "is_active")
 
-    def before_save_instance(self, instance, using_transactions, dry_run=False):
-        pwd = getattr(instance, "password", None)
-        if pwd and not pwd.startswith("pbkdf2_"):
-            instance.set_password(pwd)
+    def import_data(self, dataset, dry_run=False, *args, **kwargs):
+        # here rather than in before_import, which is not told about dry_run; a preview hashes nothing
+        if not dry_run:
+            dataset = _prehash_password_column(dataset)
+        return super().import_data(dataset, dry_run, *args, **kwargs)
+
+    def import_field(self, field, instance, row, *args, **kwargs):
+        # an empty password cell keeps the stored password
+        if field.attribute == "password" and not _clean_code(row.get(field.column_name)):
+            return
+        super().import_field(field, instance, row, *args, **kwargs)
+
+    def before_save_instance(self, instance, *args, **kwargs):
+        if _is_dry_run(args, kwargs):
+            return
+        if instance.password:
+            set_user_password(instance, instance.password)
+        elif instance.pk is None:
+            instance.set_unusable_password()
 
 
 class UserProfileResource(resources.ModelResource):
@@ -134,7 +505,7 @@ class UserProfileResource(resources.ModelResource):
     is_staff = fields.Field(column_name="is_staff")
     is_superuser = fields.Field(column_name="is_superuser")
     is_active = fields.Field(column_name="is_active")
-    password = fields.Field(column_name="password")  # plaintext; hashed before saving
+    password = fields.Field(column_name="password")  # plaintext or an existing hash (see set_user_password)
 
     plant_code = fields.Field(column_name="plant_code")
     is_plant_admin = fields.Field(column_name="is_plant_admin")
@@ -147,19 +518,62 @@ class UserProfileResource(resources.ModelResource):
             "plant_code", "is_plant_admin",
         )
 
+    def import_data(self, dataset, dry_run=False, *args, **kwargs):
+        # here rather than in before_import, which is not told about dry_run; a preview hashes nothing
+        if not dry_run:
+            dataset = _prehash_password_column(dataset, strip=True)
+        # profile -> user sync runs once for the whole file instead of per saved row
+        with suspend_profile_sync() as pending:
+            result = super().import_data(dataset, dry_run, *args, **kwargs)
+            if dry_run or result.has_errors() or result.has_validation_errors():
+                # the import was rolled back; there is nothing to sync
+                pending.clear()
+        return result
+
+    def before_import(self, dataset, *args, **kwargs):
+        super().before_import(dataset, *args, **kwargs)
+        # plants referenced by the file, keyed by upper-case code (one query per chunk, uses the Upper(code) index)
+        col = _column(dataset, "plant_code")
+        codes = {_clean_code(v).upper() for v in dataset.get_col(col)} - {""} if col is not None else set()
+        self._plants = {}
+        for chunk in _chunked(codes, IMPORT_BATCH_SIZE):
+            self._plants.update(
+                (p.code.upper(), p) for p in Plant.objects.annotate(code_upper=Upper("code")).filter(code_upper__in=chunk)
+            )
+
+        # users (with their profiles) named in the file, keyed by upper-case username
+        col = _column(dataset, "username")
+        names = {_clean_code(v).upper() for v in dataset.get_col(col)} - {""} if col is not None else set()
+        self._users = {}
+        for chunk in _chunked(names, IMPORT_BATCH_SIZE):
+            self._users.update(
+                (u.username.upper(), u)
+                for u in User.objects.select_related("profile").annotate(username_upper=Upper("username")).filter(username_upper__in=chunk)
+            )
+
+    def get_instance(self, instance_loader, row):
+        # "username" is not a UserProfile attribute, so the default instance loader cannot use it
+        username = (row.get("username") or "").strip()
+        if not username:
+            return None
+        return getattr(self._users.get(username.upper()), "profile", None)
+
     def before_import_row(self, row, **kwargs):
         # normalize whitespace on incoming row values
         for k, v in list(row.items()):
             if isinstance(v, str):
                 row[k] = v.strip()
+        # none of the CSV columns map to a UserProfile attribute; before_save_instance reads them from here
+        self._row = row
 
-    def before_save_instance(self, instance, using_transactions, dry_run=False):
+    def before_save_instance(self, instance, *args, **kwargs):
         """
         Ensure a User exists and is synced from profile fields before saving the UserProfile.
         In dry_run mode we perform validation only (do not create/write User).
         """
-        # Determine username from instance or attached user
-        username_val = getattr(instance, "username", None)
+        row = getattr(self, "_row", {})
+        # Determine username from the row or attached user
+        username_val = row.get("username")
         if not username_val:
             # If instance.user exists and has username, use it
             user_obj = getattr(instance, "user", None)
@@ -169,88 +583,59 @@ class UserProfileResource(resources.ModelResource):
         if not username_val:
             raise ValidationError("CSV must include 'username' column for UserProfile import.")
 
-        # Normalize booleans and simple fields pulled from instance attributes
-        # import-export may set these as attributes on the instance
-        email_val = getattr(instance, "email", None)
-        first_name_val = getattr(instance, "first_name", None)
-        last_name_val = getattr(instance, "last_name", None)
-        pwd_val = getattr(instance, "password", None)
-        is_staff_val = getattr(instance, "is_staff", None)
-        is_superuser_val = getattr(instance, "is_superuser", None)
-        is_active_val = getattr(instance, "is_active", None)
-        plant_code_val = getattr(instance, "plant_code", None)
-        ipa_val = getattr(instance, "is_plant_admin", None)
+        # Normalize booleans and simple fields pulled from the row (None when the column is absent)
+        email_val = row.get("email")
+        first_name_val = row.get("first_name")
+        last_name_val = row.get("last_name")
+        is_staff_val = row.get("is_staff")
+        is_superuser_val = row.get("is_superuser")
+        is_active_val = row.get("is_active")
+        plant_code_val = row.get("plant_code")
+        ipa_val = row.get("is_plant_admin")
 
         # Resolve plant if provided (validate)
         if plant_code_val:
-            try:
-                plant = Plant.objects.get(code__iexact=plant_code_val)
-                instance.plant = plant
-            except Plant.DoesNotExist:
+            plant = getattr(self, "_plants", {}).get(str(plant_code_val).strip().upper())
+            if plant is None:
                 raise ValidationError(f"Plant with code '{plant_code_val}' not found.")
+            instance.plant = plant
 
         # Interpret IPA boolean
         instance.is_plant_admin = ipa_val in (True, "True", "true", "1", 1, "1")
 
         # Now handle the User creation/sync
-        if dry_run:
-            # Dry-run: validate existence/values but do not create DB objects
-            user_exists = User.objects.filter(username__iexact=username_val).exists()
-            # It's okay if user doesn't exist in dry-run; we'll create on real run.
-            # But validate provided booleans or password formats if you want (optional)
-            return super().before_save_instance(instance, using_transactions, dry_run=dry_run)
-
-        # Non-dry-run: create or update user and attach before saving profile
-        with transaction.atomic():
-            user = User.objects.filter(username__iexact=username_val).first()
-            created_user = False
-            if not user:
-                user = User(username=username_val)
-                created_user = True
-
-            # Apply fields from profile CSV to user (profile is source-of-truth for creation/import)
-            if email_val is not None:
-                user.email = email_val
-            if first_name_val is not None:
-                user.first_name = first_name_val
-            if last_name_val is not None:
-                user.last_name = last_name_val
-            if is_staff_val is not None:
-                user.is_staff = str(is_staff_val) in ("True", "true", "1", "1.0", True)
-            if is_superuser_val is not None:
-                user.is_superuser = str(is_superuser_val) in ("True", "true", "1", "1.0", True)
-            if is_active_val is not None:
-                user.is_active = str(is_active_val) in ("True", "true", "1", "1.0", True)
-
-            # Password handling: set if provided, else if new user set unusable password
-            if pwd_val:
-                user.set_password(pwd_val)
-            elif created_user and not user.has_usable_password():
-                user.set_unusable_password()
-
-            user.save()
-
-            # Attach user to profile instance so profile save has valid FK
-            instance.user = user
-
-            # Store transient attrs for downstream signals/helpers if needed
-            if email_val is not None:
-                setattr(instance, "_email", email_val)
-            if first_name_val is not None:
-                setattr(instance, "_first_name", first_name_val)
-            if last_name_val is not None:
-                setattr(instance, "_last_name", last_name_val)
-            if is_staff_val is not None:
-                setattr(instance, "_is_staff", str(is_staff_val) in ("True", "true", "1", "1.0", True))
-            if is_superuser_val is not None:
-                setattr(instance, "_is_superuser", str(is_superuser_val) in ("True", "true", "1", "1.0", True))
-            if is_active_val is not None:
-                setattr(instance, "_is_active", str(is_active_val) in ("True", "true", "1", "1.0", True))
-            if pwd_val:
-                setattr(instance, "_password_plain", pwd_val)
-
-            # mark origin/timestamp so signals know this was an import-driven profile change
-            setattr(instance, "_update_origin", "import")
-            setattr(instance, "_updated_at", timezone.now())
-
-        return super().before_save_instance(instance, using_transactions, dry_run=dry_run)
\ No newline at end of file
+        if _is_dry_run(args, kwargs):
+            # Dry-run: do not create DB objects; a missing user is created on the real run.
+            # (validation.validate_file checks whole files without per-row queries)
+            return super().before_save_instance(instance, *args, **kwargs)
+
+        # Non-dry-run: carry the row's user columns on the profile as transient attrs; the
+        # profile -> user sync (signals.userprofile_post_save) writes them to an existing user
+        if email_val is not None:
+            setattr(instance, "_email", email_val)
+        if first_name_val is not None:
+            setattr(instance, "_first_name", first_name_val)
+        if last_name_val is not None:
+            setattr(instance, "_last_name", last_name_val)
+        if is_staff_val is not None:
+            setattr(instance, "_is_staff", str(is_staff_val) in ("True", "true", "1", "1.0", True))
+        if is_superuser_val is not None:
+            setattr(instance, "_is_superuser", str(is_superuser_val) in ("True", "true", "1", "1.0", True))
+        if is_active_val is not None:
+            setattr(instance, "_is_active", str(is_active_val) in ("True", "true", "1", "1.0", True))
+        pwd_val = row.get("password")
+        if pwd_val:
+            # already hashed by import_data
+            setattr(instance, "_password_hash", pwd_val if is_password_hash(pwd_val) else make_password(pwd_val))
+
+        # mark origin/timestamp so signals know this was an import-driven profile change
+        setattr(instance, "_update_origin", "import")
+        setattr(instance, "_updated_at", timezone.now())
+
+        # a missing user is created now, since the profile row needs it
+        user = self._users.get(username_val.upper())
+        if user is None:
+            user = self._users[username_val.upper()] = create_user_for_profile(instance, username_val)
+        instance.user = user
+
+        return super().before_save_instance(instance, *args, **kwargs)
\ No newline at end of file
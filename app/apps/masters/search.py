@@ -0,0 +1,257 @@
+# apps/masters/search.py
+"""
+Server-side live search for the masters changelists.
+
+The search box on a changelist (static/js/live_search.js) queries
+/masters/search/<model>/?q=... while the user types. It gets back at most
+`limit` rows from the whole table. Rows where one of the searched fields
+starts with the term come first. Rows that only contain it come after.
+Only the columns needed for the dropdown are read.
+
+Matching is case-insensitive and backed by trigram indexes (migration 0009):
+
+- PostgreSQL: pg_trgm GIN indexes on UPPER(field), the expression Django's
+  istartswith / icontains lookups compile to.
+- SQLite: FTS5 tables with the trigram tokenizer, kept in sync by triggers.
+  They narrow the candidate rows before the LIKE filters run. Django
+  rebuilds a SQLite table for most ALTERs, which drops its triggers and
+  leaves the FTS table stale. A model is only narrowed through FTS while
+  all its tables still have their three triggers; otherwise the search
+  falls back to the plain LIKE filters and logs a warning. Re-run migration
+  0009 to restore them.
+
+Terms shorter than MIN_SUBSTRING_LENGTH only match as prefixes: one or two
+characters would hit most of a large table as a substring, and trigrams
+cannot narrow them.
+
+component_choices() backs the BOM item component autocomplete. It only
+offers active, non-FG ProductPlant rows of active products in the BOM's
+plant whose product code starts with the term. The match uses the prefix
+index on the product code from migration 0010. Results for short prefixes,
+the ones typed on every keystroke, are cached for
+MASTERS_COMPONENT_CACHE_SECONDS. A longer term is then answered from a
+cached shorter prefix whenever that result held every match.
+
+Cached results are keyed on a generation counter per plant plus a global
+one. invalidate_components() bumps them after a ProductPlant or Product
+changes (signals.py, bulk imports, provisioning), which orphans the old
+entries. The cache time then only bounds writes that bypass those paths,
+e.g. QuerySet.update() from a shell.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from functools import reduce
+from operator import or_
+from typing import Dict, List, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .models import Party, Plant, Product, ProductGroup, ProductPlant, Worker
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+MIN_SUBSTRING_LENGTH = 3
+
+COMPONENT_LIMIT = 30
+# terms up to this many characters are cached
+COMPONENT_CACHE_PREFIX = 3
+COMPONENT_CACHE_SECONDS = getattr(settings, "MASTERS_COMPONENT_CACHE_SECONDS", 60)
+
+
+@dataclass(frozen=True)
+class SearchSpec:
+    model: type
+    # lookup paths matched against the term
+    fields: Tuple[str, ...]
+    # values() columns: the first is the dropdown label, the others its detail line
+    columns: Tuple[str, ...]
+    ordering: Tuple[str, ...]
+    # SQLite FTS5 tables that can narrow the search: (table, FK column or "id")
+    fts: Tuple[Tuple[str, str], ...] = ()
+
+
+SEARCH_MODELS: Dict[str, SearchSpec] = {
+    "plant": SearchSpec(
+        Plant, ("code", "name"), ("code", "name"), ("code",),
+        fts=(("masters_plant_fts", "id"),),
+    ),
+    "product": SearchSpec(
+        Product, ("code", "name"), ("code", "name", "product_group"), ("code",),
+        fts=(("masters_product_fts", "id"),),
+    ),
+    "productplant": SearchSpec(
+        ProductPlant, ("product__code", "product__name", "plant__code", "code"),
+        ("product__code", "plant__code", "product__name", "code"), ("product__code", "plant__code"),
+        fts=(("masters_productplant_fts", "id"), ("masters_product_fts", "product_id"), ("masters_plant_fts", "plant_id")),
+    ),
+    "party": SearchSpec(
+        Party, ("party_code", "name", "tax_id"), ("party_code", "name"), ("party_code",),
+        fts=(("masters_party_fts", "id"),),
+    ),
+    "worker": SearchSpec(
+        Worker, ("code", "name"), ("code", "name", "plant__code"), ("plant__code", "code"),
+        fts=(("masters_worker_fts", "id"),),
+    ),
+}
+
+logger = logging.getLogger(__name__)
+
+FTS_TRIGGER_SUFFIXES = ("ai", "ad", "au")
+
+# alias -> FTS tables whose sync triggers are all in place
+_fts_available: Dict[str, Set[str]] = {}
+
+
+def _synced_fts_tables(connection) -> Set[str]:
+    if connection.vendor != "sqlite":
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        objects = cursor.fetchall()
+    tables = {name for kind, name in objects if kind == "table" and name.endswith("_fts")}
+    triggers = {name for kind, name in objects if kind == "trigger"}
+    synced = {t for t in tables if all(f"{t}_{suffix}" in triggers for suffix in FTS_TRIGGER_SUFFIXES)}
+    if tables - synced:
+        logger.warning(
+            "FTS table(s) %s lost their sync triggers (table rebuilt?); searching without them. "
+            "Re-run migration masters 0009 to restore them.", ", ".join(sorted(tables - synced)),
+        )
+    return synced
+
+
+def _has_fts(alias: str, spec: SearchSpec) -> bool:
+    if alias not in _fts_available:
+        _fts_available[alias] = _synced_fts_tables(connections[alias])
+    return bool(spec.fts) and all(table in _fts_available[alias] for table, _column in spec.fts)
+
+
+def _fts_candidates(spec: SearchSpec, term: str) -> Q:
+    """Rows whose FTS entry (or an FTS entry of a related row) contains term."""
+    phrase = '"%s"' % term.replace('"', '""')
+    conditions = []
+    for table, column in spec.fts:
+        subquery = RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", (phrase,))
+        conditions.append(Q(**{f"{column}__in": subquery}))
+    return reduce(or_, conditions)
+
+
+def _match(spec: SearchSpec, lookup: str, term: str) -> Q:
+    return reduce(or_, (Q(**{f"{name}__{lookup}": term}) for name in spec.fields))
+
+
+def search(key: str, term: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+    """
+    Up to `limit` rows of SEARCH_MODELS[key] matching `term`: prefix matches
+    first, then substring matches, each group in the model's list order.
+    """
+    spec = SEARCH_MODELS[key]
+    term = term.strip()
+    limit = max(1, min(limit, MAX_LIMIT))
+    if not term:
+        return []
+    queryset = spec.model._default_manager.all()
+    substring = len(term) >= MIN_SUBSTRING_LENGTH
+    if substring and _has_fts(queryset.db, spec):
+        queryset = queryset.filter(_fts_candidates(spec, term))
+    columns = ("pk",) + spec.columns
+
+    prefix = _match(spec, "istartswith", term)
+    rows = list(queryset.filter(prefix).order_by(*spec.ordering).values_list(*columns)[:limit])
+    if substring and len(rows) < limit:
+        rows += list(
+            queryset.filter(_match(spec, "icontains", term)).exclude(prefix)
+            .order_by(*spec.ordering).values_list(*columns)[:limit - len(rows)]
+        )
+
+    url_name = f"admin:{spec.model._meta.app_label}_{spec.model._meta.model_name}_change"
+    return [
+        {
+            "id": pk,
+            "label": str(label),
+            "detail": " · ".join(str(v) for v in detail if v not in (None, "")),
+            "url": reverse(url_name, args=[pk]),
+        }
+        for pk, label, *detail in rows
+    ]
+
+
+def _generation_key(plant_id) -> str:
+    return f"masters:components:gen:{plant_id or 'all'}"
+
+
+def _component_generation(plant_id) -> str:
+    keys = [_generation_key(None), _generation_key(plant_id)]
+    generations = cache.get_many(keys)
+    return ".".join(str(generations.get(key, 0)) for key in keys)
+
+
+def _component_key(plant_id, generation: str, prefix: str) -> str:
+    # hex keeps arbitrary search text within what every cache backend accepts as a key
+    return f"masters:components:{plant_id or 0}:{generation}:{prefix.encode().hex()}"
+
+
+def _bump_generation(plant_id):
+    key = _generation_key(plant_id)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def invalidate_components(plant_id=None):
+    """
+    Drop the cached component results of `plant_id` (of every plant when
+    None) once the current transaction commits, so a concurrent request
+    cannot cache the old rows again.
+    """
+    transaction.on_commit(lambda: _bump_generation(plant_id))
+
+
+def _component_rows(plant_id, term: str, limit: int) -> List[tuple]:
+    queryset = (
+        ProductPlant.objects.filter(active=True, product__active=True)
+        .exclude(product__product_group=ProductGroup.FINISHED_GOOD)
+    )
+    if plant_id:
+        queryset = queryset.filter(plant_id=plant_id)
+    if term:
+        queryset = queryset.filter(product__code__istartswith=term)
+    rows = queryset.order_by("product__code", "pk").values_list("pk", "product__code", "plant__code", "product__name")
+    return [(pk, code, f"{code}@{plant} - {name}") for pk, code, plant, name in rows[:limit]]
+
+
+def component_choices(plant_id, term: str, limit: int = COMPONENT_LIMIT) -> List[Tuple[int, str]]:
+    """
+    (pk, label) of up to `limit` ProductPlant rows usable as BOM components of
+    `plant_id` (any plant when None) whose product code starts with `term`.
+    """
+    term = term.strip().upper()
+    limit = max(1, min(limit, COMPONENT_LIMIT))
+    prefixes = [term[:i] for i in range(min(len(term), COMPONENT_CACHE_PREFIX), -1, -1)]
+    generation = _component_generation(plant_id)
+    cached = cache.get_many([_component_key(plant_id, generation, p) for p in prefixes])
+    for prefix in prefixes:
+        hit = cached.get(_component_key(plant_id, generation, prefix))
+        if hit is None:
+            continue
+        rows, complete = hit
+        if prefix == term:
+            return [(pk, label) for pk, _code, label in rows[:limit]]
+        if complete:
+            # the cached prefix result holds every match, so narrow it here
+            return [(pk, label) for pk, code, label in rows if code.upper().startswith(term)][:limit]
+
+    rows = _component_rows(plant_id, term, COMPONENT_LIMIT + 1)
+    complete = len(rows) <= COMPONENT_LIMIT
+    rows = rows[:COMPONENT_LIMIT]
+    if len(term) <= COMPONENT_CACHE_PREFIX:
+        cache.set(_component_key(plant_id, generation, term), (rows, complete), COMPONENT_CACHE_SECONDS)
+    return [(pk, label) for pk, _code, label in rows[:limit]]
@@ -0,0 +1,151 @@
+# apps/masters/services.py
+"""
+Set-based operations on master data that would otherwise run one row at a time.
+"""
+from __future__ import annotations
+
+import datetime
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Optional
+
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
+
+from . import changelog, search
+from .models import BOMHeader, BOMItem, Plant, Product, ProductPlant
+
+# Preference among several BOMs valid on the same date: the most specific window (latest
+# effective_from, undated last), then the newest version; is_active only breaks remaining ties,
+# so a dated historical BOM beats the current undated one for dates inside its window.
+RESOLUTION_ORDER = (F("effective_from").desc(nulls_last=True), "-version", "-is_active")
+
+
+def resolve_boms(product_plant_ids: Iterable[int], as_of: datetime.date) -> Dict[int, BOMHeader]:
+    """
+    Return {product_plant_id: BOMHeader valid on `as_of`} in one query.
+    Product plants without a BOM valid on that date are omitted.
+    """
+    qs = (
+        BOMHeader.objects.filter(product_plant_id__in=list(product_plant_ids))
+        .effective_on(as_of)
+        .order_by("product_plant_id", *RESOLUTION_ORDER)
+    )
+    if connection.features.can_distinct_on_fields:
+        return {bom.product_plant_id: bom for bom in qs.distinct("product_plant_id")}
+    resolved: Dict[int, BOMHeader] = {}
+    for bom in qs:
+        resolved.setdefault(bom.product_plant_id, bom)
+    return resolved
+
+
+@dataclass
+class DuplicationSummary:
+    created: int = 0
+    items: int = 0
+    mapping: Dict[int, int] = field(default_factory=dict)  # original bom id -> new bom id
+
+
+def duplicate_boms(boms: Iterable[BOMHeader], user=None, batch_size: int = 1000) -> DuplicationSummary:
+    """
+    Copy BOMs (header + items) as new inactive versions in one transaction:
+    headers via BOMHeader.objects.bulk_create_versions(), items via one
+    SELECT and batched bulk_create, regardless of how many BOMs are copied.
+    """
+    originals = list(boms)
+    summary = DuplicationSummary()
+    if not originals:
+        return summary
+    with transaction.atomic():
+        copies = [
+            BOMHeader(
+                product_plant_id=bom.product_plant_id,
+                is_active=False,
+                effective_from=bom.effective_from,
+                effective_to=bom.effective_to,
+                scrap_percent=bom.scrap_percent,
+                overhead_cost=bom.overhead_cost,
+                notes=f"Duplicated from v{bom.version}: {bom.notes or ''}",
+                created_by=user,
+            )
+            for bom in originals
+        ]
+        BOMHeader.objects.bulk_create_versions(copies, batch_size=batch_size)
+        summary.mapping = {bom.pk: copy.pk for bom, copy in zip(originals, copies)}
+        items = BOMItem.objects.filter(bom_id__in=list(summary.mapping)).order_by("id").values_list("bom_id", "component_id", "quantity")
+        created_items = BOMItem.objects.bulk_create(
+            [BOMItem(bom_id=summary.mapping[bom_id], component_id=component_id, quantity=qty) for bom_id, component_id, qty in items],
+            batch_size=batch_size,
+        )
+    summary.created = len(copies)
+    summary.items = len(created_items)
+    return summary
+
+
+@dataclass
+class ProvisionSummary:
+    # pairs that did not exist before their batch was inserted
+    created: int = 0
+    scanned: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+
+def provision_product_plants(plant: Plant, groups: Optional[Iterable[str]] = None, batch_size: int = 2000,
+                             progress: Optional[Callable[[ProvisionSummary], None]] = None) -> ProvisionSummary:
+    """
+    Create the missing ProductPlant rows for `plant`, inheriting code/name/active
+    from Product like ProductPlant.get_or_inherit(). Missing pairs are found with
+    one anti-join and inserted with bulk_create(ignore_conflicts=True) per batch,
+    so concurrent provisioning of the same plant is harmless.
+    `progress` is called with the running summary after every batch.
+    """
+    summary = ProvisionSummary()
+    started = time.monotonic()
+    missing = Product.objects.filter(~Exists(ProductPlant.objects.filter(product=OuterRef("pk"), plant=plant)))
+    if groups:
+        missing = missing.filter(product_group__in=list(groups))
+    rows = missing.order_by("pk").values_list("pk", "code", "name", "active").iterator(chunk_size=batch_size)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            summary.created += _insert_product_plants(plant, batch)
+            summary.scanned += len(batch)
+            batch = []
+            summary.elapsed = time.monotonic() - started
+            if progress:
+                progress(summary)
+    if batch:
+        summary.created += _insert_product_plants(plant, batch)
+        summary.scanned += len(batch)
+        summary.elapsed = time.monotonic() - started
+        if progress:
+            progress(summary)
+    summary.elapsed = time.monotonic() - started
+    return summary
+
+
+def _insert_product_plants(plant, rows) -> int:
+    """Insert the batch and return how many rows were actually created."""
+    product_ids = [pk for pk, _code, _name, _active in rows]
+    batch = ProductPlant.objects.filter(plant=plant, product_id__in=product_ids)
+    # ignore_conflicts returns every object whether or not it was inserted, so count the pairs before and after
+    existing = set(batch.values_list("product_id", flat=True))
+    objs = [
+        ProductPlant(product_id=pk, plant=plant, code=code, name=name, active=active, standard_cost=Decimal("0.0"))
+        for pk, code, name, active in rows
+        if pk not in existing
+    ]
+    # ignore_conflicts: rows created concurrently since the anti-join are skipped
+    ProductPlant.objects.bulk_create(objs, ignore_conflicts=True)
+    created = [pk for pk, product_id in batch.values_list("pk", "product_id") if product_id not in existing]
+    # ignore_conflicts returns no pks; bulk_create sends no post_save for the delta change log
+    changelog.record_changes(ProductPlant, created)
+    search.invalidate_components(plant.pk)
+    return len(created)
@@ -1,129 +1,208 @@
 # garment_app/signals.py
-from django.db.models.signals import post_save
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.db import transaction
 
-from .models import UserProfile
+from . import changelog, closure, costing, search
+from .models import BOMHeader, BOMItem, Party, Plant, Product, ProductPlant, UserProfile
 
 User = get_user_model()
 
-# Helper to update/create User from profile
-def _apply_profile_to_user(profile):
+# ---------------------
+# Profile <-> User sync
+#
+# The diff is computed once, in the post_save receiver, from the in-memory
+# profile/user. After commit it is written with at most one UPDATE per table
+# (only the changed columns). QuerySet.update() sends no post_save, so the
+# sync cannot bounce back and forth between the two receivers.
+#
+# The profile admin and the profile import only create a missing user (the
+# profile row needs it); an existing user gets the profile's changes from
+# userprofile_post_save.
+# ---------------------
+logger = logging.getLogger(__name__)
+
+# User columns a profile may carry as transient `_<name>` attributes (set by the profile admin / import)
+PROFILE_USER_FIELDS = ("username", "email", "first_name", "last_name", "is_staff", "is_superuser", "is_active")
+
+
+def profile_user_changes(profile, user) -> dict:
+    """User columns whose values differ from the ones carried on the profile."""
+    changes = {}
+    for name in PROFILE_USER_FIELDS:
+        attr = f"_{name}"
+        if hasattr(profile, attr) and getattr(user, name) != getattr(profile, attr):
+            changes[name] = getattr(profile, attr)
+    # always an encoded password (hashed once by the admin / import)
+    password = getattr(profile, "_password_hash", None)
+    if password and password != user.password:
+        changes["password"] = password
+    return changes
+
+
+def user_profile_changes(user, profile) -> dict:
+    """Profile columns whose values differ from the ones carried on the user (all of them when there is no profile yet)."""
+    changes = {}
+    if hasattr(user, "_is_plant_admin") and (profile is None or profile.is_plant_admin != user._is_plant_admin):
+        changes["is_plant_admin"] = user._is_plant_admin
+    return changes
+
+
+def create_user_for_profile(profile, username):
     """
-    Apply relevant fields from profile to linked User.
-    Uses optimistic timestamp check against profile.last_synced_to_user to avoid needless writes.
+    A new user carrying the profile's transient `_<field>` values, saved now
+    because the profile row needs it (the sync only updates existing users).
     """
-    # gather profile timestamps
-    profile_ts = getattr(profile, "_updated_at", None) or profile.updated_at
-    if profile.last_synced_to_user and profile_ts and profile_ts <= profile.last_synced_to_user:
-        # profile changes already synced or older than last sync -> skip
-        return
+    user = User(username=username)
+    for name in PROFILE_USER_FIELDS:
+        if hasattr(profile, f"_{name}"):
+            setattr(user, name, getattr(profile, f"_{name}"))
+    password = getattr(profile, "_password_hash", None)
+    if password:
+        user.password = password
+    else:
+        user.set_unusable_password()
+    user.save()
+    return user
+
+
+def _on_commit(func, *args):
+    def run():
+        try:
+            func(*args)
+        except Exception:
+            # the triggering save is already committed; log instead of failing the request
+            logger.exception("Profile/user sync failed")
+    transaction.on_commit(run)
+
+
+def _push_profile_to_user(profile_id, user_id, changes, synced_at):
+    if changes:
+        User.objects.filter(pk=user_id).update(**changes)
+    UserProfile.objects.filter(pk=profile_id).update(last_synced_to_user=synced_at)
 
-    # ensure user exists
-    user = profile.user
-    # Update user fields from profile if they differ. We only update a minimal set (username/email, is_staff/is_superuser,is_active,name)
-    changed = False
-    # You may want to map additional fields from profile (not present now)
-    # For safety, we'll only update username/email/is_active/is_staff/is_superuser if attributes exist on profile (via transient attrs)
-    uattrs = {}
-    if hasattr(profile, "_username"):
-        uattrs["username"] = profile._username
-    if hasattr(profile, "_email"):
-        uattrs["email"] = profile._email
-    if hasattr(profile, "_first_name"):
-        uattrs["first_name"] = profile._first_name
-    if hasattr(profile, "_last_name"):
-        uattrs["last_name"] = profile._last_name
-    if hasattr(profile, "_is_staff"):
-        uattrs["is_staff"] = profile._is_staff
-    if hasattr(profile, "_is_superuser"):
-        uattrs["is_superuser"] = profile._is_superuser
-    if hasattr(profile, "_is_active"):
-        uattrs["is_active"] = profile._is_active
-    if hasattr(profile, "_password_plain") and profile._password_plain:
-        # set password
-        user.set_password(profile._password_plain)
-        changed = True
-
-    # apply collected attrs
-    for k, v in uattrs.items():
-        if getattr(user, k, None) != v:
-            setattr(user, k, v)
-            changed = True
-
-    if changed:
-        # mark that this save originates from sync to avoid reverse sync
-        setattr(user, "_update_origin", "sync_from_profile")
-        setattr(user, "_updated_at", timezone.now())
-        user.save()
-    # update profile.last_synced_to_user
-    profile.last_synced_to_user = timezone.now()
-    profile.save(update_fields=["last_synced_to_user"])
-
-
-# Helper to apply user -> profile updates
-def _apply_user_to_profile(user):
+
+def _pull_user_into_profile(user_id, changes, synced_at):
+    if not UserProfile.objects.filter(user_id=user_id).update(last_synced_from_user=synced_at, **changes):
+        UserProfile.objects.get_or_create(user_id=user_id, defaults={"last_synced_from_user": synced_at, **changes})
+
+
+# ---------------------
+# Bulk mode: suspend_profile_sync()
+# ---------------------
+_suspended = threading.local()
+SYNC_BATCH_SIZE = getattr(settings, "MASTERS_IMPORT_BATCH_SIZE", 1000)
+
+
+@dataclass
+class PendingSync:
+    """Diffs recorded by the receivers while the sync is suspended (later entries win)."""
+    to_user: Dict[int, Tuple[int, dict]] = field(default_factory=dict)   # profile_id -> (user_id, user changes)
+    to_profile: Dict[int, dict] = field(default_factory=dict)            # user_id -> profile changes
+
+    def clear(self):
+        """Forget the recorded work, e.g. when the saves that recorded it were rolled back."""
+        self.to_user.clear()
+        self.to_profile.clear()
+
+
+def _pending() -> Optional[PendingSync]:
+    stack = getattr(_suspended, "stack", None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def suspend_profile_sync(flush=True):
     """
-    Pull relevant fields from User into profile. Uses optimistic timestamp check
-    based on user._updated_at (set by admin save) vs profile.last_synced_from_user.
+    Record profile/user sync work instead of doing it per save, then apply it
+    in one set-based pass on exit: bulk_update() of the users grouped by
+    changed columns and one timestamp UPDATE per batch of profiles. Nothing is
+    applied when flush is False (e.g. a dry-run import) or the block raises.
+    Nested blocks flush into the outer one.
     """
+    stack = getattr(_suspended, "stack", None)
+    if stack is None:
+        stack = _suspended.stack = []
+    pending = PendingSync()
+    stack.append(pending)
     try:
-        profile = user.profile
-    except UserProfile.DoesNotExist:
-        # create a new profile if missing
-        profile = UserProfile.objects.create(user=user)
+        yield pending
+    finally:
+        stack.pop()
+    # not reached when the block raised
+    if not flush:
+        return
+    outer = _pending()
+    if outer is not None:
+        outer.to_user.update(pending.to_user)
+        outer.to_profile.update(pending.to_profile)
+    else:
+        flush_profile_sync(pending)
 
-    user_ts = getattr(user, "_updated_at", None)
-    if user_ts is None:
-        # no explicit update timestamp; proceed but guard with last_synced_from_user
-        user_ts = timezone.now()
 
-    if profile.last_synced_from_user and user_ts <= profile.last_synced_from_user:
-        return
+def _batches(items):
+    items = list(items)
+    for i in range(0, len(items), SYNC_BATCH_SIZE):
+        yield items[i:i + SYNC_BATCH_SIZE]
+
 
-    # Avoid loops: when we save profile as part of sync, mark origin
-    # Apply fields (we only map a minimal safe set)
-    changed = False
-    if getattr(profile, "plant", None) is None and hasattr(user, "_plant_code"):
-        # optional: resolve plant by code if provided on user transient attr
-        pass
-
-    # map name/email flags if present on user as transient attributes
-    if hasattr(user, "_email"):
-        if profile.user.email != user._email:
-            profile.user.email = user._email
-            profile.user.save(update_fields=["email"])
-    # Map other flags if provided
-    if hasattr(user, "_is_plant_admin"):
-        if profile.is_plant_admin != user._is_plant_admin:
-            profile.is_plant_admin = user._is_plant_admin
-            changed = True
-
-    if changed:
-        # prevent reverse-loop by setting marker
-        setattr(profile, "_update_origin", "sync_from_user")
-        profile.save()
-    profile.last_synced_from_user = timezone.now()
-    profile.save(update_fields=["last_synced_from_user"])
+def flush_profile_sync(pending: PendingSync):
+    now = timezone.now()
+    with transaction.atomic():
+        by_columns = defaultdict(dict)
+        for user_id, changes in pending.to_user.values():
+            if changes:
+                by_columns[tuple(sorted(changes))][user_id] = changes
+        for columns, users in by_columns.items():
+            objs = [User(pk=user_id, **changes) for user_id, changes in users.items()]
+            User.objects.bulk_update(objs, list(columns), batch_size=SYNC_BATCH_SIZE)
+        for ids in _batches(pending.to_user):
+            UserProfile.objects.filter(pk__in=ids).update(last_synced_to_user=now)
+
+        by_changes = defaultdict(list)
+        for user_id, changes in pending.to_profile.items():
+            by_changes[tuple(sorted(changes.items()))].append(user_id)
+        for changes, user_ids in by_changes.items():
+            changes = dict(changes)
+            existing = set()
+            for ids in _batches(user_ids):
+                UserProfile.objects.filter(user_id__in=ids).update(last_synced_from_user=now, **changes)
+                existing.update(UserProfile.objects.filter(user_id__in=ids).values_list("user_id", flat=True))
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user_id, last_synced_from_user=now, **changes) for user_id in user_ids if user_id not in existing],
+                batch_size=SYNC_BATCH_SIZE, ignore_conflicts=True,
+            )
 
 
 @receiver(post_save, sender=UserProfile)
-def userprofile_post_save(sender, instance: UserProfile, created, **kwargs):
+def userprofile_post_save(sender, instance: UserProfile, created, update_fields=None, **kwargs):
     """
     Sync forward to User when UserProfile is changed via profile UI or CSV import.
     Only run when origin indicates profile-driven change.
     """
-    origin = getattr(instance, "_update_origin", None)
-    if origin in ("profile_ui", "import", "profile_admin"):
-        # optimistic check already handled in helper
-        try:
-            with transaction.atomic():
-                _apply_profile_to_user(instance)
-        except Exception:
-            # avoid propagating exceptions from sync; admin / resource should report them separately
-            pass
+    if getattr(instance, "_update_origin", None) not in ("profile_ui", "import", "profile_admin"):
+        return
+    # optimistic check: nothing newer than the last push
+    profile_ts = getattr(instance, "_updated_at", None) or instance.updated_at
+    if instance.last_synced_to_user and profile_ts and profile_ts <= instance.last_synced_to_user:
+        return
+    changes = profile_user_changes(instance, instance.user)
+    pending = _pending()
+    if pending is not None:
+        pending.to_user[instance.pk] = (instance.user_id, changes)
+        return
+    _on_commit(_push_profile_to_user, instance.pk, instance.user_id, changes, timezone.now())
 
 
 @receiver(post_save, sender=User)
@@ -131,10 +210,110 @@ def user_post_save(sender, instance: User, created, **kwargs):
     """
     Sync to UserProfile when the User was edited via User admin (origin 'user_ui').
     """
-    origin = getattr(instance, "_update_origin", None)
-    if origin in ("user_ui",):
-        try:
-            with transaction.atomic():
-                _apply_user_to_profile(instance)
-        except Exception:
-            pass
+    if getattr(instance, "_update_origin", None) != "user_ui":
+        return
+    pending = _pending()
+    if pending is not None:
+        pending.to_profile[instance.pk] = user_profile_changes(instance, None)
+        return
+    try:
+        profile = instance.profile
+    except UserProfile.DoesNotExist:
+        profile = None
+    user_ts = getattr(instance, "_updated_at", None) or timezone.now()
+    if profile is not None and profile.last_synced_from_user and user_ts <= profile.last_synced_from_user:
+        return
+    _on_commit(_pull_user_into_profile, instance.pk, user_profile_changes(instance, profile), timezone.now())
+
+
+# ---------------------
+# BOM cost snapshot invalidation (see costing.schedule_invalidation)
+#
+# Compared with the values loaded with the instance (TracksLoadedValues), so a
+# save that leaves the cost fields unchanged (e.g. a full-form save) invalidates
+# nothing and costs no extra query.
+# ---------------------
+def _standard_cost_changed(instance, created, update_fields) -> bool:
+    changed = not created and "standard_cost" in instance.tracked_changes(update_fields)
+    instance.remember_loaded_values()
+    return changed
+
+
+@receiver(post_save, sender=ProductPlant)
+def productplant_cost_changed(sender, instance: ProductPlant, created, update_fields=None, **kwargs):
+    if _standard_cost_changed(instance, created, update_fields):
+        costing.schedule_invalidation(product_plants=[instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_cost_changed(sender, instance: Product, created, update_fields=None, **kwargs):
+    if not _standard_cost_changed(instance, created, update_fields):
+        return
+    # only plants falling back to the product cost are affected
+    pp_ids = list(ProductPlant.objects.filter(product=instance, standard_cost__lte=0).values_list("pk", flat=True))
+    costing.schedule_invalidation(product_plants=pp_ids)
+
+
+# ---------------------
+# BOM structure changes: closure index first, then costs (both run after commit)
+# ---------------------
+@receiver(post_save, sender=BOMItem)
+@receiver(post_delete, sender=BOMItem)
+def bomitem_changed(sender, instance: BOMItem, **kwargs):
+    closure.schedule_rebuild(boms=[instance.bom_id])
+    costing.schedule_invalidation(boms=[instance.bom_id])
+
+
+@receiver(post_save, sender=BOMHeader)
+def bomheader_saved(sender, instance: BOMHeader, created, update_fields=None, **kwargs):
+    changes = dict.fromkeys(instance.tracked_fields) if created else instance.tracked_changes(update_fields)
+    instance.remember_loaded_values()
+    if not changes:
+        return  # e.g. only notes or dates edited
+    # overhead or activation changed; activation also changes the parents' sub-assembly cost,
+    # and a BOM moved to another product plant leaves the old one without it
+    product_plants = [instance.product_plant_id] + [pp for pp in [changes.get("product_plant_id")] if pp]
+    closure.schedule_rebuild(product_plants=product_plants)
+    costing.schedule_invalidation(boms=[instance.pk], product_plants=product_plants)
+
+
+@receiver(post_delete, sender=BOMHeader)
+def bomheader_deleted(sender, instance: BOMHeader, **kwargs):
+    closure.schedule_rebuild(product_plants=[instance.product_plant_id])
+    costing.schedule_invalidation(product_plants=[instance.product_plant_id])
+
+
+# ---------------------
+# Delta change feed (see changelog.py); bulk writes record their rows themselves
+# ---------------------
+@receiver(post_save, sender=Plant)
+@receiver(post_save, sender=Party)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductPlant)
+def master_saved(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        changelog.record_changes(sender, [instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Plant)
+@receiver(post_delete, sender=Party)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductPlant)
+def master_deleted(sender, instance, using=None, **kwargs):
+    changelog.record_delete(instance, using=using)
+
+
+# ---------------------
+# BOM component autocomplete cache (see search.component_choices)
+# ---------------------
+@receiver(post_save, sender=ProductPlant)
+@receiver(post_delete, sender=ProductPlant)
+def productplant_components_changed(sender, instance: ProductPlant, **kwargs):
+    search.invalidate_components(instance.plant_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_components_changed(sender, instance: Product, **kwargs):
+    # code, name, group or active of every plant's rows of this product
+    search.invalidate_components()
@@ -0,0 +1,386 @@
+# apps/masters/tests.py
+import datetime
+import unittest
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import tablib
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+
+from . import services
+from .closure import rebuild_closure, where_used
+from .costing import BOMCycleError, rollup_costs
+from .delta import InvalidCursor, delta
+from .models import (
+    BOMHeader, BOMItem, DeltaChange, Party, Plant, Product, ProductGroup, ProductionLine, ProductPlant, UserProfile,
+)
+from .mrp import compute_requirements
+from .pagination import encode_cursor
+from .resources import PartyResource, ProductResource, UserProfileResource, UserResource
+from .services import provision_product_plants, resolve_boms
+from .utils import is_password_hash
+
+User = get_user_model()
+
+
+def make_product_plant(plant, code, group=ProductGroup.RAW_MATERIAL, standard_cost="0"):
+    product = Product.objects.create(code=code, name=code, product_group=group, standard_cost=Decimal(standard_cost))
+    return ProductPlant.objects.get_or_create(product=product, plant=plant)[0]
+
+
+def make_bom(product_plant, *lines, overhead="0"):
+    """Active BOM for product_plant with (component, quantity) lines."""
+    bom = BOMHeader.objects.create(product_plant=product_plant, overhead_cost=Decimal(overhead))
+    BOMItem.objects.bulk_create(BOMItem(bom=bom, component=component, quantity=Decimal(qty)) for component, qty in lines)
+    return bom
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "needs concurrent writers (PostgreSQL)")
+class BOMVersionConcurrencyTests(TransactionTestCase):
+    """BOM versions allocated from several threads at once (stress_bom_versions) stay unique with one active."""
+
+    def setUp(self):
+        plant = Plant.objects.create(code="STRESS", name="Stress plant")
+        product = Product.objects.create(code="STRESS-FG", name="Stress FG", product_group=ProductGroup.FINISHED_GOOD)
+        self.product_plant, _created = ProductPlant.objects.get_or_create(product=product, plant=plant)
+
+    def run_stress(self, *extra):
+        out = StringIO()
+        call_command(
+            "stress_bom_versions", str(self.product_plant.pk), "--threads", "8", "--per-thread", "10", "--keep",
+            *extra, stdout=out,
+        )
+        boms = BOMHeader.objects.filter(product_plant=self.product_plant)
+        duplicates = boms.values("version").annotate(n=Count("pk")).filter(n__gt=1)
+        self.assertEqual(boms.count(), 80, out.getvalue())
+        self.assertFalse(duplicates.exists(), list(duplicates))
+        self.assertEqual(boms.filter(is_active=True).count(), 1)
+
+    def test_concurrent_save(self):
+        self.run_stress()
+
+    def test_concurrent_bulk_create_versions(self):
+        self.run_stress("--bulk")
+
+
+class ProfileImportSyncTests(TestCase):
+    """UserProfileResource imports push user changes in one set-based pass (suspend_profile_sync)."""
+
+    def setUp(self):
+        for n in range(5):
+            UserProfile.objects.create(user=User.objects.create(username=f"sync{n}", email="old@example.com"))
+
+    def import_profiles(self, rows):
+        dataset = tablib.Dataset(headers=["username", "email", "plant_code"])
+        for row in rows:
+            dataset.append(row)
+        with CaptureQueriesContext(connection) as queries:
+            result = UserProfileResource().import_data(dataset, dry_run=False)
+        user_updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "auth_user"')]
+        return result, user_updates
+
+    def test_existing_users_updated_in_one_statement(self):
+        result, user_updates = self.import_profiles([[f"sync{n}", f"new{n}@example.com", ""] for n in range(5)])
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        self.assertEqual(len(user_updates), 1)
+        self.assertEqual(
+            sorted(User.objects.filter(username__startswith="sync").values_list("email", flat=True)),
+            [f"new{n}@example.com" for n in range(5)],
+        )
+        self.assertFalse(UserProfile.objects.filter(user__username__startswith="sync", last_synced_to_user=None).exists())
+
+    def test_failed_import_syncs_nothing(self):
+        result, user_updates = self.import_profiles([["sync0", "new0@example.com", ""], ["sync1", "new1@example.com", "NOPLANT"]])
+        self.assertTrue(result.has_validation_errors() or result.has_errors())
+        self.assertEqual(user_updates, [])
+        self.assertEqual(User.objects.get(username="sync0").email, "old@example.com")
+
+
+class CostInvalidationSignalTests(TestCase):
+    """Saves only invalidate cost snapshots / rebuild the closure when a field they depend on changed."""
+
+    def setUp(self):
+        plant = Plant.objects.create(code="INV", name="Invalidation plant")
+        product = Product.objects.create(code="INV-FG", name="FG", product_group=ProductGroup.FINISHED_GOOD)
+        self.product_plant, _created = ProductPlant.objects.get_or_create(product=product, plant=plant)
+        self.bom = BOMHeader.objects.create(product_plant=self.product_plant)
+
+    def test_unchanged_standard_cost_is_not_queried_or_invalidated(self):
+        product_plant = ProductPlant.objects.get(pk=self.product_plant.pk)
+        with mock.patch("apps.masters.signals.costing.schedule_invalidation") as invalidate:
+            with CaptureQueriesContext(connection) as queries:
+                product_plant.name = "renamed"
+                product_plant.save()
+            self.assertFalse(invalidate.called)
+            self.assertFalse([q for q in queries.captured_queries if q["sql"].startswith("SELECT") and "standard_cost" in q["sql"]])
+            product_plant.standard_cost = Decimal("2.5")
+            product_plant.save()
+            invalidate.assert_called_once_with(product_plants=[product_plant.pk])
+
+    def test_bom_header_edit_outside_cost_fields_schedules_nothing(self):
+        bom = BOMHeader.objects.get(pk=self.bom.pk)
+        with mock.patch("apps.masters.signals.closure.schedule_rebuild") as rebuild, \
+                mock.patch("apps.masters.signals.costing.schedule_invalidation") as invalidate:
+            bom.notes = "only a note"
+            bom.save()
+            self.assertFalse(rebuild.called or invalidate.called)
+            bom.overhead_cost = Decimal("1.0")
+            bom.save()
+            rebuild.assert_called_once_with(product_plants=[self.product_plant.pk])
+            invalidate.assert_called_once_with(boms=[bom.pk], product_plants=[self.product_plant.pk])
+
+
+class CostRollupTests(TestCase):
+    """Multi-level cost roll-up and requirements go through sub-assembly BOMs and refuse cycles."""
+
+    def setUp(self):
+        plant = Plant.objects.create(code="ROL", name="Roll-up plant")
+        self.fg = make_product_plant(plant, "ROL-FG", ProductGroup.FINISHED_GOOD)
+        self.wip = make_product_plant(plant, "ROL-WIP", ProductGroup.WIP)
+        self.fabric = make_product_plant(plant, "ROL-FAB", standard_cost="4")  # falls back to the product cost
+        self.fg_bom = make_bom(self.fg, (self.wip, "2"), overhead="1")
+        self.wip_bom = make_bom(self.wip, (self.fabric, "1.5"))
+
+    def test_rollup_through_sub_assemblies(self):
+        costs = rollup_costs([self.fg_bom.pk, self.wip_bom.pk])
+        self.assertEqual(costs, {self.fg_bom.pk: Decimal("13"), self.wip_bom.pk: Decimal("6")})
+        # single level in SQL: the WIP line is costed flat (no standard cost of its own)
+        self.assertEqual(BOMHeader.objects.with_total_cost().get(pk=self.fg_bom.pk).total_cost, Decimal("1"))
+
+    def test_requirements_explode_to_raw_materials(self):
+        self.assertEqual(compute_requirements({self.fg.pk: Decimal("10")}), {self.fabric.pk: Decimal("30")})
+
+    def test_cycle_is_refused(self):
+        make_bom(self.fabric, (self.wip, "1"))  # fabric -> wip -> fabric
+        with self.assertRaises(BOMCycleError):
+            rollup_costs([self.fg_bom.pk])
+
+
+class ResolveBOMsTests(TestCase):
+    """services.resolve_boms picks the BOM whose effective window contains the date."""
+
+    def setUp(self):
+        plant = Plant.objects.create(code="EFF", name="Effective plant")
+        product = Product.objects.create(code="EFF-FG", name="FG", product_group=ProductGroup.FINISHED_GOOD)
+        self.product_plant, _created = ProductPlant.objects.get_or_create(product=product, plant=plant)
+        self.historical = BOMHeader.objects.create(
+            product_plant=self.product_plant, is_active=False,
+            effective_from=datetime.date(2024, 1, 1), effective_to=datetime.date(2024, 12, 31),
+        )
+        self.current = BOMHeader.objects.create(product_plant=self.product_plant, is_active=True)
+
+    def test_dated_window_beats_undated_active_bom(self):
+        resolved = resolve_boms([self.product_plant.pk], datetime.date(2024, 6, 1))
+        self.assertEqual(resolved[self.product_plant.pk], self.historical)
+
+    def test_undated_bom_outside_dated_windows(self):
+        resolved = resolve_boms([self.product_plant.pk], datetime.date(2025, 6, 1))
+        self.assertEqual(resolved[self.product_plant.pk], self.current)
+
+    def test_product_plant_without_valid_bom_is_omitted(self):
+        self.current.delete()
+        self.assertEqual(resolve_boms([self.product_plant.pk], datetime.date(2023, 1, 1)), {})
+
+
+class BulkImportTests(TestCase):
+    """BulkImportMixin resources skip unchanged rows, reject keys repeated in a file, and fold case-insensitive keys."""
+
+    def import_rows(self, resource, headers, rows):
+        dataset = tablib.Dataset(*rows, headers=headers)
+        return resource.import_data(dataset, dry_run=False)
+
+    def test_reimport_of_unchanged_rows_is_skipped(self):
+        headers = ["code", "name", "product_group", "standard_cost"]
+        rows = [("BLK-1", "One", "RM", "1.00"), ("BLK-2", "Two", "RM", "2.00")]
+        self.assertEqual(self.import_rows(ProductResource(), headers, rows).totals["new"], 2)
+        result = self.import_rows(ProductResource(), headers, rows[:1] + [("BLK-2", "Two v2", "RM", "2.00")])
+        self.assertEqual((result.totals["skip"], result.totals["update"]), (1, 1))
+        self.assertEqual(Product.objects.get(code="BLK-2").name, "Two v2")
+
+    def test_key_repeated_in_file_is_a_row_error(self):
+        result = self.import_rows(ProductResource(), ["code", "name", "product_group"], [
+            ("BLK-D", "First", "RM"), ("BLK-D", "Again", "RM"),
+        ])
+        self.assertTrue(result.has_validation_errors())
+        self.assertEqual([row.validation_error is not None for row in result.rows], [False, True])
+        self.assertEqual(Product.objects.get(code="BLK-D").name, "First")
+
+    def test_party_code_matches_case_insensitively(self):
+        Party.objects.create(party_code="ACME", name="Acme")
+        result = self.import_rows(PartyResource(), ["party_code", "name"], [("acme", "Acme Ltd")])
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        self.assertEqual(result.totals["update"], 1)
+        self.assertEqual(list(Party.objects.values_list("party_code", "name")), [("ACME", "Acme Ltd")])
+
+
+class UserPasswordImportTests(TestCase):
+    """UserResource hashes plaintext passwords before the row saves and keeps existing hashes as they are."""
+
+    def test_plaintext_hashed_and_hashes_kept(self):
+        existing = make_password("kept-secret")
+        dataset = tablib.Dataset(
+            ("plain", "plain-secret"), ("hashed", existing), ("blank", ""), headers=["username", "password"],
+        )
+        result = UserResource().import_data(dataset, dry_run=False)
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        self.assertEqual(dataset["password"], ["plain-secret", existing, ""])  # the caller's dataset is left alone
+        self.assertTrue(User.objects.get(username="plain").check_password("plain-secret"))
+        self.assertEqual(User.objects.get(username="hashed").password, existing)
+        self.assertFalse(User.objects.get(username="blank").has_usable_password())
+
+    def test_hash_detection(self):
+        self.assertTrue(is_password_hash(make_password("x")))
+        for value in ("pbkdf2_sha256$not$a$hash", "md5$$", "plain-secret", "", None):
+            with self.subTest(value=value):
+                self.assertFalse(is_password_hash(value))
+
+
+class ProvisionProductPlantsTests(TestCase):
+    """services.provision_product_plants reports the rows it inserted, not the rows it submitted."""
+
+    def setUp(self):
+        self.plant = Plant.objects.create(code="PRV", name="Provision plant")
+        self.products = [
+            Product.objects.create(code=f"PRV-{n}", name=f"Product {n}", product_group=ProductGroup.RAW_MATERIAL)
+            for n in range(3)
+        ]
+
+    def test_pairs_created_concurrently_are_not_counted(self):
+        insert = services._insert_product_plants
+
+        def someone_else_provisions_first(plant, rows):
+            # a concurrent run inserted one of the pairs after our anti-join
+            ProductPlant.objects.get_or_create(product=self.products[2], plant=plant)
+            return insert(plant, rows)
+
+        with mock.patch("apps.masters.services._insert_product_plants", side_effect=someone_else_provisions_first):
+            summary = provision_product_plants(self.plant)
+        self.assertEqual((summary.scanned, summary.created), (3, 2))
+        self.assertEqual(ProductPlant.objects.filter(plant=self.plant).count(), 3)
+        self.assertEqual(provision_product_plants(self.plant).created, 0)
+
+
+class BOMClosureTests(TestCase):
+    """closure.rebuild_closure keeps the where-used index, including the acyclic part of a BOM cycle."""
+
+    def setUp(self):
+        plant = Plant.objects.create(code="CLO", name="Closure plant")
+        self.fg = make_product_plant(plant, "CLO-FG", ProductGroup.FINISHED_GOOD)
+        self.wip = make_product_plant(plant, "CLO-WIP", ProductGroup.WIP)
+        self.fabric = make_product_plant(plant, "CLO-FAB")
+        make_bom(self.fg, (self.wip, "2"))
+        self.wip_bom = make_bom(self.wip, (self.fabric, "1.5"))
+
+    def where_used(self, product_plant):
+        return {(row.ancestor_id, row.depth, row.quantity) for row in where_used(product_plant.pk)}
+
+    def test_where_used_at_any_depth(self):
+        rebuilt = rebuild_closure()
+        self.assertEqual(rebuilt.cycle_edges, [])
+        self.assertEqual(self.where_used(self.fabric), {(self.wip.pk, 1, Decimal("1.5")), (self.fg.pk, 2, Decimal("3"))})
+        # incremental rebuild of a changed sub-assembly and its ancestors gives the same rows
+        self.assertEqual(rebuild_closure([self.wip.pk]).written, 3)
+        self.assertEqual(self.where_used(self.fabric), {(self.wip.pk, 1, Decimal("1.5")), (self.fg.pk, 2, Decimal("3"))})
+
+    def test_cycle_is_reported_and_the_rest_kept(self):
+        make_bom(self.fabric, (self.wip, "1"))  # fabric -> wip -> fabric
+        rebuilt = rebuild_closure()
+        self.assertEqual(len(rebuilt.cycle_edges), 1)
+        self.assertIn(rebuilt.cycle_edges[0], {(self.wip.pk, self.fabric.pk), (self.fabric.pk, self.wip.pk)})
+        self.assertIn(self.fg.pk, {ancestor for ancestor, _depth, _qty in self.where_used(self.fabric)})
+
+
+class DeltaFeedTests(TestCase):
+    """delta.delta pages through the change log with opaque cursors; one entry per row, deletes keep the natural key."""
+
+    def setUp(self):
+        self.plant = Plant.objects.create(code="DLT", name="Delta plant")
+        self.fabric = make_product_plant(self.plant, "DLT-FAB")
+
+    def drain(self, key, cursor=None, limit=1):
+        changes, deletes = [], []
+        while True:
+            page = delta(key, cursor, limit=limit)
+            changes += page.changes
+            deletes += page.deletes
+            cursor = page.cursor
+            if not page.has_more:
+                return changes, deletes, cursor
+
+    def test_update_after_cursor_is_delivered_once(self):
+        changes, _deletes, cursor = self.drain("plant")
+        self.assertIn("DLT", [c["data"]["code"] for c in changes])
+        self.assertEqual(self.drain("plant", cursor), ([], [], cursor))
+
+        self.plant.name = "Renamed"
+        self.plant.save()
+        self.plant.save()
+        self.assertEqual(DeltaChange.objects.filter(model="plant", object_id=self.plant.pk).count(), 1)
+        changes, _deletes, cursor = self.drain("plant", cursor)
+        self.assertEqual([c["data"]["name"] for c in changes], ["Renamed"])
+        self.assertEqual(self.drain("plant", cursor)[:2], ([], []))
+
+    def test_delete_carries_natural_key(self):
+        _changes, _deletes, cursor = self.drain("productplant")
+        pk = self.fabric.pk
+        self.fabric.delete()
+        changes, deletes, _cursor = self.drain("productplant", cursor)
+        self.assertEqual(changes, [])
+        self.assertEqual(
+            [(d["id"], d["product_code"], d["plant_code"]) for d in deletes], [(pk, "DLT-FAB", "DLT")],
+        )
+
+    def test_cursor_of_another_model_is_rejected(self):
+        cursor = delta("plant").cursor
+        with self.assertRaises(InvalidCursor):
+            delta("party", cursor)
+
+
+class KeysetPaginationTests(TestCase):
+    """The production line changelist seeks on (plant_id, code, pk); tampered cursors are lookup errors, not 500s."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("keyset", "keyset@example.com", "pw")
+        plants = [Plant.objects.create(code=f"KS{n}", name=f"Keyset {n}") for n in range(2)]
+        ProductionLine.objects.bulk_create(
+            ProductionLine(plant=plant, code=f"L{n:02d}", name=f"Line {n}") for plant in plants for n in range(15)
+        )
+        cls.expected = list(ProductionLine.objects.order_by("plant_id", "code", "pk").values_list("pk", flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:masters_productionline_changelist")
+
+    def page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_next_and_previous_pages(self):
+        first = self.page()
+        self.assertEqual([line.pk for line in first.result_list], self.expected[:20])
+        self.assertIsNone(first.keyset_prev)
+        second = self.page(after=first.keyset_next)
+        self.assertEqual([line.pk for line in second.result_list], self.expected[20:])
+        self.assertIsNone(second.keyset_next)
+        back = self.page(before=second.keyset_prev)
+        self.assertEqual([line.pk for line in back.result_list], self.expected[:20])
+
+    def test_tampered_cursor_is_rejected(self):
+        line = ProductionLine.objects.first()
+        for values in (["x", "L00", line.pk], [{"a": 1}, "L00", line.pk], [line.plant_id, None, line.pk], [1]):
+            with self.subTest(values=values):
+                response = self.client.get(self.url, {"after": encode_cursor(values)})
+                # the admin answers IncorrectLookupParameters with a redirect to ?e=1
+                self.assertRedirects(response, f"{self.url}?e=1", fetch_redirect_response=False)
+        response = self.client.get(self.url, {"after": "not base64!"})
+        self.assertEqual(response.status_code, 302)
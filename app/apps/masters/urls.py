@@ -1,14 +1,11 @@
-from django.contrib import admin
-from django.urls import path, include
-#from django.views.generic import RedirectView
-from django.shortcuts import redirect
+# apps/masters/urls.py
+from django.urls import path
 
+from . import views
+
+app_name = "masters"
 
 urlpatterns = [
-    # redirect root to admin
-    #path('', RedirectView.as_view(url='/admin/', permanent=False)),
-    path('home/', admin.site.urls),
-    path("", lambda req: redirect("/home/")),   # simple redirect    
-    # add other app urls below as you expand the project
-    # path('app1/', include('app1.urls')),
+    path("delta/<str:model>/", views.delta_export, name="delta_export"),
+    path("search/<str:model>/", views.live_search, name="live_search"),
 ]
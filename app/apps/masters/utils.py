@@ -0,0 +1,100 @@
+# apps/masters/utils.py
+import base64
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import transaction
+
+# Below this many passwords a process pool costs more than it saves.
+MIN_PARALLEL_PASSWORDS = 16
+
+# base64 / hex / bcrypt alphabets used by the digest part of the built-in hashers
+HASH_CHARS = re.compile(r"[A-Za-z0-9+/=.]+")
+
+
+def defer_on_commit(key, ids, func, using=None):
+    """
+    Collect `ids` under `key` and call func(ids) once after the current
+    transaction commits (immediately in autocommit mode).
+
+    Repeated calls in the same transaction only extend the pending set, so a
+    BOM save with 40 inline items triggers one batched pass instead of 40.
+    """
+    conn = transaction.get_connection(using)
+    pending = conn.__dict__.setdefault("_masters_pending_on_commit", {})
+    entry = pending.get(key)
+    # the callback may have been discarded by a rollback; start over in that case
+    if entry is not None and any(cb[1] is entry[1] for cb in conn.run_on_commit):
+        entry[0].update(ids)
+        return
+
+    collected = set(ids)
+
+    def flush():
+        if pending.get(key) is entry_ref:
+            del pending[key]
+        if collected:
+            func(collected)
+
+    entry_ref = (collected, flush)
+    pending[key] = entry_ref
+    transaction.on_commit(flush, using=using)
+
+
+def is_password_hash(value) -> bool:
+    """
+    True if `value` is encoded by one of settings.PASSWORD_HASHERS: its prefix
+    names a configured hasher and the rest decodes to that hasher's fields
+    (numeric work factors, a non-empty salt, a digest of the expected size).
+    A plaintext that merely starts with "pbkdf2_sha256$" is not a hash.
+    """
+    if not value or not isinstance(value, str):
+        return False
+    try:
+        hasher = identify_hasher(value)
+        decoded = hasher.decode(value)
+    except (ValueError, TypeError, IndexError, AssertionError):
+        # unknown prefix, missing or non-numeric fields, hasher library not installed
+        return False
+    digest = decoded.get("hash")
+    if not digest or not HASH_CHARS.fullmatch(digest) or decoded.get("salt") == "":
+        return False
+    if hasattr(hasher, "digest"):
+        # PBKDF2 family: base64 of exactly one digest
+        try:
+            raw = base64.b64decode(digest, validate=True)
+        except ValueError:
+            return False
+        return len(raw) == hasher.digest().digest_size
+    return True
+
+
+def set_user_password(user, value):
+    """set_password() for plaintext; a value that is already a hash (is_password_hash) is stored as-is."""
+    if is_password_hash(value):
+        user.password = value
+    else:
+        user.set_password(value)
+
+
+def hash_passwords(values, workers=None):
+    """
+    make_password() for every non-empty value that is not already a hash
+    (is_password_hash), in a process pool when there are enough of them
+    (hashing is CPU-bound, so threads would not help).
+    """
+    values = list(values)
+    todo = [i for i, v in enumerate(values) if v and not is_password_hash(v)]
+    workers = workers or getattr(settings, "MASTERS_PASSWORD_HASH_WORKERS", None) or os.cpu_count() or 1
+    if workers <= 1 or len(todo) < MIN_PARALLEL_PASSWORDS:
+        hashed = [make_password(values[i]) for i in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashed = list(pool.map(make_password, [values[i] for i in todo], chunksize=max(1, len(todo) // (workers * 4))))
+    result = list(values)
+    for i, h in zip(todo, hashed):
+        result[i] = h
+    return result
@@ -0,0 +1,243 @@
+# apps/masters/validation.py
+"""
+Set-based validation of master-data import files.
+
+A dry-run import runs the whole per-row resource pipeline (instance lookups,
+FK queries, saves) inside a rolled-back transaction. validate_file() checks
+the same things a real import would trip over in one streaming pass plus a
+few queries per file:
+
+- required columns are present and key values are not blank;
+- keys are unique within the file (case-insensitively where the import
+  matches them that way);
+- FK codes exist, one IN query per FK column and batch;
+- values coerce with the resource's own widgets and fit the model fields.
+
+Errors use the ImportJob.errors shape: [{"row": n, "errors": [...]}], with n
+the 1-based data row of the file. Only the first `max_errors` rows with
+errors keep their messages; error_rows still counts them all.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.validators import validate_email
+from django.db.models.functions import Upper
+from import_export.widgets import ForeignKeyWidget
+
+from .models import Plant, Product
+from .readers import iter_rows
+
+# a column name, or alternatives accepted for the same column (first match wins)
+Column = Union[str, Tuple[str, ...]]
+
+DEFAULT_MAX_ERRORS = 1000
+LOOKUP_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class ForeignKeyCheck:
+    column: Column
+    model: type
+    field: str = "code"
+    case_insensitive: bool = False
+
+
+@dataclass(frozen=True)
+class ValidationSpec:
+    key_columns: Tuple[Column, ...]
+    foreign_keys: Tuple[ForeignKeyCheck, ...] = ()
+    case_insensitive_keys: bool = False
+    email_columns: Tuple[str, ...] = ()
+
+
+# keyed like jobs.IMPORT_RESOURCES; lookups mirror how each resource resolves codes
+VALIDATION_SPECS: Dict[str, ValidationSpec] = {
+    "plant": ValidationSpec(("code",)),
+    "productionline": ValidationSpec(("plant_code", "code"), (ForeignKeyCheck("plant_code", Plant),)),
+    # production lines missing for a known plant are created by the import, so only the plant is checked
+    "worker": ValidationSpec(
+        (("plant_code", "plant"), "code"),
+        (ForeignKeyCheck(("plant_code", "plant"), Plant, case_insensitive=True),),
+        case_insensitive_keys=True,
+    ),
+    "party": ValidationSpec(("party_code",), case_insensitive_keys=True, email_columns=("email",)),
+    "product": ValidationSpec(("code",)),
+    "productplant": ValidationSpec(
+        ("product_code", "plant_code"),
+        (ForeignKeyCheck("product_code", Product), ForeignKeyCheck("plant_code", Plant)),
+    ),
+    "user": ValidationSpec(("username",), case_insensitive_keys=True, email_columns=("email",)),
+    "userprofile": ValidationSpec(
+        ("username",),
+        (ForeignKeyCheck("plant_code", Plant, case_insensitive=True),),
+        case_insensitive_keys=True,
+        email_columns=("email",),
+    ),
+}
+
+
+@dataclass
+class ValidationReport:
+    total_rows: int = 0
+    error_rows: int = 0
+    missing_columns: List[str] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.missing_columns and not self.error_rows
+
+    @property
+    def truncated(self) -> int:
+        """Rows with errors that are counted but not listed in `errors`."""
+        return self.error_rows - len(self.errors)
+
+
+def _index(headers: Sequence[str], column: Column) -> Optional[int]:
+    lowered = [h.lower() for h in headers]
+    for name in (column,) if isinstance(column, str) else column:
+        if name in lowered:
+            return lowered.index(name)
+    return None
+
+
+def _label(column: Column) -> str:
+    return column if isinstance(column, str) else column[0]
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _coercion_checks(resource, model, headers):
+    """(column index, column name, resource field, max_length) for every plain (non-FK) field in the file."""
+    checks = []
+    for res_field in resource.get_import_fields():
+        idx = _index(headers, res_field.column_name.lower())
+        if idx is None or not res_field.attribute or isinstance(res_field.widget, ForeignKeyWidget):
+            continue
+        try:
+            model_field = model._meta.get_field(res_field.attribute)
+        except FieldDoesNotExist:
+            continue
+        if model_field.is_relation:
+            continue
+        checks.append((idx, res_field.column_name, res_field, getattr(model_field, "max_length", None)))
+    return checks
+
+
+def _existing_codes(check: ForeignKeyCheck, codes) -> set:
+    codes = list(codes)
+    found = set()
+    for i in range(0, len(codes), LOOKUP_BATCH_SIZE):
+        chunk = codes[i:i + LOOKUP_BATCH_SIZE]
+        if check.case_insensitive:
+            qs = check.model.objects.annotate(_code=Upper(check.field)).filter(_code__in=chunk).values_list("_code", flat=True)
+        else:
+            qs = check.model.objects.filter(**{f"{check.field}__in": chunk}).values_list(check.field, flat=True)
+        found.update(qs)
+    return found
+
+
+def validate_rows(resource_key: str, headers: Optional[List[str]], rows, max_errors: int = DEFAULT_MAX_ERRORS) -> ValidationReport:
+    """Validate (headers, rows) as produced by readers.iter_rows()."""
+    from .jobs import IMPORT_RESOURCES
+
+    spec = VALIDATION_SPECS[resource_key]
+    resource = IMPORT_RESOURCES[resource_key]()
+    model = resource._meta.model
+    report = ValidationReport()
+    if headers is None:
+        report.missing_columns = [_label(c) for c in spec.key_columns]
+        return report
+    headers = [h.lower() for h in headers]
+
+    key_idx = [_index(headers, c) for c in spec.key_columns]
+    report.missing_columns = [_label(c) for c, i in zip(spec.key_columns, key_idx) if i is None]
+    if report.missing_columns:
+        return report
+
+    # FK columns outside the key are optional; rows without a value are not checked
+    fk_idx = [(check, _index(headers, check.column)) for check in spec.foreign_keys]
+
+    email_idx = [(name, _index(headers, name)) for name in spec.email_columns]
+    coercions = _coercion_checks(resource, model, headers)
+    # messages of the first max_errors failing rows; failed[n - 1] flags every failing row n
+    row_errors: Dict[int, List[str]] = {}
+    failed = bytearray()
+    seen_keys: Dict[tuple, int] = {}
+    fk_rows: List[Dict[str, List[int]]] = [defaultdict(list) for _check in spec.foreign_keys]
+
+    for number, row in enumerate(rows, 1):
+        report.total_rows = number
+        errors = []
+        key = []
+        for column, i in zip(spec.key_columns, key_idx):
+            value = _text(row[i])
+            if not value:
+                errors.append(f"{_label(column)}: value is required.")
+            key.append(value.upper() if spec.case_insensitive_keys else value)
+        key = tuple(key)
+        if all(key):
+            if key in seen_keys:
+                errors.append(f"Duplicate key {', '.join(key)} (already in row {seen_keys[key]}).")
+            else:
+                seen_keys[key] = number
+
+        for pos, (check, i) in enumerate(fk_idx):
+            value = _text(row[i]) if i is not None else ""
+            if value:
+                fk_rows[pos][value.upper() if check.case_insensitive else value].append(number)
+
+        row_dict = dict(zip(headers, row))
+        for i, column, res_field, max_length in coercions:
+            try:
+                value = res_field.clean(row_dict)
+            except ValidationError as exc:
+                errors.append(f"{column}: {'; '.join(exc.messages)}")
+                continue
+            except (ValueError, ArithmeticError) as exc:
+                # decimal errors stringify as "[<class 'decimal.ConversionSyntax'>]"
+                detail = str(exc) if isinstance(exc, ValueError) and str(exc) else f"invalid value '{_text(row[i])}'"
+                errors.append(f"{column}: {detail}")
+                continue
+            if max_length and isinstance(value, str) and len(value) > max_length:
+                errors.append(f"{column}: at most {max_length} characters (got {len(value)}).")
+
+        for name, i in email_idx:
+            if i is not None and _text(row[i]):
+                try:
+                    validate_email(_text(row[i]))
+                except ValidationError:
+                    errors.append(f"{name}: enter a valid email address.")
+
+        failed.append(bool(errors))
+        if errors:
+            report.error_rows += 1
+            if len(row_errors) < max_errors:
+                row_errors[number] = errors
+
+    for (check, i), codes in zip(fk_idx, fk_rows):
+        if not codes:
+            continue
+        verbose = check.model._meta.verbose_name
+        for code in set(codes) - _existing_codes(check, codes):
+            for number in codes[code]:
+                if not failed[number - 1]:
+                    failed[number - 1] = 1
+                    report.error_rows += 1
+                if number in row_errors or len(row_errors) < max_errors:
+                    row_errors.setdefault(number, []).append(f"{_label(check.column)}: {verbose} '{code}' not found.")
+
+    report.errors = [{"row": n, "errors": row_errors[n]} for n in sorted(row_errors)]
+    return report
+
+
+def validate_file(resource_key: str, fh, name: str, max_errors: int = DEFAULT_MAX_ERRORS, xlsx: Optional[bool] = None) -> ValidationReport:
+    """Validate an import file (binary file object; CSV or XLSX, see readers.iter_rows)."""
+    headers, rows = iter_rows(fh, name, xlsx=xlsx)
+    return validate_rows(resource_key, headers, rows, max_errors=max_errors)
@@ -0,0 +1,45 @@
+# apps/masters/views.py
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import delta, search
+
+
+@require_GET
+@staff_member_required
+def delta_export(request, model):
+    """
+    GET /masters/delta/<model>/?cursor=...&limit=...
+    Rows changed (and deleted) since `cursor`; see delta.delta().
+    """
+    if model not in delta.DELTA_MODELS:
+        raise Http404(f"No delta export for '{model}'.")
+    try:
+        limit = int(request.GET.get("limit", delta.DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer."}, status=400)
+    try:
+        page = delta.delta(model, request.GET.get("cursor"), limit=limit)
+    except delta.InvalidCursor as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return JsonResponse(page.as_dict())
+
+
+@require_GET
+@staff_member_required
+def live_search(request, model):
+    """
+    GET /masters/search/<model>/?q=...&limit=...
+    Rows matching q for the changelist search box; see search.search().
+    """
+    spec = search.SEARCH_MODELS.get(model)
+    if spec is None:
+        raise Http404(f"No live search for '{model}'.")
+    if not request.user.has_perm(f"{spec.model._meta.app_label}.view_{spec.model._meta.model_name}"):
+        return JsonResponse({"error": "Permission denied."}, status=403)
+    try:
+        limit = int(request.GET.get("limit", search.DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer."}, status=400)
+    return JsonResponse({"results": search.search(model, request.GET.get("q", ""), limit=limit)})
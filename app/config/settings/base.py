@@ -77,3 +77,21 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = str(BASE_DIR / 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Masters: rows per bulk_create/bulk_update chunk and per prefetch query in bulk imports
+MASTERS_IMPORT_BATCH_SIZE = int(os.getenv("MASTERS_IMPORT_BATCH_SIZE", "1000"))
+# Masters: rows fetched per database round trip by the streaming admin export
+MASTERS_EXPORT_CHUNK_SIZE = int(os.getenv("MASTERS_EXPORT_CHUNK_SIZE", "2000"))
+# Masters: largest admin export offered as XLSX (built in full before sending); larger ones use CSV
+MASTERS_EXPORT_XLSX_MAX_ROWS = int(os.getenv("MASTERS_EXPORT_XLSX_MAX_ROWS", "50000"))
+# Masters: processes used to pre-hash passwords in user imports (default: CPU count)
+MASTERS_PASSWORD_HASH_WORKERS = int(os.getenv("MASTERS_PASSWORD_HASH_WORKERS", "0")) or None
+# Masters: a running import job without a heartbeat for this long is resumed by another worker
+MASTERS_IMPORT_JOB_STALE_SECONDS = int(os.getenv("MASTERS_IMPORT_JOB_STALE_SECONDS", "300"))
+# Masters: unfiltered admin lists with at least this many rows show an estimated count ("~N")
+MASTERS_ESTIMATED_COUNT_THRESHOLD = int(os.getenv("MASTERS_ESTIMATED_COUNT_THRESHOLD", "10000"))
+# Masters: seconds an exact table count is cached where the database has no row estimate (non-PostgreSQL)
+MASTERS_COUNT_CACHE_SECONDS = int(os.getenv("MASTERS_COUNT_CACHE_SECONDS", "300"))
+# Masters: seconds BOM component autocomplete results are cached per plant and search prefix
+# (saves, imports and provisioning invalidate them; this only bounds writes that bypass those)
+MASTERS_COMPONENT_CACHE_SECONDS = int(os.getenv("MASTERS_COMPONENT_CACHE_SECONDS", "60"))
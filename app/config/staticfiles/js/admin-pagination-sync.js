@@ -4,6 +4,8 @@
 
   const BTN_ID = "admin-toggle-paginate";
   const SHOWALL_LINK_SELECTOR = "a.showall";
+  // keyset changelists (apps/masters/pagination.py) mark their paginator with data-keyset
+  const KEYSET_SELECTOR = "p.paginator[data-keyset]";
 
   function params() {
     return new URLSearchParams(window.location.search);
@@ -23,7 +25,7 @@
 
   function updateButtonState(btn) {
     if (!btn) return;
-    if (hasAll()) {
+    if (hasAll() && !keysetPaginator()) {
       btn.textContent = "Paginate";
       btn.setAttribute("data-all", "1");
       btn.title = "Re-enable pagination";
@@ -34,8 +36,67 @@
     }
   }
 
+  // ---- Keyset mode: capped, incremental "show all" ----
+  // Follows the "next" cursor page by page and appends each page's rows to the
+  // table until there are no more pages or data-show-all-max rows are shown.
+  function keysetPaginator(doc) {
+    return (doc || document).querySelector(KEYSET_SELECTOR);
+  }
+
+  let keysetLoading = false;
+
+  async function keysetShowAll(btn) {
+    const paginators = Array.from(document.querySelectorAll(KEYSET_SELECTOR));
+    const tbody = document.querySelector("#result_list tbody");
+    if (keysetLoading || !paginators.length || !tbody) return;
+    const max = parseInt(paginators[0].getAttribute("data-show-all-max"), 10) || 0;
+    let next = paginators[0].getAttribute("data-next");
+    let shown = tbody.rows.length;
+    keysetLoading = true;
+    try {
+      while (next && shown < max) {
+        if (btn) btn.textContent = "Loading… " + shown;
+        const resp = await fetch(next, { credentials: "same-origin", headers: { "X-Requested-With": "XMLHttpRequest" } });
+        if (!resp.ok) break;
+        const doc = new DOMParser().parseFromString(await resp.text(), "text/html");
+        const rows = Array.from(doc.querySelectorAll("#result_list tbody tr")).slice(0, max - shown);
+        rows.forEach(row => tbody.appendChild(document.importNode(row, true)));
+        shown += rows.length;
+        const more = keysetPaginator(doc);
+        next = more ? more.getAttribute("data-next") : "";
+      }
+    } finally {
+      keysetLoading = false;
+    }
+    paginators.forEach(p => {
+      p.querySelectorAll("a.keyset-next, a.showall").forEach(a => a.remove());
+      p.setAttribute("data-next", next || "");
+      if (next) {
+        const note = document.createElement("span");
+        note.className = "keyset-capped";
+        note.textContent = " (showing the first " + shown + "; filter to narrow the list)";
+        p.appendChild(note);
+      }
+    });
+    if (btn) {
+      btn.textContent = "Paginate";
+      btn.setAttribute("data-all", "1");
+      btn.title = "Back to the first page";
+    }
+  }
+
   function onButtonClick(e) {
     const btn = e.currentTarget;
+    if (keysetPaginator()) {
+      if (btn.getAttribute("data-all") === "1") {
+        const url = new URL(window.location.href);
+        ["all", "p", "after", "before"].forEach(k => url.searchParams.delete(k));
+        window.location.href = url.toString();
+      } else {
+        keysetShowAll(btn);
+      }
+      return;
+    }
     const curAll = btn.getAttribute("data-all") === "1";
     // navigate to toggled URL
     const target = curAll ? buildUrlWithAll(null) : buildUrlWithAll(1);
@@ -43,6 +104,11 @@
   }
 
   function onShowAllLinkClick(e) {
+    if (e.currentTarget.hasAttribute("data-keyset-show-all")) {
+      e.preventDefault();
+      keysetShowAll(document.getElementById(BTN_ID));
+      return;
+    }
     // The bottom link is about to navigate; update toolbar state so it matches intended navigation.
     // Determine whether the clicked link will add or remove the 'all' param.
     try {
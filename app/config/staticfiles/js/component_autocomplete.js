@@ -0,0 +1,17 @@
+// component_autocomplete.js
+// BOM item component picker (admin.ComponentAutocompleteSelect): add the BOM's
+// currently selected product_plant to every autocomplete request, so the
+// server only offers components of that plant, on the add page as well.
+(function ($) {
+    "use strict";
+
+    const ENDPOINT = "/component-autocomplete/";
+
+    $.ajaxPrefilter(function (options) {
+        if (!options.url || options.url.indexOf(ENDPOINT) === -1) return;
+        const field = document.getElementById("id_product_plant");
+        const params = new URLSearchParams(typeof options.data === "string" ? options.data : "");
+        params.set("product_plant", field ? field.value : "");
+        options.data = params.toString();
+    });
+})(django.jQuery);
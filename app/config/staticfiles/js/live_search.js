@@ -1,26 +1,125 @@
+// live_search.js
+// Server-side live search for the masters changelists: while the user types
+// in the top search box, query /masters/search/<model>/ (apps/masters/search.py)
+// and list the matches from the whole table under it. Enter still submits the
+// normal changelist search.
 document.addEventListener("DOMContentLoaded", function () {
-    const searchInput = document.querySelector('#searchbar');  // main top search box
-    const resultsTable = document.querySelector("#result_list");
+    "use strict";
 
-    console.log("🔎 Looking for searchbar:", searchInput);
-    console.log("🔎 Looking for result_list:", resultsTable);
+    const DEBOUNCE_MS = 200;
+    const LIMIT = 20;
+    const MODELS = ["plant", "product", "productplant", "party", "worker"];
 
-    if (!searchInput || !resultsTable) {
-        console.log("⚠️ Live search not active: element missing");
-        return;
-    }
+    const searchInput = document.querySelector("#searchbar");  // main top search box
+    const meta = document.querySelector('meta[name="masters-live-search"]');
+    const match = window.location.pathname.match(/\/masters\/([a-z]+)\/$/);
+    if (!searchInput || !meta || !match || MODELS.indexOf(match[1]) === -1) return;
+
+    const endpoint = meta.getAttribute("content").replace("__model__", match[1]);
+    const box = document.createElement("div");
+    box.className = "live-search-results";
+    box.setAttribute("role", "listbox");
+    box.hidden = true;
+    searchInput.parentNode.style.position = "relative";
+    searchInput.parentNode.appendChild(box);
 
-    console.log("✅ Live search attached to searchbar");
+    let timer = null;
+    let controller = null;
 
-    searchInput.addEventListener("keyup", function (event) {
-        if (event.key === "Enter") return; // let default search happen
+    function hide() {
+        box.hidden = true;
+        box.replaceChildren();
+    }
 
-        const term = this.value.toLowerCase();
-        const rows = resultsTable.querySelectorAll("tbody tr");
+    function place() {
+        box.style.left = searchInput.offsetLeft + "px";
+        box.style.top = (searchInput.offsetTop + searchInput.offsetHeight) + "px";
+        box.style.minWidth = searchInput.offsetWidth + "px";
+    }
 
-        rows.forEach(row => {
-            const text = row.innerText.toLowerCase();
-            row.style.display = text.includes(term) ? "" : "none";
+    function render(results) {
+        box.replaceChildren();
+        if (!results.length) {
+            const empty = document.createElement("div");
+            empty.className = "live-search-empty";
+            empty.style.padding = "4px 8px";
+            empty.textContent = "No matches";
+            box.appendChild(empty);
+        }
+        results.forEach(function (item) {
+            const a = document.createElement("a");
+            a.href = item.url;
+            a.setAttribute("role", "option");
+            a.style.display = "block";
+            a.style.padding = "4px 8px";
+            const label = document.createElement("strong");
+            label.textContent = item.label;
+            a.appendChild(label);
+            if (item.detail) {
+                const detail = document.createElement("span");
+                detail.className = "quiet";
+                detail.textContent = " " + item.detail;
+                a.appendChild(detail);
+            }
+            box.appendChild(a);
         });
+        place();
+        box.hidden = false;
+    }
+
+    async function lookup(term) {
+        if (controller) controller.abort();
+        controller = new AbortController();
+        const url = endpoint + "?" + new URLSearchParams({ q: term, limit: LIMIT });
+        try {
+            const resp = await fetch(url, {
+                credentials: "same-origin",
+                headers: { "Accept": "application/json" },
+                signal: controller.signal,
+            });
+            if (!resp.ok) return hide();
+            const data = await resp.json();
+            if (searchInput.value.trim() === term) render(data.results || []);
+        } catch (err) {
+            if (err.name !== "AbortError") hide();
+        }
+    }
+
+    searchInput.setAttribute("autocomplete", "off");
+    searchInput.addEventListener("input", function () {
+        const term = this.value.trim();
+        clearTimeout(timer);
+        if (!term) {
+            if (controller) controller.abort();
+            return hide();
+        }
+        timer = setTimeout(function () { lookup(term); }, DEBOUNCE_MS);
+    });
+
+    searchInput.addEventListener("keydown", function (event) {
+        if (event.key === "Escape") hide();
+        const first = box.hidden ? null : box.querySelector("a");
+        if (event.key === "ArrowDown" && first) {
+            event.preventDefault();
+            first.focus();
+        }
+    });
+
+    box.addEventListener("keydown", function (event) {
+        const current = document.activeElement;
+        if (event.key === "ArrowDown" && current.nextElementSibling) {
+            event.preventDefault();
+            current.nextElementSibling.focus();
+        } else if (event.key === "ArrowUp") {
+            event.preventDefault();
+            (current.previousElementSibling || searchInput).focus();
+        } else if (event.key === "Escape") {
+            hide();
+            searchInput.focus();
+        }
+    });
+
+    document.addEventListener("click", function (event) {
+        if (event.target !== searchInput && !box.contains(event.target)) hide();
     });
 });